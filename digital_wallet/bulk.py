@@ -0,0 +1,218 @@
+import csv
+import json
+
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import column, literal, table, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import catalog
+from . import config
+from .models.db_models import DBItem
+from .models.item import CreateItem
+
+
+settings = config.get_settings()
+
+MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+COLUMNS = ("name", "description", "price", "stock", "tax", "sku")
+UPDATED_COLUMNS = ("name", "description", "price", "stock", "tax")
+
+
+class RowError(ValueError):
+    pass
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    """Numbered lines of a streamed body, holding at most one line and one
+    network chunk in memory."""
+    buffer = b""
+    number = 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line.decode("utf-8", errors="replace").rstrip("\r")
+        if len(buffer) > settings.BULK_IMPORT_MAX_LINE_BYTES:
+            raise RowError(f"line {number + 1} is longer than the limit")
+
+    if buffer:
+        yield number + 1, buffer.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def iter_rows(
+    stream: AsyncIterator[bytes], format: str
+) -> AsyncIterator[tuple[int, dict | RowError]]:
+    header = None
+    async for number, line in iter_lines(stream):
+        if not line.strip():
+            continue
+
+        if format == "ndjson":
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, RowError(f"invalid JSON: {exc}")
+                continue
+            if not isinstance(row, dict):
+                yield number, RowError("expected a JSON object")
+                continue
+            yield number, row
+            continue
+
+        # quoted values spanning lines are not supported
+        [values] = csv.reader([line])
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield number, RowError(f"expected {len(header)} values, got {len(values)}")
+            continue
+        # empty cells fall back to the item defaults
+        yield number, {name: value for name, value in zip(header, values) if value}
+
+
+def validate_row(row: dict) -> dict:
+    item = CreateItem.model_validate(row)
+    return item.model_dump(include=set(COLUMNS))
+
+
+def get_errors(exc: ValidationError) -> list[str]:
+    return [
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    ]
+
+
+def get_upsert(session: AsyncSession):
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(DBItem)
+    return statement.on_conflict_do_update(
+        index_elements=["merchant_id", "sku"],
+        set_={column: statement.excluded[column] for column in UPDATED_COLUMNS},
+    )
+
+
+async def copy_rows(session: AsyncSession, rows: list[dict]):
+    """COPY ``rows`` into a staging table and upsert them from there with a
+    single INSERT ... SELECT; Postgres through asyncpg only."""
+    columns = list(rows[0])
+    conn = await session.connection()
+    await conn.execute(
+        text(
+            "CREATE TEMP TABLE IF NOT EXISTS items_import ("
+            "name varchar, description varchar, price float8, stock integer, "
+            "tax float8, sku varchar, merchant_id integer, user_id integer"
+            ") ON COMMIT DELETE ROWS"
+        )
+    )
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "items_import",
+        records=[tuple(row[column] for column in columns) for row in rows],
+        columns=columns,
+    )
+
+    staging = table("items_import", *[column(name) for name in columns])
+    statement = postgresql.insert(DBItem).from_select(
+        columns + ["units_sold", "revenue"],
+        select(*staging.c, literal(0), literal(0.0)),
+    )
+    await conn.execute(
+        statement.on_conflict_do_update(
+            index_elements=["merchant_id", "sku"],
+            set_={name: statement.excluded[name] for name in UPDATED_COLUMNS},
+        )
+    )
+
+
+async def write_chunk(
+    session: AsyncSession, merchant_id: int, user_id: int, rows: list[dict]
+) -> None:
+    """Upsert one chunk of validated rows and commit."""
+    # a SKU repeated within the chunk keeps its last row, as it would if the
+    # rows were written one by one
+    by_sku = {}
+    unkeyed = []
+    for row in rows:
+        row.update(merchant_id=merchant_id, user_id=user_id)
+        if row["sku"] is None:
+            unkeyed.append(row)
+        else:
+            by_sku[row["sku"]] = row
+    rows = unkeyed + list(by_sku.values())
+
+    updated_ids = []
+    if by_sku:
+        result = await session.exec(
+            select(DBItem.id).where(
+                DBItem.merchant_id == merchant_id, DBItem.sku.in_(list(by_sku))
+            )
+        )
+        updated_ids = list(result.all())
+
+    if session.bind.dialect.driver == "asyncpg":
+        await copy_rows(session, rows)
+    else:
+        await session.execute(get_upsert(session), rows)
+    await session.commit()
+    # new items are not cached yet; updated ones may be
+    await catalog.invalidate_items(*[(item_id, merchant_id) for item_id in updated_ids])
+
+
+async def import_items(
+    session: AsyncSession,
+    merchant_id: int,
+    user_id: int,
+    stream: AsyncIterator[bytes],
+    format: str,
+) -> dict:
+    """Validate and upsert the rows of ``stream`` chunk by chunk, so memory
+    is bounded by the chunk size whatever the size of the upload. Rows with
+    a SKU update the merchant's item with that SKU.
+    """
+    imported = 0
+    errors = []
+    error_count = 0
+    chunk = []
+
+    def add_error(line: int, messages: list[str]):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < settings.BULK_IMPORT_MAX_ERRORS:
+            errors.append(dict(line=line, errors=messages))
+
+    try:
+        async for line, row in iter_rows(stream, format):
+            if isinstance(row, RowError):
+                add_error(line, [str(row)])
+                continue
+            try:
+                chunk.append(validate_row(row))
+            except ValidationError as exc:
+                add_error(line, get_errors(exc))
+                continue
+
+            if len(chunk) == settings.BULK_IMPORT_CHUNK_SIZE:
+                await write_chunk(session, merchant_id, user_id, chunk)
+                imported += len(chunk)
+                chunk = []
+    except RowError as exc:
+        # the body cannot be split into lines past this point
+        add_error(0, [str(exc)])
+
+    if chunk:
+        await write_chunk(session, merchant_id, user_id, chunk)
+        imported += len(chunk)
+
+    return dict(imported=imported, error_count=error_count, errors=errors)
@@ -0,0 +1,144 @@
+import time
+import uuid
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class LRUCache:
+    """In-process LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            self.misses += 1
+            return default
+
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        self.data[key] = (value, expires_at)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class MemoryBackend:
+    """Async cache backend kept in this process; every worker has its own."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> bytes | None:
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        self.cache.set(key, value, ttl=ttl)
+
+    def stats(self) -> dict:
+        return dict(
+            backend="memory", size=len(self.cache), evictions=self.cache.evictions
+        )
+
+
+class RedisBackend:
+    """Async cache backend for any client with the ``redis.asyncio`` API,
+    shared by all workers."""
+
+    def __init__(self, client, prefix: str = "digital_wallet:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis.asyncio  # optional dependency
+
+        return cls(redis.asyncio.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float | None = None):
+        px = int(ttl * 1000) if ttl is not None else None
+        await self.client.set(self.prefix + key, value, px=px)
+
+    def stats(self) -> dict:
+        # evictions are counted by the server (INFO stats: evicted_keys)
+        return dict(backend="redis")
+
+
+class ReadThroughCache:
+    """Read-through cache of rendered responses grouped in scopes.
+
+    Every key is stored under its scope's current version, so invalidating a
+    scope only writes a new version: all of its keys become unreachable at
+    once, and a reader that loaded from the database before the change can
+    only store its result under the old version.
+    """
+
+    def __init__(self, backend, ttl: float | None = None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get_version(self, scope: str) -> str:
+        version = await self.backend.get(f"{scope}:version")
+        if version is None:
+            # never fall back to a fixed version an older entry could match
+            version = uuid.uuid4().hex.encode()
+            await self.backend.set(f"{scope}:version", version, ttl=self.ttl)
+
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def get_or_load(
+        self, scope: str, key: str, load: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        cache_key = f"{scope}:{await self.get_version(scope)}:{key}"
+        value = await self.backend.get(cache_key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await load()
+        await self.backend.set(cache_key, value, ttl=self.ttl)
+        return value
+
+    async def invalidate(self, *scopes: str):
+        for scope in scopes:
+            await self.backend.set(
+                f"{scope}:version", uuid.uuid4().hex.encode(), ttl=self.ttl
+            )
+
+    def stats(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, **self.backend.stats())
@@ -0,0 +1,70 @@
+from typing import Iterable
+
+from fastapi import Response
+
+from . import cache
+from . import config
+from .models.transaction import Transaction
+
+
+settings = config.get_settings()
+
+
+def get_backend(settings):
+    if settings.CATALOG_CACHE_URL:
+        return cache.RedisBackend.from_url(settings.CATALOG_CACHE_URL)
+
+    return cache.MemoryBackend(maxsize=settings.CATALOG_CACHE_SIZE)
+
+
+catalog_cache = cache.ReadThroughCache(
+    get_backend(settings), ttl=settings.CATALOG_CACHE_TTL_SECONDS
+)
+
+
+def item_scope(item_id: int) -> str:
+    return f"item:{item_id}"
+
+
+def merchant_scope(merchant_id: int) -> str:
+    return f"merchant:{merchant_id}"
+
+
+def merchant_items_scope(merchant_id: int) -> str:
+    return f"merchant_items:{merchant_id}"
+
+
+async def get_response(scope: str, key: str, load) -> Response:
+    """Cached JSON body for ``key`` in ``scope``, rendered by ``load()`` on a
+    miss; HTTP errors raised by ``load`` are not cached."""
+    body = await catalog_cache.get_or_load(scope, key, load)
+    return Response(body, media_type="application/json")
+
+
+async def invalidate_items(*items: tuple[int, int | None]):
+    """Drop cached reads of ``(item_id, merchant_id)`` pairs, including the
+    merchant item pages they are listed on."""
+    scopes = {item_scope(item_id) for item_id, _ in items}
+    scopes |= {
+        merchant_items_scope(merchant_id)
+        for _, merchant_id in items
+        if merchant_id is not None
+    }
+    await catalog_cache.invalidate(*sorted(scopes))
+
+
+async def invalidate_stock(transactions: list[Transaction]):
+    await invalidate_items(
+        *[
+            (transaction.item_id, transaction.merchant_id)
+            for transaction in transactions
+        ]
+    )
+
+
+async def invalidate_merchant(merchant_id: int, item_ids: Iterable[int] = ()):
+    await catalog_cache.invalidate(
+        merchant_scope(merchant_id),
+        merchant_items_scope(merchant_id),
+        *[item_scope(item_id) for item_id in item_ids],
+    )
@@ -7,6 +7,60 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
 
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int | None = None  # defaults to the CPU count
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+
+    SQLDB_POOL_SIZE: int = 10
+    SQLDB_MAX_OVERFLOW: int = 20
+    SQLDB_POOL_TIMEOUT: float = 30  # seconds to wait for a free connection
+    SQLDB_POOL_RECYCLE: int = 30 * 60  # 30 minutes
+    SQLDB_POOL_PRE_PING: bool = True
+
+    PAGE_COUNT_CACHE_SIZE: int = 10_000
+    PAGE_COUNT_CACHE_TTL_SECONDS: int = 30
+
+    EXPORT_BATCH_SIZE: int = 1_000  # rows fetched and written per streamed chunk
+
+    ROLLUP_REBUILD_BATCH_SIZE: int = 10_000  # transactions folded per chunk
+
+    BULK_IMPORT_CHUNK_SIZE: int = 1_000  # rows validated and written together
+    BULK_IMPORT_MAX_ERRORS: int = 1_000  # row errors listed in the response
+    BULK_IMPORT_MAX_LINE_BYTES: int = 64 * 1024
+
+    CATALOG_CACHE_URL: str | None = None  # redis://..., shared by all workers
+    CATALOG_CACHE_SIZE: int = 10_000  # entries per worker without a cache URL
+    CATALOG_CACHE_TTL_SECONDS: int = 60
+    CATALOG_CACHE_CONTROL_MAX_AGE: int = 10  # seconds clients may reuse a catalog read
+
+    PURCHASE_MAX_RETRIES: int = 5
+    PURCHASE_RETRY_DELAY: float = 0.01  # seconds, doubled on every retry
+
+    WALLET_SHARD_COUNT: int = 16  # sub-balances per sharded wallet
+    WALLET_SHARD_FOLD_INTERVAL_SECONDS: float = 5
+
+    LEDGER_SNAPSHOT_INTERVAL_SECONDS: int = 60 * 60  # 1 hour
+    LEDGER_SNAPSHOT_LAG_SECONDS: int = 60  # leave in-flight entries to the next run
+
+    IDEMPOTENCY_KEY_RETENTION_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_SWEEP_INTERVAL_SECONDS: int = 10 * 60  # 10 minutes
+    IDEMPOTENCY_SWEEP_BATCH_SIZE: int = 1_000
+
+    PASSWORD_HASH_EXECUTOR: str = "thread"  # "thread" or "process"
+    PASSWORD_HASH_WORKERS: int | None = None  # defaults to the CPU count
+    PASSWORD_HASH_QUEUE_SIZE: int = 100  # pending jobs before answering 503
+
+    ADMIN_USERNAMES: list[str] = []  # may call the /admin and /status endpoints
+    PROVISION_CHUNK_SIZE: int = 1_000  # users checked, hashed and inserted together
+
+    AUTH_USER_CACHE_SIZE: int = 10_000
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+
+    QUERY_COUNT_HEADER: bool = False  # adds X-Query-Count to every response
+
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment=True, extra="allow"
     )
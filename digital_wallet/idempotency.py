@@ -0,0 +1,183 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+
+from fastapi import HTTPException, Request, Response
+
+from pydantic import BaseModel, TypeAdapter
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import cache
+from . import config
+from . import models
+from .models.db_models import DBIdempotencyKey
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+response_cache = cache.LRUCache(maxsize=settings.IDEMPOTENCY_CACHE_SIZE)
+
+
+def get_retention() -> datetime.timedelta:
+    return datetime.timedelta(hours=settings.IDEMPOTENCY_KEY_RETENTION_HOURS)
+
+
+async def get_fingerprint(request: Request) -> str:
+    body = await request.body()
+    return f"{request.method} {request.url.path} {hashlib.sha256(body).hexdigest()}"
+
+
+async def get_response(
+    session: AsyncSession, user_id: int, key: str, fingerprint: str
+) -> Response | None:
+    """Return the stored response for ``key`` if the request was already
+    handled, or None when it has to be executed."""
+    record = response_cache.get((user_id, key))
+    if record is None:
+        cutoff = datetime.datetime.now() - get_retention()
+        result = await session.exec(
+            select(DBIdempotencyKey).where(
+                DBIdempotencyKey.user_id == user_id,
+                DBIdempotencyKey.key == key,
+                DBIdempotencyKey.created_date >= cutoff,
+            )
+        )
+        db_key = result.one_or_none()
+        if db_key is None:
+            return None
+
+        record = (db_key.fingerprint, db_key.status_code, db_key.response_body)
+        expires_in = db_key.created_date - cutoff
+        response_cache.set((user_id, key), record, ttl=expires_in.total_seconds())
+
+    stored_fingerprint, status_code, body = record
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key has already been used for a different request",
+        )
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def save_response(
+    session: AsyncSession,
+    user_id: int,
+    key: str,
+    fingerprint: str,
+    response_model: type[BaseModel],
+    response: BaseModel,
+    status_code: int = 200,
+):
+    """Store ``response`` in the caller's transaction, so the key is only
+    recorded when the work it protects is committed."""
+    # serialize through the declared model, as FastAPI does, so table models
+    # returned by the operation do not leak their extra columns
+    body = TypeAdapter(response_model).dump_json(response).decode()
+    session.add(
+        DBIdempotencyKey(
+            user_id=user_id,
+            key=key,
+            fingerprint=fingerprint,
+            status_code=status_code,
+            response_body=body,
+        )
+    )
+
+
+async def run(
+    session: AsyncSession,
+    user_id: int,
+    key: str | None,
+    fingerprint: str,
+    response_model: type[BaseModel],
+    operation,
+    *args,
+) -> BaseModel | Response:
+    """Run ``operation(session, *args)`` and commit it at most once per key.
+
+    A replayed key returns the stored response without running the operation
+    again. When a concurrent request with the same key commits first, the
+    unique constraint rejects this one and its response is replayed instead.
+    A key past the retention window is deleted and used again.
+    """
+    if key is not None:
+        response = await get_response(session, user_id, key, fingerprint)
+        if response is not None:
+            return response
+
+    try:
+        result = response_model.model_validate(await operation(session, *args))
+        if key is not None:
+            save_response(session, user_id, key, fingerprint, response_model, result)
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        response = None
+        if key is not None:
+            response = await get_response(session, user_id, key, fingerprint)
+            if response is None and await delete_expired_key(session, user_id, key):
+                # the key had expired but was not swept yet; it is free again
+                return await run(
+                    session, user_id, key, fingerprint, response_model, operation, *args
+                )
+        if response is None:
+            raise
+        return response
+
+    return result
+
+
+async def delete_expired_key(session: AsyncSession, user_id: int, key: str) -> bool:
+    cutoff = datetime.datetime.now() - get_retention()
+    result = await session.execute(
+        delete(DBIdempotencyKey).where(
+            DBIdempotencyKey.user_id == user_id,
+            DBIdempotencyKey.key == key,
+            DBIdempotencyKey.created_date < cutoff,
+        )
+    )
+    await session.commit()
+    return result.rowcount > 0
+
+
+async def purge_expired_keys(session: AsyncSession) -> int:
+    cutoff = datetime.datetime.now() - get_retention()
+    purged = 0
+
+    while True:
+        expired = (
+            select(DBIdempotencyKey.id)
+            .where(DBIdempotencyKey.created_date < cutoff)
+            .limit(settings.IDEMPOTENCY_SWEEP_BATCH_SIZE)
+        )
+        result = await session.execute(
+            delete(DBIdempotencyKey).where(DBIdempotencyKey.id.in_(expired))
+        )
+        await session.commit()
+
+        purged += result.rowcount
+        if result.rowcount < settings.IDEMPOTENCY_SWEEP_BATCH_SIZE:
+            return purged
+
+
+async def sweep_expired_keys():
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_SWEEP_INTERVAL_SECONDS)
+        try:
+            async with models.session_factory() as session:
+                await purge_expired_keys(session)
+        except Exception:
+            logger.exception("Could not purge expired idempotency keys")
@@ -0,0 +1,254 @@
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import Integer, cast, insert, literal, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+from .models.db_models import (
+    DBBalanceSnapshot,
+    DBLedgerEntry,
+    DBLedgerWatermark,
+    DBWallet,
+    DBWalletShard,
+)
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+MINOR_UNITS = 100
+WATERMARK_ID = 1
+
+
+def to_minor_units(amount: float) -> int:
+    return round(amount * MINOR_UNITS)
+
+
+def from_minor_units(amount: int) -> float:
+    return amount / MINOR_UNITS
+
+
+def make_entry(
+    wallet_id: int,
+    amount: float,
+    kind: str,
+    transaction_id: int | None = None,
+) -> dict:
+    """Row for one ledger entry; ``amount`` is positive for credits."""
+    return dict(
+        wallet_id=wallet_id,
+        transaction_id=transaction_id,
+        amount=to_minor_units(amount),
+        kind=kind,
+        created_date=datetime.datetime.now(),
+    )
+
+
+def make_purchase_entries(
+    buyer_wallet_id: int,
+    vendor_wallet_id: int,
+    amount: float,
+    transaction_id: int,
+) -> list[dict]:
+    return [
+        make_entry(buyer_wallet_id, -amount, "purchase", transaction_id),
+        make_entry(vendor_wallet_id, amount, "sale", transaction_id),
+    ]
+
+
+async def record_entries(session: AsyncSession, entries: list[dict]):
+    """Append ``entries`` with a single executemany INSERT."""
+    if entries:
+        await session.execute(insert(DBLedgerEntry), entries)
+
+
+async def detach_transaction(session: AsyncSession, transaction_id: int):
+    """Keep the entries of a deleted transaction: the money did move, and
+    deleting a transaction refunds nothing."""
+    await session.execute(
+        update(DBLedgerEntry)
+        .where(DBLedgerEntry.transaction_id == transaction_id)
+        .values(transaction_id=None)
+    )
+
+
+async def get_balance(
+    session: AsyncSession, wallet_id: int, at: datetime.datetime | None = None
+) -> float:
+    """Balance of ``wallet_id`` at ``at`` (default now): the latest snapshot
+    taken by then plus the entries recorded after it."""
+    snapshot_query = select(DBBalanceSnapshot).where(
+        DBBalanceSnapshot.wallet_id == wallet_id
+    )
+    entry_query = select(func.coalesce(func.sum(DBLedgerEntry.amount), 0)).where(
+        DBLedgerEntry.wallet_id == wallet_id
+    )
+    if at is not None:
+        snapshot_query = snapshot_query.where(DBBalanceSnapshot.created_date <= at)
+        entry_query = entry_query.where(DBLedgerEntry.created_date <= at)
+
+    result = await session.exec(
+        snapshot_query.order_by(DBBalanceSnapshot.created_date.desc()).limit(1)
+    )
+    snapshot = result.one_or_none()
+
+    balance = 0
+    if snapshot is not None:
+        balance = snapshot.balance
+        entry_query = entry_query.where(DBLedgerEntry.id > snapshot.last_entry_id)
+
+    balance += (await session.exec(entry_query)).one()
+    return from_minor_units(balance)
+
+
+async def backfill_openings(session: AsyncSession) -> int:
+    """Write an opening entry for every wallet that predates the ledger, so
+    its ledger balance matches ``DBWallet.balance`` plus unfolded shard
+    credits; returns how many were written.
+
+    The opening amount leaves out what the wallet's existing entries already
+    add up to, so running it on a live database or twice changes nothing.
+    """
+    pending = (
+        select(func.coalesce(func.sum(DBWalletShard.balance), 0))
+        .where(DBWalletShard.wallet_id == DBWallet.id)
+        .scalar_subquery()
+    )
+    recorded = (
+        select(func.coalesce(func.sum(DBLedgerEntry.amount), 0))
+        .where(DBLedgerEntry.wallet_id == DBWallet.id)
+        .scalar_subquery()
+    )
+    opened = (
+        select(DBLedgerEntry.id)
+        .where(DBLedgerEntry.wallet_id == DBWallet.id, DBLedgerEntry.kind == "opening")
+        .exists()
+    )
+    amount = cast(func.round((DBWallet.balance + pending) * MINOR_UNITS), Integer)
+    amount -= recorded
+
+    openings = select(
+        DBWallet.id,
+        amount,
+        literal("opening"),
+        literal(datetime.datetime.now()),
+    ).where(~opened, amount != 0)
+    result = await session.execute(
+        insert(DBLedgerEntry).from_select(
+            ["wallet_id", "amount", "kind", "created_date"], openings
+        )
+    )
+    await session.commit()
+
+    return result.rowcount
+
+
+async def get_watermark(session: AsyncSession) -> int:
+    result = await session.exec(
+        select(DBLedgerWatermark.last_entry_id).where(
+            DBLedgerWatermark.id == WATERMARK_ID
+        )
+    )
+    watermark = result.one_or_none()
+    if watermark is not None:
+        return watermark
+
+    # first run: carry on from snapshots taken before the row existed
+    last_entry_id = (
+        await session.exec(select(func.max(DBBalanceSnapshot.last_entry_id)))
+    ).one() or 0
+    session.add(DBLedgerWatermark(id=WATERMARK_ID, last_entry_id=last_entry_id))
+    try:
+        await session.commit()
+    except IntegrityError:
+        # another worker created it first
+        await session.rollback()
+        return await get_watermark(session)
+
+    return last_entry_id
+
+
+async def take_snapshots(session: AsyncSession) -> int:
+    """Fold the entries recorded since the last run into one new snapshot per
+    affected wallet, and return how many snapshots were written.
+
+    Every API worker runs this; moving the watermark with a conditional UPDATE
+    lets only one of the runs over the same range write its snapshots.
+    """
+    watermark = await get_watermark(session)
+
+    # entries younger than the lag may still have uncommitted neighbours
+    # with lower ids, so they wait for the next run
+    cutoff = datetime.datetime.now() - datetime.timedelta(
+        seconds=settings.LEDGER_SNAPSHOT_LAG_SECONDS
+    )
+    upper = (
+        await session.exec(
+            select(func.max(DBLedgerEntry.id)).where(
+                DBLedgerEntry.id > watermark, DBLedgerEntry.created_date <= cutoff
+            )
+        )
+    ).one()
+    if upper is None:
+        return 0
+
+    result = await session.exec(
+        select(DBLedgerEntry.wallet_id, func.sum(DBLedgerEntry.amount))
+        .where(DBLedgerEntry.id > watermark, DBLedgerEntry.id <= upper)
+        .group_by(DBLedgerEntry.wallet_id)
+    )
+    deltas = dict(result.all())
+
+    latest = (
+        select(func.max(DBBalanceSnapshot.id))
+        .where(DBBalanceSnapshot.wallet_id.in_(deltas))
+        .group_by(DBBalanceSnapshot.wallet_id)
+    )
+    result = await session.exec(
+        select(DBBalanceSnapshot).where(DBBalanceSnapshot.id.in_(latest))
+    )
+    balances = {snapshot.wallet_id: snapshot.balance for snapshot in result.all()}
+
+    # a concurrent run that got here first has moved the watermark already;
+    # its row lock makes this UPDATE wait for it and then match nothing
+    result = await session.execute(
+        update(DBLedgerWatermark)
+        .where(
+            DBLedgerWatermark.id == WATERMARK_ID,
+            DBLedgerWatermark.last_entry_id == watermark,
+        )
+        .values(last_entry_id=upper)
+    )
+    if result.rowcount != 1:
+        await session.rollback()
+        return 0
+
+    session.add_all(
+        [
+            DBBalanceSnapshot(
+                wallet_id=wallet_id,
+                balance=balances.get(wallet_id, 0) + delta,
+                last_entry_id=upper,
+            )
+            for wallet_id, delta in deltas.items()
+        ]
+    )
+    await session.commit()
+
+    return len(deltas)
+
+
+async def snapshot_balances():
+    while True:
+        await asyncio.sleep(settings.LEDGER_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            async with models.session_factory() as session:
+                await take_snapshots(session)
+        except Exception:
+            logger.exception("Could not take balance snapshots")
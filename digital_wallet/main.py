@@ -1,8 +1,6 @@
-from gevent import monkey
+import asyncio
 
-monkey.patch_all()
-
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 
 from contextlib import asynccontextmanager
 
@@ -10,22 +8,46 @@ from . import models
 from . import routers
 
 from . import config
+from . import idempotency
+from . import ledger
+from . import provisioning
+from . import security
+from . import shards
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    tasks = [
+        asyncio.create_task(idempotency.sweep_expired_keys()),
+        asyncio.create_task(ledger.snapshot_balances()),
+        asyncio.create_task(shards.fold_sharded_wallets()),
+    ]
     yield
+    for task in tasks:
+        task.cancel()
+    security.shutdown_password_executor()
+    provisioning.shutdown_provision_executor()
     if models.engine is not None:
         # Close the DB connection
         await models.close_session()
 
 
 def create_app(settings=None):
-    settings = config.get_settings()
+    if settings is None:
+        settings = config.get_settings()
     app = FastAPI(lifespan=lifespan)
 
     models.init_db(settings)
 
+    if settings.QUERY_COUNT_HEADER:
+
+        @app.middleware("http")
+        async def query_count_header(request: Request, call_next):
+            with models.count_queries() as statements:
+                response = await call_next(request)
+            response.headers["X-Query-Count"] = str(len(statements))
+            return response
+
     routers.init_routers(app)
 
     # @app.on_event("startup")
@@ -1,14 +1,23 @@
-from typing import AsyncIterator
+import contextlib
+import time
+
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator
 
 from sqlmodel import SQLModel, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from sqlalchemy import event, make_url
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker
 
 from . import db_models
+from . import migration
+from . import search
 from . import item
 from . import merchant
+from . import spending
 from . import transaction
 from . import user
 from . import wallet
@@ -16,6 +25,7 @@ from . import wallet
 from .db_models import *
 from .item import *
 from .merchant import *
+from .spending import *
 from .transaction import *
 from .user import *
 from .wallet import *
@@ -24,17 +34,75 @@ from .wallet import *
 connect_args = {}
 
 engine = None
+session_factory = None
+
+query_log: ContextVar[list[str] | None] = ContextVar("query_log", default=None)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_time += elapsed
+            self.max_wait_time = max(self.max_wait_time, elapsed)
+
+
+def get_pool_options(settings) -> dict:
+    if make_url(settings.SQLDB_URL).get_backend_name() == "sqlite":
+        # aiosqlite connections are cheap to open and bound to the event loop
+        # that opened them, so keep SQLAlchemy's default pool for SQLite.
+        return {}
+
+    return dict(
+        poolclass=TimedQueuePool,
+        pool_size=settings.SQLDB_POOL_SIZE,
+        max_overflow=settings.SQLDB_MAX_OVERFLOW,
+        pool_timeout=settings.SQLDB_POOL_TIMEOUT,
+        pool_recycle=settings.SQLDB_POOL_RECYCLE,
+        pool_pre_ping=settings.SQLDB_POOL_PRE_PING,
+    )
 
 
 def init_db(settings):
-    global engine
+    global engine, session_factory
 
     engine = create_async_engine(
         settings.SQLDB_URL,
         future=True,
         # echo=True,
         connect_args=connect_args,
+        **get_pool_options(settings),
     )
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    event.listen(engine.sync_engine, "before_cursor_execute", log_query)
+
+
+def log_query(conn, cursor, statement, parameters, context, executemany):
+    statements = query_log.get()
+    if statements is not None:
+        statements.append(statement)
+
+
+@contextlib.contextmanager
+def count_queries() -> Iterator[list[str]]:
+    statements = []
+    token = query_log.set(statements)
+    try:
+        yield statements
+    finally:
+        query_log.reset(token)
 
 
 async def recreate_table():
@@ -43,12 +111,40 @@ async def recreate_table():
         await conn.run_sync(SQLModel.metadata.create_all)
 
 
+async def migrate_table() -> list[str]:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        return await conn.run_sync(migration.upgrade_schema)
+
+
 async def get_session() -> AsyncIterator[AsyncSession]:
-    async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
-    async with async_session() as session:
+    async with session_factory() as session:
         yield session
 
 
+def get_pool_stats() -> dict:
+    if engine is None:
+        raise Exception("DatabaseSessionManager is not initialized")
+
+    pool = engine.pool
+    stats = dict(pool=pool.__class__.__name__, status=pool.status())
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            wait_count=pool.wait_count,
+            wait_time=pool.wait_time,
+            max_wait_time=pool.max_wait_time,
+        )
+
+    return stats
+
+
 async def close_session():
     global engine
     if engine is None:
@@ -3,7 +3,7 @@ import datetime
 from typing import Optional
 
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 
 from .merchant import Merchant
 from .item import Item
@@ -16,13 +16,16 @@ class DBMerchant(Merchant, SQLModel, table=True):
     __tablename__ = "merchants"
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="users.id", index=True)
     user: Optional["DBUser"] = Relationship()
 
     items: list["DBItem"] = Relationship(back_populates="merchant", cascade_delete=True)
 
     transactions: list["DBTransaction"] = Relationship(back_populates="merchant")
 
+    units_sold: int = 0
+    revenue: float = 0.0
+
     # wallet: Optional["DBWallet"] = Relationship(
     #     back_populates="merchant", cascade_delete=True
     # )
@@ -30,22 +33,37 @@ class DBMerchant(Merchant, SQLModel, table=True):
 
 class DBItem(Item, SQLModel, table=True):
     __tablename__ = "items"
+    __table_args__ = (
+        # top sellers: WHERE merchant_id = ? ORDER BY units_sold DESC, id DESC
+        Index("ix_items_merchant_id_units_sold", "merchant_id", "units_sold", "id"),
+        # the upsert key of bulk imports; items without a SKU never collide
+        Index("ix_items_merchant_id_sku", "merchant_id", "sku", unique=True),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="users.id", index=True)
     user: Optional["DBUser"] = Relationship()
 
-    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id")
+    merchant_id: Optional[int] = Field(
+        default=None, foreign_key="merchants.id", index=True
+    )
     merchant: Optional[DBMerchant] = Relationship(back_populates="items")
 
     transactions: list["DBTransaction"] = Relationship(back_populates="item")
 
+    # sales counters, kept up to date by every purchase
+    units_sold: int = 0
+    revenue: float = 0.0
+
 
 class DBWallet(Wallet, SQLModel, table=True):
     __tablename__ = "wallets"
+    # the ledger outlives deleted wallets, so SQLite must not hand their ids out
+    # again
+    __table_args__ = {"sqlite_autoincrement": True}
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: Optional[int] = Field(default=None, foreign_key="users.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="users.id", index=True)
     user: Optional["DBUser"] = Relationship()
 
     # merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id")
@@ -54,30 +72,153 @@ class DBWallet(Wallet, SQLModel, table=True):
     transactions: list["DBTransaction"] = Relationship(back_populates="wallet")
 
 
+class DBWalletShard(SQLModel, table=True):
+    __tablename__ = "wallet_shards"
+    __table_args__ = (UniqueConstraint("wallet_id", "shard"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    wallet_id: int = Field(foreign_key="wallets.id")
+    shard: int
+    # credits not yet folded into DBWallet.balance
+    balance: float = 0.0
+
+
 class DBTransaction(Transaction, SQLModel, table=True):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # history pages: WHERE user_id = ? ORDER BY transaction_date DESC, id DESC,
+        # also serving from/to as a range and min_total as a residual filter
+        Index(
+            "ix_transactions_user_id_transaction_date",
+            "user_id",
+            "transaction_date",
+            "id",
+        ),
+        # history filtered by merchant or item, in the same order
+        Index(
+            "ix_transactions_user_id_merchant_id_transaction_date",
+            "user_id",
+            "merchant_id",
+            "transaction_date",
+            "id",
+        ),
+        Index(
+            "ix_transactions_user_id_item_id_transaction_date",
+            "user_id",
+            "item_id",
+            "transaction_date",
+            "id",
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
     user_id: Optional[int] = Field(default=None, foreign_key="users.id")
     user: Optional["DBUser"] = Relationship()
 
-    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id")
+    merchant_id: Optional[int] = Field(
+        default=None, foreign_key="merchants.id", index=True
+    )
     merchant: Optional[DBMerchant] = Relationship(back_populates="transactions")
 
-    wallet_id: Optional[int] = Field(default=None, foreign_key="wallets.id")
+    wallet_id: Optional[int] = Field(default=None, foreign_key="wallets.id", index=True)
     wallet: Optional[DBWallet] = Relationship(back_populates="transactions")
 
-    item_id: Optional[int] = Field(default=None, foreign_key="items.id")
+    item_id: Optional[int] = Field(default=None, foreign_key="items.id", index=True)
     item: Optional[DBItem] = Relationship(back_populates="transactions")
 
+    # the spending rollup bucket the purchase was counted in; unlike
+    # merchant_id it is kept when the merchant is deleted
+    rollup_merchant_id: int = 0
+
     transaction_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
 
 
 class DBUser(User, SQLModel, table=True):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username", "username", unique=True),
+        Index("ix_users_email", "email", unique=True),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     hashed_password: str
 
     register_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     last_login_date: datetime.datetime | None = Field(default=None)
+
+
+class DBIdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    user_id: int = Field(foreign_key="users.id")
+    key: str = Field(max_length=255)
+    fingerprint: str
+
+    status_code: int = 200
+    response_body: str
+
+    created_date: datetime.datetime = Field(
+        default_factory=datetime.datetime.now, index=True
+    )
+
+
+class DBLedgerEntry(SQLModel, table=True):
+    __tablename__ = "ledger_entries"
+    __table_args__ = (Index("ix_ledger_entries_wallet_id_id", "wallet_id", "id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    # not a foreign key: the ledger is append-only and keeps the history of
+    # deleted wallets
+    wallet_id: int
+    transaction_id: Optional[int] = Field(
+        default=None, foreign_key="transactions.id", ondelete="SET NULL", index=True
+    )
+
+    # minor units: credits are positive, debits negative
+    amount: int
+    kind: str
+
+    created_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class DBBalanceSnapshot(SQLModel, table=True):
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        Index(
+            "ix_balance_snapshots_wallet_id_created_date", "wallet_id", "created_date"
+        ),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    # not a foreign key, like DBLedgerEntry.wallet_id
+    wallet_id: int
+    balance: int
+    last_entry_id: int = Field(index=True)
+
+    created_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class DBLedgerWatermark(SQLModel, table=True):
+    __tablename__ = "ledger_watermarks"
+    # a single row: the last entry folded into the balance snapshots
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    last_entry_id: int = 0
+
+
+class DBSpendingRollup(SQLModel, table=True):
+    __tablename__ = "spending_rollups"
+    # one row per bucket: WHERE user_id = ? AND day >= ? GROUP BY period
+    __table_args__ = (UniqueConstraint("user_id", "day", "merchant_id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    user_id: int = Field(foreign_key="users.id")
+    # not a foreign key: the totals stay with the merchant they were spent at,
+    # 0 for purchases without one
+    merchant_id: int = 0
+    day: datetime.date
+
+    count: int = 0
+    total_price: float = 0.0
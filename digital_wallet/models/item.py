@@ -1,3 +1,4 @@
+import pydantic
 from pydantic import BaseModel, ConfigDict
 
 
@@ -11,6 +12,7 @@ class BaseItem(BaseModel):
     tax: float | None = None
     user_id: int | None = 0
     merchant_id: int | None = 0
+    sku: str | None = pydantic.Field(default=None, max_length=64)  # per merchant
 
 
 class CreateItem(BaseItem):
@@ -29,6 +31,18 @@ class ItemList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     items: list[Item]
-    page: int
-    page_count: int
+    page: int | None = None
+    page_count: int | None = None
     size_per_page: int
+    next_cursor: str | None = None
+
+
+class BulkItemError(BaseModel):
+    line: int  # 1-based, counting the CSV header
+    errors: list[str]
+
+
+class BulkItemResult(BaseModel):
+    imported: int  # rows inserted or updated
+    error_count: int
+    errors: list[BulkItemError]  # the first BULK_IMPORT_MAX_ERRORS of them
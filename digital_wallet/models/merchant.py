@@ -1,5 +1,7 @@
 from pydantic import BaseModel, ConfigDict
 
+from .item import Item
+
 
 class BaseMerchant(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -28,6 +30,33 @@ class MerchantList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     merchants: list[Merchant]
-    page: int
-    page_count: int
+    page: int | None = None
+    page_count: int | None = None
+    size_per_page: int
+    next_cursor: str | None = None
+
+
+class Storefront(Merchant):
+    items: list[Item]
+    page: int | None = None
+    page_count: int | None = None
     size_per_page: int
+    next_cursor: str | None = None
+
+
+class ItemSales(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    units_sold: int
+    revenue: float
+
+
+class MerchantSales(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    merchant_id: int
+    units_sold: int
+    revenue: float
+    top_items: list[ItemSales]
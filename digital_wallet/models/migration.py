@@ -0,0 +1,73 @@
+from sqlalchemy import Connection, Table, inspect, literal, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from sqlmodel import SQLModel
+
+from .search import install_search
+
+
+def get_column_ddl(column, dialect) -> str:
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    default = column.default
+    if column.server_default is None and default is not None and default.is_scalar:
+        # existing rows need a value before a NOT NULL column can be added
+        value = literal(default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        ddl += f" DEFAULT {value}"
+
+    return ddl
+
+
+def get_index_ddl(index, dialect) -> str:
+    ddl = str(CreateIndex(index).compile(dialect=dialect))
+    if dialect.name == "postgresql":
+        # build the index without blocking writes to a live table
+        ddl = ddl.replace("INDEX", "INDEX CONCURRENTLY", 1)
+
+    return ddl
+
+
+def upgrade_table(conn: Connection, table: Table) -> list[str]:
+    inspector = inspect(conn)
+    steps = []
+
+    columns = {column["name"] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in columns:
+            steps.append(
+                f"ALTER TABLE {table.name} ADD COLUMN "
+                + get_column_ddl(column, conn.dialect)
+            )
+
+    indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name not in indexes:
+            steps.append(get_index_ddl(index, conn.dialect))
+
+    return steps
+
+
+def upgrade_schema(conn: Connection) -> list[str]:
+    """Bring an existing database up to the models without dropping anything:
+    create missing tables, add missing columns and build missing indexes,
+    text search included.
+
+    Returns the statements that were run. ``conn`` is expected to be in
+    autocommit mode so each step is kept even if a later one fails, e.g. a
+    unique index over rows that already hold duplicates.
+    """
+    tables = set(inspect(conn).get_table_names())
+    applied = []
+
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in tables:
+            table.create(conn)
+            applied.append(f"CREATE TABLE {table.name}")
+            continue
+
+        for step in upgrade_table(conn, table):
+            conn.execute(text(step))
+            applied.append(step)
+
+    applied += install_search(conn, concurrently=True)
+    return applied
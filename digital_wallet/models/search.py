@@ -0,0 +1,147 @@
+from sqlalchemy import Connection, event, text
+from sqlmodel import SQLModel
+
+
+# Text indexes the ORM does not model: an FTS5 table per searchable table on
+# SQLite, a tsvector expression index plus a trigram index on Postgres. Both
+# are kept in sync by the database itself, so bulk inserts and raw updates
+# are indexed the same way as the routers' writes. Postgres indexes an
+# expression rather than a generated column, since adding a stored column
+# rewrites the whole table under an exclusive lock.
+SEARCHABLE = {
+    "items": ("name", "description"),
+    "merchants": ("first_name", "last_name", "description"),
+}
+
+
+def get_search_text(table: str) -> str:
+    """The searched text of a row, as one SQL expression. Postgres only uses
+    an expression index when the query spells the expression the same way."""
+    return " || ' ' || ".join(
+        f"coalesce({table}.{column}, '')" for column in SEARCHABLE[table]
+    )
+
+
+def get_search_vector(table: str) -> str:
+    return f"to_tsvector('simple', {get_search_text(table)})"
+
+
+def get_sqlite_ddl(table: str, concurrently: bool) -> list[tuple[str, list[str]]]:
+    """``(name, statements)`` for each object, in creation order."""
+    columns = SEARCHABLE[table]
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    remove = (
+        f"INSERT INTO {table}_search ({table}_search, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    add = f"INSERT INTO {table}_search (rowid, {names}) VALUES (new.id, {new});"
+    return [
+        (
+            f"{table}_search",
+            [
+                f"CREATE VIRTUAL TABLE {table}_search USING fts5({names}, "
+                f"content='{table}', content_rowid='id', prefix='3 4', "
+                "tokenize='unicode61 remove_diacritics 2')",
+                f"INSERT INTO {table}_search ({table}_search) VALUES ('rebuild')",
+            ],
+        ),
+        (
+            f"{table}_search_insert",
+            [
+                f"CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} "
+                f"BEGIN {add} END"
+            ],
+        ),
+        (
+            f"{table}_search_delete",
+            [
+                f"CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} "
+                f"BEGIN {remove} END"
+            ],
+        ),
+        # stock and counter updates leave the text alone and skip the index
+        (
+            f"{table}_search_update",
+            [
+                f"CREATE TRIGGER {table}_search_update "
+                f"AFTER UPDATE OF {names} ON {table} BEGIN {remove} {add} END"
+            ],
+        ),
+    ]
+
+
+def get_postgresql_ddl(table: str, concurrently: bool) -> list[tuple[str, list[str]]]:
+    """``(name, statements)`` for each object, in creation order. On a live
+    database the indexes are built without blocking writes; a build that
+    failed half way leaves an invalid index behind, which is dropped first."""
+    mode = "CONCURRENTLY " if concurrently else ""
+    indexes = [
+        (f"ix_{table}_search_words", f"GIN (({get_search_vector(table)}))"),
+        (
+            f"ix_{table}_search_trigram",
+            f"GIN (({get_search_text(table)}) gin_trgm_ops)",
+        ),
+    ]
+    return [("pg_trgm", ["CREATE EXTENSION IF NOT EXISTS pg_trgm"])] + [
+        (
+            name,
+            [
+                f"DROP INDEX {mode}IF EXISTS {name}",
+                f"CREATE INDEX {mode}{name} ON {table} USING {method}",
+            ],
+        )
+        for name, method in indexes
+    ]
+
+
+def has_object(conn: Connection, name: str) -> bool:
+    if conn.dialect.name == "postgresql":
+        statement = text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = indexrelid "
+            "WHERE relname = :name AND indisvalid "
+            "UNION ALL SELECT 1 FROM pg_extension WHERE extname = :name"
+        )
+    else:
+        statement = text("SELECT 1 FROM sqlite_master WHERE name = :name")
+    return conn.execute(statement, dict(name=name)).first() is not None
+
+
+def install_search(conn: Connection, concurrently: bool = False) -> list[str]:
+    """Create the missing text indexes and fill them from the existing rows;
+    returns the statements that were run.
+
+    Every object is checked on its own, so a run that failed part way is
+    finished by the next one. ``concurrently`` needs ``conn`` in autocommit
+    mode."""
+    if conn.dialect.name == "postgresql":
+        get_ddl = get_postgresql_ddl
+    elif conn.dialect.name == "sqlite":
+        get_ddl = get_sqlite_ddl
+    else:
+        return []
+
+    applied = []
+    for table in SEARCHABLE:
+        for name, steps in get_ddl(table, concurrently):
+            if has_object(conn, name):
+                continue
+            for step in steps:
+                conn.execute(text(step))
+                applied.append(step)
+
+    return applied
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def create_search(target, connection: Connection, **kw):
+    install_search(connection)
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def drop_search(target, connection: Connection, **kw):
+    # the FTS tables are not in the metadata; triggers go with their table
+    if connection.dialect.name == "sqlite":
+        for table in SEARCHABLE:
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}_search"))
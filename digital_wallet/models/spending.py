@@ -0,0 +1,19 @@
+import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+
+class SpendingBucket(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    period: datetime.date  # first day of the day or month bucket
+    merchant_id: int | None = None
+    count: int
+    total_price: float
+
+
+class SpendingReport(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    granularity: str
+    buckets: list[SpendingBucket]
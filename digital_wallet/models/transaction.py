@@ -1,3 +1,6 @@
+import datetime
+
+import pydantic
 from pydantic import BaseModel, ConfigDict
 
 from .item import Item
@@ -31,10 +34,33 @@ class Transaction(BaseTransaction):
     id: int
 
 
+class ExportedTransaction(Transaction):
+    transaction_date: datetime.datetime
+
+
 class TransactionList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     transactions: list[Transaction]
-    page: int
-    page_count: int
+    page: int | None = None
+    page_count: int | None = None
     size_per_page: int
+    next_cursor: str | None = None
+
+
+class CheckoutLine(BaseModel):
+    item_id: int
+    vendor_wallet_id: int
+    quantity: int = pydantic.Field(default=1, ge=1)
+
+
+class CreateCheckout(BaseModel):
+    buyer_wallet_id: int
+    lines: list[CheckoutLine] = pydantic.Field(min_length=1, max_length=100)
+
+
+class Checkout(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    transactions: list[Transaction]
+    total_price: float
@@ -19,6 +19,10 @@ class CreateUser(BaseUser):
     pass
 
 
+class ProvisionUser(CreateUser):
+    password: str = pydantic.Field(min_length=1)
+
+
 class UpdateUser(BaseUser):
     pass
 
@@ -54,3 +58,16 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     user_id: int | None = None
     username: str | None = None
+
+
+class ProvisionError(BaseModel):
+    line: int
+    errors: list[str]
+
+
+class ProvisionResult(BaseModel):
+    created: int
+    error_count: int
+    errors: list[ProvisionError]  # the first BULK_IMPORT_MAX_ERRORS of them
+    seconds: float
+    users_per_second: float
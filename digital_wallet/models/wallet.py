@@ -1,3 +1,5 @@
+import datetime
+
 from pydantic import BaseModel, ConfigDict
 
 
@@ -10,6 +12,7 @@ class BaseWallet(BaseModel):
     balance: float = 0.0
     merchant_id: int | None = 0
     user_id: int | None = 0
+    sharded: bool = False  # spread incoming credits over sub-balances
 
 
 class CreateWallet(BaseWallet):
@@ -17,7 +20,7 @@ class CreateWallet(BaseWallet):
 
 
 class UpdateWallet(BaseWallet):
-    pass
+    sharded: bool | None = None  # left as it is unless given
 
 
 class Wallet(BaseWallet):
@@ -28,6 +31,13 @@ class WalletList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     items: list[Wallet]
-    page: int
-    page_count: int
+    page: int | None = None
+    page_count: int | None = None
     size_per_page: int
+    next_cursor: str | None = None
+
+
+class WalletBalance(BaseModel):
+    wallet_id: int
+    balance: float
+    at: datetime.datetime
@@ -0,0 +1,134 @@
+import base64
+import binascii
+import datetime
+import json
+import math
+
+from typing import Any, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import literal, tuple_
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import cache
+from . import config
+
+
+MAX_SIZE_PER_PAGE = 500
+
+settings = config.get_settings()
+
+count_cache = cache.LRUCache(
+    maxsize=settings.PAGE_COUNT_CACHE_SIZE, ttl=settings.PAGE_COUNT_CACHE_TTL_SECONDS
+)
+
+
+def encode_cursor(*values: Any) -> str:
+    data = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_cursor_value(column, value):
+    """``value`` as the type of ``column``; a hand-edited cursor must not
+    reach the query with a value the database cannot compare."""
+    python_type = column.type.python_type
+    if python_type is datetime.datetime and isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    # JSON true and false decode to bool, a subclass of int
+    if isinstance(value, bool):
+        raise ValueError("cursor value does not match its column")
+    if python_type is float and isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError("cursor value is not finite")
+        return value
+    if python_type in (int, str) and isinstance(value, python_type):
+        return value
+
+    raise ValueError("cursor value does not match its column")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match the ordering")
+
+        return [
+            parse_cursor_value(column, value) for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, NotImplementedError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_keyset_filter(columns: Sequence, after: str, descending: bool = False):
+    """Condition selecting the rows ordered by ``columns`` past the cursor."""
+    values = decode_cursor(after, columns)
+    if len(columns) == 1:
+        key, bound = columns[0], values[0]
+    else:
+        # bind with the column types so dates compare in the stored format
+        key = tuple_(*columns)
+        bound = tuple_(
+            *[literal(value, column.type) for column, value in zip(columns, values)]
+        )
+
+    return key < bound if descending else key > bound
+
+
+def paginate(
+    statement,
+    columns: Sequence,
+    after: str | None,
+    page: int,
+    limit: int,
+    descending: bool = False,
+):
+    """Order ``statement`` by ``columns`` and select one page of rows.
+
+    With ``after`` the page starts right past the cursor row (keyset
+    pagination), otherwise it falls back to the legacy ``page`` offset. One
+    extra row is fetched so ``split_page`` can tell whether more rows follow.
+    """
+    if after is not None:
+        statement = statement.where(get_keyset_filter(columns, after, descending))
+    else:
+        statement = statement.offset((page - 1) * limit)
+
+    order_by = [column.desc() if descending else column for column in columns]
+    return statement.order_by(*order_by).limit(limit + 1)
+
+
+def split_page(
+    rows: Sequence, columns: Sequence, limit: int
+) -> tuple[list, str | None]:
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(*[getattr(rows[-1], column.key) for column in columns])
+
+
+async def count_pages(session: AsyncSession, statement, key: tuple, limit: int) -> int:
+    """Count the pages of ``statement``, which must carry the same filter as
+    the page query. Totals are cached under ``key`` for a short time."""
+    total = count_cache.get(key)
+    if total is None:
+        result = await session.exec(
+            select(func.count()).select_from(statement.subquery())
+        )
+        total = result.one()
+        count_cache.set(key, total)
+
+    return math.ceil(total / limit)
+
+
+def invalidate_counts(*keys: tuple):
+    for key in keys:
+        count_cache.delete(key)
@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+import itertools
+import math
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import bulk
+from . import config
+from . import security
+from .models.db_models import DBUser
+from .models.user import ProvisionUser
+
+
+settings = config.get_settings()
+
+provision_executor: Executor | None = None
+
+
+def make_executor() -> tuple[Executor, int]:
+    # separate from the login pool: a migration should not queue behind, or
+    # in front of, interactive logins
+    workers = security.get_password_workers()
+    return ProcessPoolExecutor(max_workers=workers), workers
+
+
+def get_provision_executor() -> tuple[Executor, int]:
+    """The API's provisioning pool, started on first use and shared by every
+    upload so concurrent ones do not multiply the processes."""
+    global provision_executor
+    if provision_executor is None:
+        provision_executor, _ = make_executor()
+
+    return provision_executor, security.get_password_workers()
+
+
+def shutdown_provision_executor():
+    global provision_executor
+    if provision_executor is not None:
+        provision_executor.shutdown(wait=False, cancel_futures=True)
+        provision_executor = None
+
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    return [security.get_password_hash(password) for password in passwords]
+
+
+async def hash_chunk(
+    executor: Executor, workers: int, passwords: list[str]
+) -> list[str]:
+    """Hash ``passwords`` in order, one contiguous slice per worker so each
+    process gets a single round trip per chunk."""
+    loop = asyncio.get_running_loop()
+    size = math.ceil(len(passwords) / workers)
+    parts = await asyncio.gather(
+        *[
+            loop.run_in_executor(executor, hash_passwords, passwords[i : i + size])
+            for i in range(0, len(passwords), size)
+        ]
+    )
+    return list(itertools.chain.from_iterable(parts))
+
+
+async def write_chunk(
+    session: AsyncSession,
+    executor: Executor,
+    workers: int,
+    chunk: list[tuple[int, ProvisionUser]],
+    add_error,
+) -> int:
+    """Insert the users of ``chunk`` whose username and email are free;
+    returns how many were created."""
+    result = await session.exec(
+        select(DBUser.username, DBUser.email).where(
+            or_(
+                DBUser.username.in_({user.username for _, user in chunk}),
+                DBUser.email.in_({user.email for _, user in chunk}),
+            )
+        )
+    )
+    taken_usernames, taken_emails = set(), set()
+    for username, email in result.all():
+        taken_usernames.add(username)
+        taken_emails.add(email)
+
+    accepted = []
+    for line, user in chunk:
+        errors = []
+        if user.username in taken_usernames:
+            errors.append("username: already exists")
+        if user.email in taken_emails:
+            errors.append("email: already exists")
+        if errors:
+            add_error(line, errors)
+            continue
+        # later rows of the same upload collide with this one
+        taken_usernames.add(user.username)
+        taken_emails.add(user.email)
+        accepted.append((line, user))
+
+    if not accepted:
+        return 0
+
+    hashes = await hash_chunk(
+        executor, workers, [user.password for _, user in accepted]
+    )
+    now = datetime.datetime.now()
+    rows = [
+        dict(
+            user.model_dump(exclude={"password"}),
+            hashed_password=hashed_password,
+            register_date=now,
+            updated_date=now,
+        )
+        for (_, user), hashed_password in zip(accepted, hashes)
+    ]
+    try:
+        await session.execute(insert(DBUser), rows)
+        await session.commit()
+    except IntegrityError:
+        # registered concurrently since the check; the chunk can be resent
+        await session.rollback()
+        for line, _ in accepted:
+            add_error(line, ["username or email: taken concurrently"])
+        return 0
+
+    return len(rows)
+
+
+async def provision_users(
+    session: AsyncSession,
+    stream: AsyncIterator[bytes],
+    format: str,
+    executor: Executor,
+    workers: int,
+) -> dict:
+    """Create the users of a CSV or NDJSON stream (``ProvisionUser`` fields)
+    chunk by chunk: one uniqueness query, one parallel hashing round and one
+    multi-row insert per PROVISION_CHUNK_SIZE users."""
+    start = time.perf_counter()
+    created = 0
+    errors = []
+    error_count = 0
+    chunk = []
+
+    def add_error(line: int, messages: list[str]):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < settings.BULK_IMPORT_MAX_ERRORS:
+            errors.append(dict(line=line, errors=messages))
+
+    try:
+        async for line, row in bulk.iter_rows(stream, format):
+            if isinstance(row, bulk.RowError):
+                add_error(line, [str(row)])
+                continue
+            try:
+                chunk.append((line, ProvisionUser.model_validate(row)))
+            except ValidationError as exc:
+                add_error(line, bulk.get_errors(exc))
+                continue
+
+            if len(chunk) == settings.PROVISION_CHUNK_SIZE:
+                created += await write_chunk(
+                    session, executor, workers, chunk, add_error
+                )
+                chunk = []
+    except bulk.RowError as exc:
+        add_error(0, [str(exc)])
+
+    if chunk:
+        created += await write_chunk(session, executor, workers, chunk, add_error)
+
+    seconds = time.perf_counter() - start
+    return dict(
+        created=created,
+        error_count=error_count,
+        errors=errors,
+        seconds=seconds,
+        users_per_second=created / seconds if seconds else 0.0,
+    )
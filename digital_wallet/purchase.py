@@ -0,0 +1,306 @@
+import asyncio
+import collections
+import random
+
+from fastapi import HTTPException, status
+
+from sqlalchemy import case, update
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import ledger
+from . import rollups
+from . import sales
+from . import shards
+from .models.db_models import DBItem, DBMerchant, DBTransaction, DBWallet
+from .models.transaction import CheckoutLine
+from .models.user import User
+
+
+settings = config.get_settings()
+
+# serialization_failure and deadlock_detected on Postgres
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+
+def is_retryable(exc: DBAPIError) -> bool:
+    if getattr(exc.orig, "sqlstate", None) in RETRYABLE_SQLSTATES:
+        return True
+
+    return isinstance(exc, OperationalError) and "database is locked" in str(exc.orig)
+
+
+async def run_with_retry(session: AsyncSession, operation, *args):
+    """Run ``operation(session, *args)`` and commit, starting over when the
+    database aborts the transaction because of a concurrent writer."""
+    for attempt in range(settings.PURCHASE_MAX_RETRIES + 1):
+        try:
+            result = await operation(session, *args)
+            await session.commit()
+            return result
+        except HTTPException:
+            await session.rollback()
+            raise
+        except DBAPIError as exc:
+            await session.rollback()
+            if attempt == settings.PURCHASE_MAX_RETRIES or not is_retryable(exc):
+                raise
+
+        await asyncio.sleep(
+            random.uniform(0, settings.PURCHASE_RETRY_DELAY * 2**attempt)
+        )
+
+
+async def take_stock(session: AsyncSession, item_id: int, quantity: int):
+    result = await session.execute(
+        update(DBItem)
+        .where(DBItem.id == item_id, DBItem.stock >= quantity)
+        .values(
+            stock=DBItem.stock - quantity,
+            units_sold=DBItem.units_sold + quantity,
+            revenue=DBItem.revenue + DBItem.price * quantity,
+        )
+        .returning(DBItem.name, DBItem.price, DBItem.merchant_id)
+    )
+    row = result.one_or_none()
+    if row is not None:
+        return row
+
+    if await session.get(DBItem, item_id) is None:
+        raise HTTPException(status_code=404, detail="Item or Wallet not found")
+
+    raise HTTPException(status_code=400, detail="Insufficient stock")
+
+
+async def try_debit(
+    session: AsyncSession, current_user: User, wallet_id: int, amount: float
+) -> bool:
+    result = await session.execute(
+        update(DBWallet)
+        .where(
+            DBWallet.id == wallet_id,
+            DBWallet.user_id == current_user.id,
+            DBWallet.balance >= amount,
+        )
+        .values(balance=DBWallet.balance - amount)
+        .returning(DBWallet.id)
+    )
+    return result.one_or_none() is not None
+
+
+async def debit_wallet(
+    session: AsyncSession, current_user: User, wallet_id: int, amount: float
+):
+    if await try_debit(session, current_user, wallet_id, amount):
+        return
+
+    db_wallet = await session.get(DBWallet, wallet_id)
+    if db_wallet is None:
+        raise HTTPException(status_code=404, detail="Item or Wallet not found")
+
+    if db_wallet.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    # credits still sitting in sub-balances count towards what can be spent
+    if (
+        db_wallet.sharded
+        and await shards.fold_shards(session, wallet_id)
+        and await try_debit(session, current_user, wallet_id, amount)
+    ):
+        return
+
+    raise HTTPException(status_code=400, detail="Insufficient balance")
+
+
+async def credit_wallet(
+    session: AsyncSession, wallet_id: int, amount: float, payer_wallet_id: int
+):
+    """Credit ``wallet_id``; sharded wallets take the credit on the
+    sub-balance picked for ``payer_wallet_id`` so their own row stays free."""
+    result = await session.execute(
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id, DBWallet.sharded.is_(False))
+        .values(balance=DBWallet.balance + amount)
+        .returning(DBWallet.id)
+    )
+    if result.one_or_none() is not None:
+        return
+
+    if await shards.credit_shard(session, wallet_id, amount, payer_wallet_id):
+        return
+
+    # sharded, but its sub-balances were never created
+    result = await session.execute(
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id)
+        .values(balance=DBWallet.balance + amount)
+        .returning(DBWallet.id)
+    )
+    if result.one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Item or Wallet not found")
+
+
+async def purchase_item(
+    session: AsyncSession,
+    current_user: User,
+    buyer_wallet_id: int,
+    vendor_wallet_id: int,
+    item_id: int,
+    quantity: int,
+) -> DBTransaction:
+    """Move stock and money for one purchase inside the current transaction.
+
+    Every check is part of a conditional UPDATE, so two buyers can never both
+    see the last unit or the same balance. Rows are always locked item first
+    and then wallets by ascending id, which keeps concurrent purchases from
+    deadlocking on each other.
+    """
+    if quantity < 1:
+        raise HTTPException(status_code=400, detail="Invalid quantity")
+
+    db_item = await take_stock(session, item_id, quantity)
+    total_price = db_item.price * quantity
+
+    # (wallet id, is credit): debit before credit when both are the same wallet
+    for wallet_id, is_credit in sorted(
+        [(buyer_wallet_id, False), (vendor_wallet_id, True)]
+    ):
+        if is_credit:
+            await credit_wallet(session, wallet_id, total_price, buyer_wallet_id)
+        else:
+            await debit_wallet(session, current_user, wallet_id, total_price)
+
+    db_merchant = await session.get(DBMerchant, db_item.merchant_id)
+
+    db_transaction = DBTransaction(
+        total_price=total_price,
+        quantity=quantity,
+        item_name=db_item.name,
+        item_id=item_id,
+        merchant_first_name=db_merchant.first_name if db_merchant else None,
+        merchant_last_name=db_merchant.last_name if db_merchant else None,
+        merchant_id=db_item.merchant_id,
+        rollup_merchant_id=db_item.merchant_id or 0,
+        user_first_name=current_user.first_name,
+        user_last_name=current_user.last_name,
+        user_id=current_user.id,
+        wallet_id=buyer_wallet_id,
+    )
+    session.add(db_transaction)
+    await session.flush()
+
+    await ledger.record_entries(
+        session,
+        ledger.make_purchase_entries(
+            buyer_wallet_id, vendor_wallet_id, total_price, db_transaction.id
+        ),
+    )
+    await rollups.add_spending(session, [db_transaction])
+    await sales.add_sales(session, [db_transaction])
+
+    return db_transaction
+
+
+async def checkout(
+    session: AsyncSession,
+    current_user: User,
+    buyer_wallet_id: int,
+    lines: list[CheckoutLine],
+) -> dict:
+    """Buy every cart line inside the current transaction.
+
+    Stock for all items is checked and taken with one guarded UPDATE, the
+    buyer is debited once and each vendor wallet credited once, and the
+    transaction rows are inserted as a single batch.
+    """
+    quantities = collections.Counter()
+    for line in lines:
+        quantities[line.item_id] += line.quantity
+    item_ids = sorted(quantities)
+
+    result = await session.exec(
+        select(DBItem)
+        .where(DBItem.id.in_(item_ids))
+        .order_by(DBItem.id)
+        .with_for_update()
+    )
+    db_items = {db_item.id: db_item for db_item in result.all()}
+    if len(db_items) != len(item_ids):
+        raise HTTPException(status_code=404, detail="Item or Wallet not found")
+
+    for item_id, quantity in quantities.items():
+        if db_items[item_id].stock < quantity:
+            raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    taken = case(quantities, value=DBItem.id)
+    result = await session.execute(
+        update(DBItem)
+        .where(DBItem.id.in_(item_ids), DBItem.stock >= taken)
+        .values(
+            stock=DBItem.stock - taken,
+            units_sold=DBItem.units_sold + taken,
+            revenue=DBItem.revenue + DBItem.price * taken,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(item_ids):
+        raise HTTPException(status_code=400, detail="Insufficient stock")
+
+    credits = collections.defaultdict(float)
+    for line in lines:
+        credits[line.vendor_wallet_id] += db_items[line.item_id].price * line.quantity
+    total_price = sum(credits.values())
+
+    for wallet_id, is_credit in sorted(
+        [(buyer_wallet_id, False)] + [(wallet_id, True) for wallet_id in credits]
+    ):
+        if is_credit:
+            await credit_wallet(session, wallet_id, credits[wallet_id], buyer_wallet_id)
+        else:
+            await debit_wallet(session, current_user, wallet_id, total_price)
+
+    merchant_ids = {db_item.merchant_id for db_item in db_items.values()}
+    result = await session.exec(
+        select(DBMerchant).where(DBMerchant.id.in_(merchant_ids))
+    )
+    db_merchants = {db_merchant.id: db_merchant for db_merchant in result.all()}
+
+    db_transactions = []
+    for line in lines:
+        db_item = db_items[line.item_id]
+        db_merchant = db_merchants.get(db_item.merchant_id)
+        db_transactions.append(
+            DBTransaction(
+                total_price=db_item.price * line.quantity,
+                quantity=line.quantity,
+                item_name=db_item.name,
+                item_id=db_item.id,
+                merchant_first_name=db_merchant.first_name if db_merchant else None,
+                merchant_last_name=db_merchant.last_name if db_merchant else None,
+                merchant_id=db_item.merchant_id,
+                rollup_merchant_id=db_item.merchant_id or 0,
+                user_first_name=current_user.first_name,
+                user_last_name=current_user.last_name,
+                user_id=current_user.id,
+                wallet_id=buyer_wallet_id,
+            )
+        )
+
+    session.add_all(db_transactions)
+    await session.flush()
+
+    entries = []
+    for line, db_transaction in zip(lines, db_transactions):
+        entries += ledger.make_purchase_entries(
+            buyer_wallet_id,
+            line.vendor_wallet_id,
+            db_transaction.total_price,
+            db_transaction.id,
+        )
+    await ledger.record_entries(session, entries)
+    await rollups.add_spending(session, db_transactions)
+    await sales.add_sales(session, db_transactions)
+
+    return dict(transactions=db_transactions, total_price=total_price)
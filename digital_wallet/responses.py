@@ -0,0 +1,93 @@
+import functools
+import hashlib
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+from . import config
+
+
+settings = config.get_settings()
+
+
+@functools.cache
+def get_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+class ModelResponse(Response):
+    """JSON response for a handler's return model, validated once and dumped
+    straight to bytes by pydantic-core.
+
+    Returning a plain model makes FastAPI dump it to a dict, validate that
+    dict against the response model again, walk it with ``jsonable_encoder``
+    and finally ``json.dumps`` the result; for a 50-row page that is most of
+    the request's CPU time. The return annotation still documents the schema.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        model: type[BaseModel],
+        content,
+        status_code: int = 200,
+        headers: dict[str, str] | None = None,
+    ):
+        self.adapter = get_adapter(model)
+        super().__init__(model.model_validate(content), status_code, headers)
+
+    def render(self, content) -> bytes:
+        # serializes with ``model``'s fields even for table subclasses
+        return self.adapter.dump_json(content)
+
+
+def get_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def matches_etag(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
+class ConditionalRoute(APIRoute):
+    """Route that tags successful GET responses with a strong ETag over the
+    body and answers a matching ``If-None-Match`` with an empty 304."""
+
+    cache_control = "private, no-cache"
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if "GET" not in self.methods:
+            return handler
+
+        async def conditional_handler(request: Request) -> Response:
+            response = await handler(request)
+            # streamed responses have no body to hash up front
+            if response.status_code != 200 or not hasattr(response, "body"):
+                return response
+
+            etag = get_etag(response.body)
+            # a handler may narrow the route's caching, e.g. for owner-only data
+            cache_control = response.headers.get("cache-control", self.cache_control)
+            headers = {"ETag": etag, "Cache-Control": cache_control}
+            if matches_etag(request, etag):
+                return Response(status_code=304, headers=headers)
+
+            response.headers.update(headers)
+            return response
+
+        return conditional_handler
+
+
+class PublicConditionalRoute(ConditionalRoute):
+    """ConditionalRoute for catalog reads that any cache may keep briefly."""
+
+    cache_control = f"public, max-age={settings.CATALOG_CACHE_CONTROL_MAX_AGE}"
@@ -0,0 +1,196 @@
+import collections
+import datetime
+
+from typing import Iterable
+
+from sqlalchemy import Date, cast, delete, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+from .models.db_models import DBSpendingRollup, DBTransaction
+
+
+settings = config.get_settings()
+
+ROLLUP_KEY = ("user_id", "day", "merchant_id")
+
+
+def get_buckets(transactions: Iterable) -> dict[tuple, list]:
+    """Sum transaction rows or objects into
+    ``{(user_id, day, merchant_id): [count, total]}``."""
+    buckets = collections.defaultdict(lambda: [0, 0.0])
+    for transaction in transactions:
+        # rows from before rollup_merchant_id existed only have merchant_id
+        key = (
+            transaction.user_id,
+            transaction.transaction_date.date(),
+            transaction.rollup_merchant_id or transaction.merchant_id or 0,
+        )
+        buckets[key][0] += 1
+        buckets[key][1] += transaction.total_price
+    return buckets
+
+
+def get_insert(session: AsyncSession):
+    if session.bind.dialect.name == "postgresql":
+        return postgresql.insert(DBSpendingRollup)
+    return sqlite.insert(DBSpendingRollup)
+
+
+async def add_buckets(session: AsyncSession, buckets: dict[tuple, list]):
+    if not buckets:
+        return
+
+    statement = get_insert(session)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_=dict(
+            count=DBSpendingRollup.count + statement.excluded.count,
+            total_price=DBSpendingRollup.total_price + statement.excluded.total_price,
+        ),
+    )
+    # one row per bucket and sorted, so concurrent writers lock in one order
+    await session.execute(
+        statement,
+        [
+            dict(zip(ROLLUP_KEY, key), count=count, total_price=total)
+            for key, (count, total) in sorted(buckets.items())
+        ],
+    )
+
+
+async def add_spending(session: AsyncSession, transactions: Iterable):
+    """Count ``transactions`` into their rollups inside the current
+    transaction, so the totals commit or roll back with the purchase."""
+    await add_buckets(session, get_buckets(transactions))
+
+
+async def remove_spending(session: AsyncSession, transaction: DBTransaction):
+    [(key, (count, total))] = get_buckets([transaction]).items()
+    where = [
+        getattr(DBSpendingRollup, column) == value
+        for column, value in zip(ROLLUP_KEY, key)
+    ]
+    await session.execute(
+        update(DBSpendingRollup)
+        .where(*where)
+        .values(
+            count=DBSpendingRollup.count - count,
+            total_price=DBSpendingRollup.total_price - total,
+        )
+    )
+    await session.execute(
+        delete(DBSpendingRollup).where(*where, DBSpendingRollup.count <= 0)
+    )
+
+
+def get_period(session: AsyncSession, granularity: str):
+    if granularity == "day":
+        return DBSpendingRollup.day
+    if session.bind.dialect.name == "postgresql":
+        return cast(func.date_trunc("month", DBSpendingRollup.day), Date)
+    return func.strftime("%Y-%m-01", DBSpendingRollup.day)
+
+
+async def get_spending(
+    session: AsyncSession,
+    user_id: int,
+    granularity: str,
+    from_date: datetime.date | None = None,
+    to_date: datetime.date | None = None,
+    merchant_id: int | None = None,
+) -> list:
+    """Spending of ``user_id`` per (period, merchant), newest period first,
+    read from the rollups only."""
+    period = get_period(session, granularity).label("period")
+    statement = select(
+        period,
+        DBSpendingRollup.merchant_id,
+        func.sum(DBSpendingRollup.count).label("count"),
+        func.sum(DBSpendingRollup.total_price).label("total_price"),
+    ).where(DBSpendingRollup.user_id == user_id)
+    if from_date is not None:
+        statement = statement.where(DBSpendingRollup.day >= from_date)
+    if to_date is not None:
+        statement = statement.where(DBSpendingRollup.day < to_date)
+    if merchant_id is not None:
+        statement = statement.where(DBSpendingRollup.merchant_id == merchant_id)
+
+    result = await session.exec(
+        statement.group_by(period, DBSpendingRollup.merchant_id).order_by(
+            period.desc(), DBSpendingRollup.merchant_id
+        )
+    )
+    return [
+        dict(row._mapping, merchant_id=row.merchant_id or None) for row in result.all()
+    ]
+
+
+async def get_range_end(session: AsyncSession, after: int, batch_size: int):
+    """Last user id of the chunk that starts after ``after`` and holds about
+    ``batch_size`` transactions, or None when the rest fits in one chunk."""
+    result = await session.exec(
+        select(DBTransaction.user_id)
+        .where(DBTransaction.user_id > after)
+        .order_by(DBTransaction.user_id)
+        .offset(batch_size - 1)
+        .limit(1)
+    )
+    return result.one_or_none()
+
+
+async def rebuild_range(session: AsyncSession, after: int, upto: int | None) -> int:
+    """Replace the rollups of users ``after < user_id <= upto`` with totals
+    recomputed from their transactions, as one short transaction."""
+    if session.bind.dialect.name == "postgresql":
+        # purchases and deletes of any user wait for this range only; SQLite
+        # takes its write lock with the DELETE
+        await session.execute(
+            text(f"LOCK TABLE {DBSpendingRollup.__tablename__} IN EXCLUSIVE MODE")
+        )
+
+    rollup_range = [DBSpendingRollup.user_id > after]
+    transaction_range = [DBTransaction.user_id > after]
+    if upto is not None:
+        rollup_range.append(DBSpendingRollup.user_id <= upto)
+        transaction_range.append(DBTransaction.user_id <= upto)
+
+    await session.execute(delete(DBSpendingRollup).where(*rollup_range))
+    result = await session.exec(
+        select(
+            DBTransaction.user_id,
+            DBTransaction.merchant_id,
+            DBTransaction.rollup_merchant_id,
+            DBTransaction.transaction_date,
+            DBTransaction.total_price,
+        ).where(*transaction_range)
+    )
+    transactions = result.all()
+    await add_spending(session, transactions)
+    await session.commit()
+
+    return len(transactions)
+
+
+async def rebuild(batch_size: int | None = None) -> int:
+    """Recompute every rollup from the raw transactions and return the number
+    of transactions counted.
+
+    Users are rebuilt in ranges of about ``batch_size`` transactions, each
+    committed on its own: readers see either the old or the new totals of a
+    user, and purchases only ever wait for the range being rebuilt.
+    """
+    batch_size = batch_size or settings.ROLLUP_REBUILD_BATCH_SIZE
+    counted = 0
+    after = 0
+
+    async with models.session_factory() as session:
+        while after is not None:
+            upto = await get_range_end(session, after, batch_size)
+            counted += await rebuild_range(session, after, upto)
+            after = upto
+
+    return counted
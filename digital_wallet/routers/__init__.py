@@ -1,4 +1,13 @@
-from . import items, merchants, wallets, transactions, users, authentication, root
+from . import (
+    items,
+    merchants,
+    wallets,
+    transactions,
+    users,
+    authentication,
+    root,
+    admin,
+)
 
 
 def init_routers(app):
@@ -9,3 +18,4 @@ def init_routers(app):
     app.include_router(transactions.router)
     app.include_router(users.router)
     app.include_router(authentication.router)
+    app.include_router(admin.router)
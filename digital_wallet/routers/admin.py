@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+
+from typing import Annotated
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .. import bulk
+from .. import models
+from .. import provisioning
+from .. import responses
+from .. import security
+
+from ..models.user import ProvisionResult
+
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    route_class=responses.ConditionalRoute,
+    dependencies=[Depends(security.get_current_admin_user)],
+)
+
+
+@router.post("/users/bulk")
+async def provision_users(
+    request: Request,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> ProvisionResult:
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    format = bulk.MEDIA_TYPES.get(media_type)
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson",
+        )
+
+    executor, workers = provisioning.get_provision_executor()
+    result = await provisioning.provision_users(
+        session, request.stream(), format, executor, workers
+    )
+
+    return responses.ModelResponse(ProvisionResult, result)
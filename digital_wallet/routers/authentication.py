@@ -37,7 +37,9 @@ async def login_for_access_token(
         raise HTTPException(status_code=404, detail="Incorrect username")
 
     db_user = db_user.dict()
-    user = security.authenticate_user(db_user, form_data.username, form_data.password)
+    user = await security.authenticate_user(
+        db_user, form_data.username, form_data.password
+    )
 
     if not user:
         raise HTTPException(
@@ -52,13 +54,14 @@ async def login_for_access_token(
     session.add(db_user)
     await session.commit()
     await session.refresh(db_user)
+    security.invalidate_user(db_user.id)
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": str(user.id)}, expires_delta=access_token_expires
     )
     refresh_token = security.create_refresh_token(
-        data={"sub": user.username},
+        data={"sub": str(user.id)},
         expires_delta=access_token_expires,
     )
 
@@ -70,5 +73,5 @@ async def login_for_access_token(
         expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
         expires_at=datetime.datetime.now() + access_token_expires,
         issued_at=user.last_login_date,
-        user_id=user.id,
+        user_id=str(user.id),
     )
@@ -1,24 +1,33 @@
-import math
-
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
 
 from typing import Annotated
 
-from sqlmodel import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .. import bulk
+from .. import catalog
 from .. import security
 from .. import models
+from .. import pagination
+from .. import responses
+from .. import search
 
-from ..models.item import Item, CreateItem, UpdateItem, ItemList
-from ..models.db_models import DBItem
+from ..models.item import Item, CreateItem, UpdateItem, ItemList, BulkItemResult
+from ..models.db_models import DBItem, DBMerchant
 from ..models.user import User
 
 
-router = APIRouter(prefix="/items", tags=["item"])
+router = APIRouter(
+    prefix="/items", tags=["item"], route_class=responses.PublicConditionalRoute
+)
 
 SIZE_PER_PAGE = 50
 
+ITEM_ORDER = (DBItem.id,)
+
 
 @router.post("/{merchant_id}")
 async def create_item(
@@ -29,38 +38,103 @@ async def create_item(
 ) -> Item:
     db_item = DBItem.model_validate(item)
     db_item.merchant_id = merchant_id
-    db_item.user = current_user
+    db_item.user_id = current_user.id
 
     session.add(db_item)
-    await session.commit()
+    await commit_item(session)
     await session.refresh(db_item)
+    pagination.invalidate_counts(("items",), ("merchant_items", merchant_id))
+    await catalog.invalidate_items((db_item.id, merchant_id))
+
+    return responses.ModelResponse(Item, db_item)
 
-    return Item.model_validate(db_item)
+
+async def commit_item(session: AsyncSession):
+    # the (merchant_id, sku) index rejects a SKU the merchant already uses
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This SKU is exists.",
+        )
+
+
+@router.post("/{merchant_id}/bulk")
+async def bulk_upsert_items(
+    request: Request,
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+) -> BulkItemResult:
+    media_type = request.headers.get("content-type", "").split(";")[0].strip()
+    format = bulk.MEDIA_TYPES.get(media_type)
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson",
+        )
+
+    db_merchant = await session.get(DBMerchant, merchant_id)
+    if db_merchant is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    if db_merchant.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    result = await bulk.import_items(
+        session, merchant_id, current_user.id, request.stream(), format
+    )
+    pagination.invalidate_counts(("items",), ("merchant_items", merchant_id))
+    await catalog.invalidate_merchant(merchant_id)
+
+    return responses.ModelResponse(BulkItemResult, result)
 
 
 @router.get("")
 async def get_items(
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
 ) -> ItemList:
+    statement = select(DBItem)
     result = await session.exec(
-        select(DBItem).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
+        pagination.paginate(statement, ITEM_ORDER, after, page, limit)
     )
-    db_items = result.all()
+    db_items, next_cursor = pagination.split_page(result.all(), ITEM_ORDER, limit)
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBItem.id)))).first() / SIZE_PER_PAGE
-        )
-    )
+    page_count = None
+    if include_total:
+        page_count = await pagination.count_pages(session, statement, ("items",), limit)
 
-    return ItemList.model_validate(
+    return responses.ModelResponse(
+        ItemList,
         dict(
             items=db_items,
-            page=page,
+            page=page if after is None else None,
             page_count=page_count,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
+    )
+
+
+@router.get("/search")
+async def search_items(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+) -> ItemList:
+    # declared before /{id}, which would take "search" for an id
+    db_rows, next_cursor = await search.search(session, DBItem, q, after, limit)
+
+    return responses.ModelResponse(
+        ItemList,
+        dict(items=db_rows, size_per_page=limit, next_cursor=next_cursor),
     )
 
 
@@ -69,11 +143,14 @@ async def get_item(
     item_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> Item:
-    db_item = await session.get(DBItem, item_id)
-    if db_item is None:
-        raise HTTPException(status_code=404, detail="Item not found")
+    async def load() -> bytes:
+        db_item = await session.get(DBItem, item_id)
+        if db_item is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        return responses.ModelResponse(Item, db_item).body
 
-    return Item.model_validate(db_item)
+    return await catalog.get_response(catalog.item_scope(item_id), "", load)
 
 
 @router.put("/{item_id}")
@@ -92,17 +169,19 @@ async def update_item(
     if db_item.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    # items stay with their merchant, whose sales counters include theirs
     merchant_id = db_item.merchant_id
 
     db_item.sqlmodel_update(data)
     db_item.merchant_id = merchant_id
     db_item.user_id = current_user.id
-    
+
     session.add(db_item)
-    await session.commit()
+    await commit_item(session)
     await session.refresh(db_item)
+    await catalog.invalidate_items((item_id, merchant_id))
 
-    return Item.model_validate(db_item)
+    return responses.ModelResponse(Item, db_item)
 
 
 @router.delete("/{item_id}")
@@ -111,7 +190,10 @@ async def delete_item(
     item_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
-    db_item = await session.get(DBItem, item_id)
+    # deleting detaches the item's transactions, so load them up front
+    db_item = await session.get(
+        DBItem, item_id, options=[selectinload(DBItem.transactions)]
+    )
 
     if db_item is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -121,5 +203,7 @@ async def delete_item(
 
     await session.delete(db_item)
     await session.commit()
+    pagination.invalidate_counts(("items",), ("merchant_items", db_item.merchant_id))
+    await catalog.invalidate_items((item_id, db_item.merchant_id))
 
     return dict(message="Item deleted successfully")
@@ -1,23 +1,41 @@
-import math
-
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 
 from typing import Annotated
 
-from sqlmodel import select, func
+from sqlalchemy import and_
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .. import catalog
 from .. import security
 from .. import models
-
-from ..models.merchant import Merchant, CreateMerchant, UpdateMerchant, MerchantList
+from .. import pagination
+from .. import responses
+from .. import search
+from .. import sales
+
+from ..models.merchant import (
+    Merchant,
+    CreateMerchant,
+    UpdateMerchant,
+    MerchantList,
+    Storefront,
+    MerchantSales,
+)
 from ..models.item import ItemList
 from ..models.db_models import DBMerchant, DBItem
 from ..models.user import User
 
-router = APIRouter(prefix="/merchants", tags=["merchant"])
+router = APIRouter(
+    prefix="/merchants", tags=["merchant"], route_class=responses.PublicConditionalRoute
+)
 
 SIZE_PER_PAGE = 50
+TOP_ITEMS = 10
+
+MERCHANT_ORDER = (DBMerchant.id,)
+ITEM_ORDER = (DBItem.id,)
 
 
 @router.post("")
@@ -27,7 +45,7 @@ async def create_merchant(
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> Merchant:
     db_merchant = DBMerchant.model_validate(merchant)
-    db_merchant.user = current_user
+    db_merchant.user_id = current_user.id
     db_merchant.first_name = current_user.first_name
     db_merchant.last_name = current_user.last_name
     db_merchant.email = current_user.email
@@ -36,34 +54,58 @@ async def create_merchant(
     session.add(db_merchant)
     await session.commit()
     await session.refresh(db_merchant)
+    pagination.invalidate_counts(("merchants",))
 
-    return Merchant.model_validate(db_merchant)
+    return responses.ModelResponse(Merchant, db_merchant)
 
 
 @router.get("")
 async def get_merchants(
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
 ) -> MerchantList:
+    statement = select(DBMerchant)
     result = await session.exec(
-        select(DBMerchant).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
+        pagination.paginate(statement, MERCHANT_ORDER, after, page, limit)
+    )
+    db_merchants, next_cursor = pagination.split_page(
+        result.all(), MERCHANT_ORDER, limit
     )
-    db_merchants = result.all()
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBMerchant.id)))).first()
-            / SIZE_PER_PAGE
+    page_count = None
+    if include_total:
+        page_count = await pagination.count_pages(
+            session, statement, ("merchants",), limit
         )
-    )
 
-    return MerchantList.model_validate(
+    return responses.ModelResponse(
+        MerchantList,
         dict(
             merchants=db_merchants,
-            page=page,
+            page=page if after is None else None,
             page_count=page_count,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
+    )
+
+
+@router.get("/search")
+async def search_merchants(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+) -> MerchantList:
+    # declared before /{id}, which would take "search" for an id
+    db_rows, next_cursor = await search.search(session, DBMerchant, q, after, limit)
+
+    return responses.ModelResponse(
+        MerchantList,
+        dict(merchants=db_rows, size_per_page=limit, next_cursor=next_cursor),
     )
 
 
@@ -71,45 +113,145 @@ async def get_merchants(
 async def get_merchant(
     merchant_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
 ) -> Merchant:
-    db_merchant = await session.get(DBMerchant, merchant_id)
-    if db_merchant is None:
-        raise HTTPException(status_code=404, detail="Item not found")
+    async def load() -> bytes:
+        db_merchant = await session.get(DBMerchant, merchant_id)
+        if db_merchant is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        return responses.ModelResponse(Merchant, db_merchant).body
 
-    return Merchant.model_validate(db_merchant)
+    return await catalog.get_response(catalog.merchant_scope(merchant_id), "", load)
 
 
 @router.get("/{merchant_id}/items")
 async def get_merchant_items(
     merchant_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
 ) -> ItemList:
-    db_merchant = await session.get(DBMerchant, merchant_id)
-    if db_merchant is None:
-        raise HTTPException(status_code=404, detail="Item not found")
+    async def load() -> bytes:
+        db_merchant = await session.get(DBMerchant, merchant_id)
+        if db_merchant is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        statement = select(DBItem).where(DBItem.merchant_id == merchant_id)
+        result = await session.exec(
+            pagination.paginate(statement, ITEM_ORDER, after, page, limit)
+        )
 
-    result = await session.exec(
-        select(DBItem)
-        .where(DBItem.merchant_id == merchant_id)
-        .offset((page - 1) * SIZE_PER_PAGE)
-        .limit(SIZE_PER_PAGE)
+        db_items, next_cursor = pagination.split_page(result.all(), ITEM_ORDER, limit)
+
+        page_count = None
+        if include_total:
+            page_count = await pagination.count_pages(
+                session, statement, ("merchant_items", merchant_id), limit
+            )
+
+        return responses.ModelResponse(
+            ItemList,
+            dict(
+                items=db_items,
+                page=page if after is None else None,
+                page_count=page_count,
+                size_per_page=limit,
+                next_cursor=next_cursor,
+            ),
+        ).body
+
+    return await catalog.get_response(
+        catalog.merchant_items_scope(merchant_id),
+        f"{page}:{after}:{limit}:{include_total}",
+        load,
     )
 
-    db_items = result.all()
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBItem.id)))).first() / SIZE_PER_PAGE
-        )
+@router.get("/{merchant_id}/storefront")
+async def get_storefront(
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
+) -> Storefront:
+    on = DBItem.merchant_id == DBMerchant.id
+    if after is not None:
+        # in the join, so the merchant row survives a page without items
+        on = and_(on, pagination.get_keyset_filter(ITEM_ORDER, after))
+
+    statement = (
+        select(DBMerchant, DBItem)
+        .outerjoin(DBItem, on)
+        .where(DBMerchant.id == merchant_id)
     )
+    if after is None:
+        statement = statement.offset((page - 1) * limit)
+    result = await session.exec(statement.order_by(*ITEM_ORDER).limit(limit + 1))
+    rows = result.all()
+
+    if rows:
+        db_merchant = rows[0][0]
+        db_items = [db_item for _, db_item in rows if db_item is not None]
+    else:
+        # an offset past the last item skips the merchant row as well
+        db_merchant = await session.get(DBMerchant, merchant_id)
+        db_items = []
 
-    return ItemList.model_validate(
+    if db_merchant is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    db_items, next_cursor = pagination.split_page(db_items, ITEM_ORDER, limit)
+
+    page_count = None
+    if include_total:
+        page_count = await pagination.count_pages(
+            session,
+            select(DBItem).where(DBItem.merchant_id == merchant_id),
+            ("merchant_items", merchant_id),
+            limit,
+        )
+
+    return responses.ModelResponse(
+        Storefront,
         dict(
+            db_merchant.model_dump(),
             items=db_items,
-            page=page,
+            page=page if after is None else None,
             page_count=page_count,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
+    )
+
+
+@router.get("/{merchant_id}/sales")
+async def get_merchant_sales(
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    top: Annotated[int, Query(ge=0, le=pagination.MAX_SIZE_PER_PAGE)] = TOP_ITEMS,
+) -> MerchantSales:
+    db_merchant = await session.get(DBMerchant, merchant_id)
+
+    if db_merchant is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    if db_merchant.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return responses.ModelResponse(
+        MerchantSales,
+        dict(
+            merchant_id=merchant_id,
+            units_sold=db_merchant.units_sold,
+            revenue=db_merchant.revenue,
+            top_items=await sales.get_top_items(session, merchant_id, top),
+        ),
+        # owner-only, unlike the rest of the catalog
+        headers={"Cache-Control": "private, no-cache"},
     )
 
 
@@ -144,8 +286,9 @@ async def update_merchant(
     session.add(db_merchant)
     await session.commit()
     await session.refresh(db_merchant)
+    await catalog.invalidate_merchant(merchant_id)
 
-    return Merchant.model_validate(db_merchant)
+    return responses.ModelResponse(Merchant, db_merchant)
 
 
 @router.delete("/{merchant_id}")
@@ -154,7 +297,15 @@ async def delete_merchant(
     merchant_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
-    db_merchant = await session.get(DBMerchant, merchant_id)
+    # deleting cascades to the items and detaches the transactions
+    db_merchant = await session.get(
+        DBMerchant,
+        merchant_id,
+        options=[
+            selectinload(DBMerchant.items).selectinload(DBItem.transactions),
+            selectinload(DBMerchant.transactions),
+        ],
+    )
 
     if db_merchant is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -162,7 +313,13 @@ async def delete_merchant(
     if db_merchant.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    item_ids = [db_item.id for db_item in db_merchant.items]
+
     await session.delete(db_merchant)
     await session.commit()
+    await catalog.invalidate_merchant(merchant_id, item_ids)
+    pagination.invalidate_counts(
+        ("merchants",), ("items",), ("merchant_items", merchant_id)
+    )
 
     return dict(message="Merchant deleted successfully")
@@ -1,9 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 
+from typing import Annotated
 
-router = APIRouter()
+from .. import catalog
+from .. import models
+from .. import responses
+from .. import security
+
+from ..models.user import User
+
+
+router = APIRouter(route_class=responses.ConditionalRoute)
 
 
 @router.get("/")
 async def index() -> dict:
-    return dict(message="Digital Wallet API")
\ No newline at end of file
+    return dict(message="Digital Wallet API")
+
+
+@router.get("/status/db-pool")
+async def get_db_pool_status(
+    current_user: Annotated[User, Depends(security.get_current_admin_user)],
+) -> dict:
+    return models.get_pool_stats()
+
+
+@router.get("/status/cache")
+async def get_cache_status(
+    current_user: Annotated[User, Depends(security.get_current_admin_user)],
+) -> dict:
+    return catalog.catalog_cache.stats()
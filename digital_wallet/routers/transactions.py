@@ -1,81 +1,104 @@
-import math
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 
-from typing import Annotated
+import datetime
 
-from sqlmodel import select, func
+from typing import Annotated, Literal
+
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from .. import catalog
+from .. import export
 from .. import security
 from .. import models
-
-from ..models.transaction import Transaction, CreateTransaction, TransactionList
-from ..models.db_models import DBTransaction, DBWallet, DBItem, DBMerchant
+from .. import idempotency
+from .. import ledger
+from .. import pagination
+from .. import responses
+from .. import purchase
+from .. import rollups
+from .. import sales
+
+from ..models.transaction import (
+    Transaction,
+    CreateTransaction,
+    TransactionList,
+    Checkout,
+    CreateCheckout,
+)
+from ..models.db_models import DBTransaction
 from ..models.user import User
 
-router = APIRouter(prefix="/transactions", tags=["transaction"])
+router = APIRouter(
+    prefix="/transactions", tags=["transaction"], route_class=responses.ConditionalRoute
+)
 
 SIZE_PER_PAGE = 50
 
+# newest first; the id breaks ties between rows with the same timestamp
+TRANSACTION_ORDER = (DBTransaction.transaction_date, DBTransaction.id)
+
 
 @router.post("/{buyer_wallet_id}/{vendor_wallet_id}/{item_id}")
 async def create_transaction(
+    request: Request,
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     transaction: CreateTransaction,
     buyer_wallet_id: int,
     vendor_wallet_id: int,
     item_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ) -> Transaction:
-    db_transaction = DBTransaction.model_validate(transaction)
-
-    db_buyer_wallet = await session.get(DBWallet, buyer_wallet_id)
-    db_vendor_wallet = await session.get(DBWallet, vendor_wallet_id)
-    db_item = await session.get(DBItem, item_id)
-    db_merchant = await session.get(DBMerchant, db_item.merchant_id)
-
-    if db_buyer_wallet is None or db_item is None:
-        raise HTTPException(status_code=404, detail="Item or Wallet not found")
-
-    if db_item.stock < db_transaction.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
-
-    total_price = db_item.price * db_transaction.quantity
-    if db_buyer_wallet.balance < total_price:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    db_buyer_wallet.balance -= total_price
-    db_vendor_wallet.balance += total_price
-    db_item.stock -= db_transaction.quantity
-
-    db_buyer_wallet.sqlmodel_update(db_buyer_wallet.dict())
-    db_vendor_wallet.sqlmodel_update(db_vendor_wallet.dict())
-    db_item.sqlmodel_update(db_item.dict())
-
-    db_transaction.wallet_id = buyer_wallet_id
-
-    db_transaction.total_price = total_price
-
-    db_transaction.item_name = db_item.name
-    db_transaction.item_id = item_id
+    result = await purchase.run_with_retry(
+        session,
+        idempotency.run,
+        current_user.id,
+        idempotency_key,
+        await idempotency.get_fingerprint(request),
+        Transaction,
+        purchase.purchase_item,
+        current_user,
+        buyer_wallet_id,
+        vendor_wallet_id,
+        item_id,
+        transaction.quantity,
+    )
+    pagination.invalidate_counts(("transactions", current_user.id))
+    if isinstance(result, Transaction):
+        await catalog.invalidate_stock([result])
 
-    db_transaction.merchant_first_name = db_merchant.first_name
-    db_transaction.merchant_last_name = db_merchant.last_name
-    db_transaction.merchant_id = db_merchant.id
+    return result
 
-    db_transaction.user_first_name = current_user.first_name
-    db_transaction.user_last_name = current_user.last_name
-    db_transaction.user = current_user
 
-    session.add(db_buyer_wallet)
-    session.add(db_vendor_wallet)
-    session.add(db_item)
-    session.add(db_transaction)
-    await session.commit()
-    await session.refresh(db_transaction)
+@router.post("/checkout")
+async def create_checkout(
+    request: Request,
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    checkout: CreateCheckout,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> Checkout:
+    result = await purchase.run_with_retry(
+        session,
+        idempotency.run,
+        current_user.id,
+        idempotency_key,
+        await idempotency.get_fingerprint(request),
+        Checkout,
+        purchase.checkout,
+        current_user,
+        checkout.buyer_wallet_id,
+        checkout.lines,
+    )
+    pagination.invalidate_counts(("transactions", current_user.id))
+    if isinstance(result, Checkout):
+        # a replayed response changed no stock
+        await catalog.invalidate_stock(result.transactions)
 
-    return Transaction.model_validate(db_transaction)
+    return result
 
 
 @router.get("/{transaction_id}")
@@ -88,7 +111,7 @@ async def get_transaction(
     if db_transaction is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    return Transaction.model_validate(db_transaction)
+    return responses.ModelResponse(Transaction, db_transaction)
 
 
 @router.get("/user/{user_id}")
@@ -96,32 +119,88 @@ async def get_transactions(
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     user_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
+    from_date: Annotated[datetime.datetime | None, Query(alias="from")] = None,
+    to_date: Annotated[datetime.datetime | None, Query(alias="to")] = None,
+    merchant_id: int | None = None,
+    item_id: int | None = None,
+    min_total: float | None = None,
 ) -> TransactionList:
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    result = await session.exec(
-        select(DBTransaction)
-        .where(DBTransaction.user_id == user_id)
-        .offset((page - 1) * SIZE_PER_PAGE)
-        .limit(SIZE_PER_PAGE)
+    # every filter narrows one of the (user_id, ..., transaction_date, id)
+    # indexes, so pages still come off an index in order
+    statement = select(DBTransaction).where(DBTransaction.user_id == user_id)
+    filters = dict(
+        from_date=from_date,
+        to_date=to_date,
+        merchant_id=merchant_id,
+        item_id=item_id,
+        min_total=min_total,
     )
+    if from_date is not None:
+        statement = statement.where(DBTransaction.transaction_date >= from_date)
+    if to_date is not None:
+        statement = statement.where(DBTransaction.transaction_date < to_date)
+    if merchant_id is not None:
+        statement = statement.where(DBTransaction.merchant_id == merchant_id)
+    if item_id is not None:
+        statement = statement.where(DBTransaction.item_id == item_id)
+    if min_total is not None:
+        statement = statement.where(DBTransaction.total_price >= min_total)
 
-    db_transactions = result.all()
+    result = await session.exec(
+        pagination.paginate(
+            statement, TRANSACTION_ORDER, after, page, limit, descending=True
+        )
+    )
 
-    pages = math.ceil(
-        (await session.exec(select(func.count(DBTransaction.id)))).first()
-        / SIZE_PER_PAGE
+    db_transactions, next_cursor = pagination.split_page(
+        result.all(), TRANSACTION_ORDER, limit
     )
 
-    return TransactionList.model_validate(
+    pages = None
+    if include_total:
+        key = ("transactions", user_id)
+        if any(value is not None for value in filters.values()):
+            # filtered totals are not invalidated on purchase and only
+            # expire with the count cache TTL
+            key += tuple(sorted((k, str(v)) for k, v in filters.items()))
+        pages = await pagination.count_pages(session, statement, key, limit)
+
+    return responses.ModelResponse(
+        TransactionList,
         dict(
             transactions=db_transactions,
-            page=page,
+            page=page if after is None else None,
             page_count=pages,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
+    )
+
+
+@router.get("/user/{user_id}/export")
+async def export_transactions(
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    user_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+) -> StreamingResponse:
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return StreamingResponse(
+        export.stream_transactions(user_id, format),
+        media_type=export.MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="transactions-{user_id}.{format}"'
+            )
+        },
     )
 
 
@@ -139,7 +218,11 @@ async def delete_transaction(
     if db_transaction.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    await rollups.remove_spending(session, db_transaction)
+    await sales.remove_sale(session, db_transaction)
+    await ledger.detach_transaction(session, transaction_id)
     await session.delete(db_transaction)
     await session.commit()
+    pagination.invalidate_counts(("transactions", current_user.id))
 
     return dict(message="Transaction deleted successfully")
@@ -1,20 +1,28 @@
-from typing import Annotated
+import datetime
+
+from typing import Annotated, Literal
 
 from jwt.exceptions import InvalidTokenError
 
-from fastapi import Depends, APIRouter, HTTPException, status, Request
+from fastapi import Depends, APIRouter, HTTPException, Query, status, Request
 
 
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .. import security
 
 from .. import models
+from .. import responses
+from .. import rollups
 from ..models.user import User, CreateUser, UpdateUser, ChangePassword
 from ..models.db_models import DBUser
+from ..models.spending import SpendingReport
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(
+    prefix="/users", tags=["users"], route_class=responses.ConditionalRoute
+)
 
 
 @router.post("/create")
@@ -33,15 +41,27 @@ async def create_user(
 
     data = user.dict()
     db_user = DBUser(**data)
-    db_user.hashed_password = security.get_password_hash(password)
+    db_user.hashed_password = await security.get_password_hash_async(password)
 
     session.add(db_user)
-    await session.commit()
+    await commit_user(session)
     await session.refresh(db_user)
 
     return db_user
 
 
+async def commit_user(session: AsyncSession):
+    # the unique indexes catch usernames and emails taken concurrently
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="This username or email is exists.",
+        )
+
+
 @router.get("/me", response_model=User)
 async def read_users_me(
     current_user: Annotated[User, Depends(security.get_current_active_user)],
@@ -49,6 +69,23 @@ async def read_users_me(
     return current_user
 
 
+@router.get("/me/spending")
+async def get_my_spending(
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    granularity: Literal["day", "month"] = "month",
+    from_date: Annotated[datetime.date | None, Query(alias="from")] = None,
+    to_date: Annotated[datetime.date | None, Query(alias="to")] = None,
+    merchant_id: int | None = None,
+) -> SpendingReport:
+    buckets = await rollups.get_spending(
+        session, current_user.id, granularity, from_date, to_date, merchant_id
+    )
+    return responses.ModelResponse(
+        SpendingReport, dict(granularity=granularity, buckets=buckets)
+    )
+
+
 @router.put("/{user_id}/change_password")
 async def change_password(
     user_id: int,
@@ -63,7 +100,7 @@ async def change_password(
             detail="User not found",
         )
 
-    if not security.verify_password(
+    if not await security.verify_password_async(
         password_update.current_password, user.hashed_password
     ):
         raise HTTPException(
@@ -71,10 +108,13 @@ async def change_password(
             detail="Password is incorrect",
         )
 
-    user.hashed_password = security.get_password_hash(password_update.new_password)
+    user.hashed_password = await security.get_password_hash_async(
+        password_update.new_password
+    )
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    security.invalidate_user(user.id)
     return {"message": "Password changed successfully"}
 
 
@@ -103,7 +143,8 @@ async def update_user(
 
     db_user.sqlmodel_update(user_update)
     session.add(db_user)
-    await session.commit()
+    await commit_user(session)
     await session.refresh(db_user)
+    security.invalidate_user(db_user.id)
 
     return db_user
@@ -1,67 +1,116 @@
-import math
+import datetime
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request
 
 from typing import Annotated
 
-from sqlmodel import select, func
+from sqlalchemy import delete
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from .. import security
 from .. import models
-
-from ..models.wallet import Wallet, CreateWallet, UpdateWallet, WalletList
-from ..models.db_models import DBWallet, DBMerchant, DBUser
+from .. import idempotency
+from .. import ledger
+from .. import pagination
+from .. import responses
+from .. import shards
+
+from ..models.wallet import (
+    Wallet,
+    CreateWallet,
+    UpdateWallet,
+    WalletList,
+    WalletBalance,
+)
+from ..models.db_models import DBWallet, DBWalletShard, DBMerchant, DBUser
 from ..models.user import User
 
-router = APIRouter(prefix="/wallets", tags=["wallet"])
+router = APIRouter(
+    prefix="/wallets", tags=["wallet"], route_class=responses.ConditionalRoute
+)
 
 SIZE_PER_PAGE = 50
 
+WALLET_ORDER = (DBWallet.id,)
+
 
 @router.post("")
 async def create_wallet(
+    request: Request,
     wallet: CreateWallet,
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ) -> Wallet:
+    result = await idempotency.run(
+        session,
+        current_user.id,
+        idempotency_key,
+        await idempotency.get_fingerprint(request),
+        Wallet,
+        add_wallet,
+        current_user,
+        wallet,
+    )
+    pagination.invalidate_counts(("wallets",), ("wallets", current_user.id))
+
+    return result
+
+
+async def add_wallet(
+    session: AsyncSession, current_user: User, wallet: CreateWallet
+) -> DBWallet:
     db_wallet = DBWallet.model_validate(wallet)
-    db_wallet.user = current_user
+    db_wallet.user_id = current_user.id
     db_wallet.owner_first_name = current_user.first_name
     db_wallet.owner_last_name = current_user.last_name
 
     session.add(db_wallet)
-    await session.commit()
-    await session.refresh(db_wallet)
+    await session.flush()
+
+    if db_wallet.sharded:
+        await shards.create_shards(session, db_wallet.id)
+
+    if db_wallet.balance:
+        await ledger.record_entries(
+            session, [ledger.make_entry(db_wallet.id, db_wallet.balance, "opening")]
+        )
 
-    return Wallet.model_validate(db_wallet)
+    return db_wallet
 
 
 @router.get("")
 async def get_wallets(
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
 ) -> WalletList:
+    statement = select(DBWallet)
     result = await session.exec(
-        select(DBWallet).offset((page - 1) * SIZE_PER_PAGE).limit(SIZE_PER_PAGE)
+        pagination.paginate(statement, WALLET_ORDER, after, page, limit)
     )
-    db_wallets = result.all()
+    db_wallets, next_cursor = pagination.split_page(result.all(), WALLET_ORDER, limit)
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBWallet.id)))).first()
-            / SIZE_PER_PAGE
+    page_count = None
+    if include_total:
+        page_count = await pagination.count_pages(
+            session, statement, ("wallets",), limit
         )
-    )
 
-    return WalletList.model_validate(
+    return responses.ModelResponse(
+        WalletList,
         dict(
-            items=db_wallets,
-            page=page,
+            items=await shards.get_wallets(session, db_wallets),
+            page=page if after is None else None,
             page_count=page_count,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
     )
 
 
@@ -78,7 +127,8 @@ async def get_wallet(
     if db_wallet.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    return Wallet.model_validate(db_wallet)
+    [wallet] = await shards.get_wallets(session, [db_wallet])
+    return responses.ModelResponse(Wallet, wallet)
 
 
 @router.get("/user/{user_id}")
@@ -86,46 +136,68 @@ async def get_wallets_by_user(
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     user_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
+    page: Annotated[int, Query(ge=1)] = 1,
+    after: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=pagination.MAX_SIZE_PER_PAGE)] = SIZE_PER_PAGE,
+    include_total: bool = True,
 ) -> WalletList:
 
     if current_user.id != user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    statement = select(DBWallet).where(DBWallet.user_id == user_id)
     result = await session.exec(
-        select(DBWallet)
-        .where(DBWallet.user_id == user_id)
-        .offset((page - 1) * SIZE_PER_PAGE)
-        .limit(SIZE_PER_PAGE)
+        pagination.paginate(statement, WALLET_ORDER, after, page, limit)
     )
 
-    db_wallets = result.all()
+    db_wallets, next_cursor = pagination.split_page(result.all(), WALLET_ORDER, limit)
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBWallet.id)))).first()
-            / SIZE_PER_PAGE
+    page_count = None
+    if include_total:
+        page_count = await pagination.count_pages(
+            session, statement, ("wallets", user_id), limit
         )
-    )
 
-    return WalletList.model_validate(
+    return responses.ModelResponse(
+        WalletList,
         dict(
-            items=db_wallets,
-            page=page,
+            items=await shards.get_wallets(session, db_wallets),
+            page=page if after is None else None,
             page_count=page_count,
-            size_per_page=SIZE_PER_PAGE,
-        )
+            size_per_page=limit,
+            next_cursor=next_cursor,
+        ),
     )
 
 
 @router.put("/{wallet_id}")
 async def update_wallet(
+    request: Request,
     wallet_id: int,
     wallet: UpdateWallet,
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
 ) -> Wallet:
+    return await idempotency.run(
+        session,
+        current_user.id,
+        idempotency_key,
+        await idempotency.get_fingerprint(request),
+        Wallet,
+        change_wallet,
+        current_user,
+        wallet_id,
+        wallet,
+    )
+
+
+async def change_wallet(
+    session: AsyncSession, current_user: User, wallet_id: int, wallet: UpdateWallet
+) -> DBWallet:
     data = wallet.model_dump()
+    if wallet.sharded is None:
+        del data["sharded"]
     db_wallet = await session.get(DBWallet, wallet_id)
 
     if db_wallet is None:
@@ -136,10 +208,16 @@ async def update_wallet(
             status_code=403, detail="Not authorized to update this wallet"
         )
 
+    if db_wallet.sharded:
+        # edits apply to the whole balance, so settle the sub-balances first
+        await shards.fold_shards(session, wallet_id)
+        await session.refresh(db_wallet)
+
     owner_first_name = db_wallet.owner_first_name
     owner_last_name = db_wallet.owner_last_name
     merchant_id = db_wallet.merchant_id
     user_id = db_wallet.user_id
+    balance = db_wallet.balance
 
     db_wallet.sqlmodel_update(data)
     db_wallet.owner_first_name = owner_first_name
@@ -148,10 +226,46 @@ async def update_wallet(
     db_wallet.user_id = user_id
 
     session.add(db_wallet)
-    await session.commit()
-    await session.refresh(db_wallet)
+    await session.flush()
+
+    if db_wallet.sharded:
+        await shards.create_shards(session, db_wallet.id)
+
+    if db_wallet.balance != balance:
+        await ledger.record_entries(
+            session,
+            [
+                ledger.make_entry(
+                    db_wallet.id, db_wallet.balance - balance, "adjustment"
+                )
+            ],
+        )
+
+    return db_wallet
+
+
+@router.get("/{wallet_id}/balance")
+async def get_wallet_balance(
+    wallet_id: int,
+    current_user: Annotated[User, Depends(security.get_current_active_user)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    at: datetime.datetime | None = None,
+) -> WalletBalance:
+    db_wallet = await session.get(DBWallet, wallet_id)
+    if db_wallet is None:
+        raise HTTPException(status_code=404, detail="Item not found")
 
-    return Wallet.model_validate(db_wallet)
+    if db_wallet.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    return responses.ModelResponse(
+        WalletBalance,
+        dict(
+            wallet_id=wallet_id,
+            balance=await ledger.get_balance(session, wallet_id, at),
+            at=at or datetime.datetime.now(),
+        ),
+    )
 
 
 @router.delete("/{wallet_id}")
@@ -160,7 +274,10 @@ async def delete_wallet(
     current_user: Annotated[User, Depends(security.get_current_active_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> dict:
-    db_wallet = await session.get(DBWallet, wallet_id)
+    # deleting detaches the wallet's transactions, so load them up front
+    db_wallet = await session.get(
+        DBWallet, wallet_id, options=[selectinload(DBWallet.transactions)]
+    )
 
     if db_wallet is None:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -170,7 +287,11 @@ async def delete_wallet(
             status_code=403, detail="Not authorized to delete this wallet"
         )
 
+    await session.execute(
+        delete(DBWalletShard).where(DBWalletShard.wallet_id == wallet_id)
+    )
     await session.delete(db_wallet)
     await session.commit()
+    pagination.invalidate_counts(("wallets",), ("wallets", current_user.id))
 
     return dict(message="Wallet deleted successfully")
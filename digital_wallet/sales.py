@@ -0,0 +1,134 @@
+import collections
+import math
+
+from typing import Iterable
+
+from sqlalchemy import bindparam, update
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models.db_models import DBItem, DBMerchant, DBTransaction
+
+
+# Item counters are bumped by the same UPDATE that takes the stock (see
+# purchase.take_stock and purchase.checkout); merchant counters here.
+
+
+async def add_sales(session: AsyncSession, transactions: Iterable[DBTransaction]):
+    """Add ``transactions`` to their merchants' counters, one row per
+    merchant, in ascending id order like every other lock in a purchase."""
+    sales = collections.defaultdict(lambda: [0, 0.0])
+    for transaction in transactions:
+        if transaction.merchant_id is not None:
+            sales[transaction.merchant_id][0] += transaction.quantity
+            sales[transaction.merchant_id][1] += transaction.total_price
+    if not sales:
+        return
+
+    merchants = DBMerchant.__table__
+    await session.execute(
+        update(merchants)
+        .where(merchants.c.id == bindparam("sold_merchant_id"))
+        .values(
+            units_sold=merchants.c.units_sold + bindparam("units"),
+            revenue=merchants.c.revenue + bindparam("amount"),
+        ),
+        [
+            dict(sold_merchant_id=merchant_id, units=units, amount=amount)
+            for merchant_id, (units, amount) in sorted(sales.items())
+        ],
+    )
+
+
+async def remove_sale(session: AsyncSession, transaction: DBTransaction):
+    for model, row_id in (
+        (DBItem, transaction.item_id),
+        (DBMerchant, transaction.merchant_id),
+    ):
+        if row_id is None:
+            continue
+        await session.execute(
+            update(model)
+            .where(model.id == row_id)
+            .values(
+                units_sold=model.units_sold - transaction.quantity,
+                revenue=model.revenue - transaction.total_price,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def get_top_items(
+    session: AsyncSession, merchant_id: int, limit: int
+) -> list[DBItem]:
+    # read off ix_items_merchant_id_units_sold backwards, never sorted
+    result = await session.exec(
+        select(DBItem)
+        .where(DBItem.merchant_id == merchant_id, DBItem.units_sold > 0)
+        .order_by(DBItem.units_sold.desc(), DBItem.id.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+def differs(counted: float, recomputed: float) -> bool:
+    return not math.isclose(counted, recomputed, rel_tol=1e-9, abs_tol=1e-6)
+
+
+async def check_sales(
+    session: AsyncSession, merchant_id: int | None = None
+) -> list[str]:
+    """Compare the item and merchant counters with totals recomputed from
+    the transactions; returns one line per counter that drifted."""
+    problems = []
+    for model, column in (
+        (DBItem, DBTransaction.item_id),
+        (DBMerchant, DBTransaction.merchant_id),
+    ):
+        statement = select(
+            column,
+            func.sum(DBTransaction.quantity),
+            func.sum(DBTransaction.total_price),
+        ).group_by(column)
+        counters = select(model.id, model.units_sold, model.revenue)
+        if merchant_id is not None:
+            statement = statement.where(DBTransaction.merchant_id == merchant_id)
+            scope = DBItem.merchant_id if model is DBItem else DBMerchant.id
+            counters = counters.where(scope == merchant_id)
+
+        result = await session.exec(statement)
+        recomputed = {row_id: (units, revenue) for row_id, units, revenue in result}
+
+        result = await session.exec(counters)
+        for row_id, units_sold, revenue in result:
+            units, amount = recomputed.get(row_id, (0, 0.0))
+            if units_sold != units or differs(revenue, amount):
+                problems.append(
+                    f"{model.__tablename__} {row_id}: counted {units_sold} units"
+                    f" / {revenue:.2f}, recomputed {units} / {amount:.2f}"
+                )
+
+    return problems
+
+
+async def recompute_sales(session: AsyncSession):
+    """Set every counter from the transactions with one UPDATE per table,
+    for data loaded around the purchase path and for databases upgraded to
+    the counters. Purchases committed while it runs may be missed."""
+    for model, column in (
+        (DBItem, DBTransaction.item_id),
+        (DBMerchant, DBTransaction.merchant_id),
+    ):
+        totals = select(DBTransaction).where(column == model.id)
+        await session.execute(
+            update(model)
+            .values(
+                units_sold=totals.with_only_columns(
+                    func.coalesce(func.sum(DBTransaction.quantity), 0)
+                ).scalar_subquery(),
+                revenue=totals.with_only_columns(
+                    func.coalesce(func.sum(DBTransaction.total_price), 0.0)
+                ).scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
+        )
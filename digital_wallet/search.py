@@ -0,0 +1,87 @@
+import re
+
+from sqlalchemy import Float, column, literal_column, or_, table, type_coerce
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import pagination
+from .models.search import get_search_text, get_search_vector
+
+
+MAX_TERMS = 8
+
+
+MIN_PREFIX = 3  # shorter prefixes match, and so rank, most of the catalog
+
+
+def get_terms(q: str) -> list[tuple[str, bool]]:
+    """Words of ``q`` with whether each is matched as a prefix: only the last
+    one, as it is usually still being typed."""
+    # words only: nothing from the query reaches the match syntax unquoted
+    words = re.findall(r"\w+", q.lower())[:MAX_TERMS]
+    return [
+        (word, i == len(words) - 1 and len(word) >= MIN_PREFIX)
+        for i, word in enumerate(words)
+    ]
+
+
+def get_sqlite_match(model, terms: list[tuple[str, bool]]):
+    name = f"{model.__tablename__}_search"
+    fts = table(name, column("rowid"), column("rank", Float))
+    # every term must match: "steel" "lap"*
+    query = " ".join(f'"{term}"*' if prefix else f'"{term}"' for term, prefix in terms)
+    # bm25 through the hidden rank column: lower is a better match
+    return (
+        fts,
+        fts.c.rowid == model.id,
+        literal_column(name).op("MATCH")(query),
+        fts.c.rank,
+    )
+
+
+def get_postgresql_match(model, terms: list[tuple[str, bool]]):
+    search_text = literal_column(get_search_text(model.__tablename__))
+    vector = literal_column(get_search_vector(model.__tablename__))
+    query = func.to_tsquery(
+        "simple",
+        " & ".join(f"{term}:*" if prefix else term for term, prefix in terms),
+    )
+    phrase = " ".join(term for term, _ in terms)
+    # the tsvector matches words and prefixes, the trigram index near misses
+    match = or_(vector.op("@@")(query), search_text.op("%")(phrase))
+    rank = -(func.ts_rank_cd(vector, query) + func.similarity(search_text, phrase))
+    return None, None, match, type_coerce(rank, Float)
+
+
+async def search(
+    session: AsyncSession, model, q: str, after: str | None, limit: int
+) -> tuple[list, str | None]:
+    """One page of ``model`` rows matching ``q``, best match first, and the
+    cursor of the next page. Ties in rank are broken by id."""
+    terms = get_terms(q)
+    if not terms:
+        return [], None
+
+    if session.bind.dialect.name == "postgresql":
+        fts, on, match, rank = get_postgresql_match(model, terms)
+    else:
+        fts, on, match, rank = get_sqlite_match(model, terms)
+
+    order = (rank, model.id)
+    statement = select(model, rank.label("rank"))
+    if fts is not None:
+        statement = statement.join(fts, on)
+    statement = statement.where(match)
+    if after is not None:
+        statement = statement.where(pagination.get_keyset_filter(order, after))
+
+    result = await session.exec(statement.order_by(*order).limit(limit + 1))
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last, last_rank = rows[-1]
+        next_cursor = pagination.encode_cursor(last_rank, last.id)
+
+    return [row for row, _ in rows], next_cursor
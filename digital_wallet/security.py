@@ -1,5 +1,8 @@
+import asyncio
 import datetime
+import os
 
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Annotated
 
 import jwt
@@ -10,13 +13,13 @@ from fastapi.security import OAuth2PasswordBearer
 
 from passlib.context import CryptContext
 
-from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from . import cache
 from . import config
 
 from . import models
-from .models.user import User, TokenData
+from .models.user import User
 from .models.db_models import DBUser
 
 ALGORITHM = "HS256"
@@ -27,6 +30,14 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 settings = config.get_settings()
 
+password_executor: Executor | None = None
+password_jobs = 0
+
+user_cache = cache.LRUCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
+token_cache = cache.LRUCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE)
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -36,17 +47,68 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+def get_password_workers() -> int:
+    return settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+
+
+def get_password_executor() -> Executor:
+    global password_executor
+    if password_executor is None:
+        if settings.PASSWORD_HASH_EXECUTOR == "process":
+            password_executor = ProcessPoolExecutor(max_workers=get_password_workers())
+        else:
+            password_executor = ThreadPoolExecutor(
+                max_workers=get_password_workers(), thread_name_prefix="password"
+            )
+
+    return password_executor
+
+
+def shutdown_password_executor():
+    global password_executor
+    if password_executor is not None:
+        password_executor.shutdown(wait=False, cancel_futures=True)
+        password_executor = None
+
+
+async def run_password_job(func, *args):
+    # bcrypt is deliberately slow, so keep it off the event loop and refuse
+    # new work once the pool and its queue are full.
+    global password_jobs
+    if password_jobs >= get_password_workers() + settings.PASSWORD_HASH_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+
+    password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_executor(), func, *args)
+    finally:
+        password_jobs -= 1
+
+
+async def verify_password_async(plain_password, hashed_password):
+    return await run_password_job(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password):
+    return await run_password_job(get_password_hash, password)
+
+
 def get_user(db, username: str):
     if username in db.values():
         return DBUser(**db)
 
 
-def authenticate_user(db, username: str, password: str):
+async def authenticate_user(db, username: str, password: str):
     user = get_user(db, username)
     if not user:
         return False
 
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
 
     return user
@@ -81,36 +143,56 @@ def create_refresh_token(
     return encoded_jwt
 
 
+def decode_token(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+
+    # Keep the payload no longer than the token itself is valid.
+    ttl = None
+    if "exp" in payload:
+        ttl = (
+            payload["exp"] - datetime.datetime.now(tz=datetime.timezone.utc).timestamp()
+        )
+
+    token_cache.set(token, payload, ttl=ttl)
+    return payload
+
+
+def invalidate_user(user_id: int):
+    user_cache.delete(user_id)
+
+
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
     session: Annotated[AsyncSession, Depends(models.get_session)],
 ) -> User:
-    settings = config.get_settings()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = str(payload.get("sub"))
-        if username is None:
+        payload = decode_token(token)
+        user_id = payload.get("sub")
+        if user_id is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except InvalidTokenError:
+        user_id = int(user_id)
+    except (InvalidTokenError, ValueError):
         raise credentials_exception
 
-    result = await session.exec(
-        select(DBUser).where(DBUser.id == int(token_data.username))
-    )
-
-    db_user = result.one_or_none()
-    db_user = db_user.model_dump()
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
 
+    db_user = await session.get(DBUser, user_id)
     if db_user is None:
         raise credentials_exception
 
-    user = await session.get(DBUser, db_user["id"])
+    user = User.model_validate(db_user)
+    user_cache.set(user_id, user)
     return user
 
 
@@ -121,3 +203,12 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
 
     return current_user
+
+
+async def get_current_admin_user(
+    current_user: Annotated[User, Depends(get_current_active_user)],
+):
+    if current_user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    return current_user
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import os
+
+import uvicorn
+
+from . import config
+from . import models
+from . import rollups
+from . import sales
+
+
+APP = "digital_wallet.main:create_app"
+
+
+def get_workers(settings) -> int:
+    return settings.SERVER_WORKERS or os.cpu_count() or 1
+
+
+def serve(args: argparse.Namespace):
+    # uvloop and httptools are picked by "auto" whenever they are installed,
+    # and the supervisor forwards SIGTERM so every worker stops accepting,
+    # finishes in-flight requests and runs the lifespan shutdown.
+    uvicorn.run(
+        APP,
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+    )
+
+
+def rebuild_rollups(args: argparse.Namespace):
+    async def run():
+        models.init_db(config.get_settings())
+        try:
+            counted = await rollups.rebuild(args.batch_size)
+        finally:
+            await models.close_session()
+        print(f"rebuilt spending rollups from {counted} transactions")
+
+    asyncio.run(run())
+
+
+def check_sales(args: argparse.Namespace):
+    async def run() -> list[str]:
+        models.init_db(config.get_settings())
+        try:
+            async with models.session_factory() as session:
+                return await sales.check_sales(session, args.merchant_id)
+        finally:
+            await models.close_session()
+
+    problems = asyncio.run(run())
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} sales counters differ from the transactions")
+    if problems:
+        raise SystemExit(1)
+
+
+def recompute_sales(args: argparse.Namespace):
+    async def run():
+        models.init_db(config.get_settings())
+        try:
+            async with models.session_factory() as session:
+                await sales.recompute_sales(session)
+                await session.commit()
+        finally:
+            await models.close_session()
+        print("recomputed sales counters from the transactions")
+
+    asyncio.run(run())
+
+
+def get_parser() -> argparse.ArgumentParser:
+    settings = config.get_settings()
+
+    parser = argparse.ArgumentParser(prog="digital_wallet")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the API with N workers")
+    serve_parser.add_argument("--host", default=settings.SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=get_workers(settings),
+        help="worker processes (default: SERVER_WORKERS or the CPU count)",
+    )
+    serve_parser.add_argument(
+        "--loop", choices=["auto", "uvloop", "asyncio"], default="auto"
+    )
+    serve_parser.add_argument(
+        "--http", choices=["auto", "httptools", "h11"], default="auto"
+    )
+    serve_parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        help="seconds to drain in-flight requests on shutdown",
+    )
+    serve_parser.set_defaults(handler=serve)
+
+    rollup_parser = commands.add_parser(
+        "rebuild-rollups",
+        help="recompute spending rollups from transactions, one user range at a time",
+    )
+    rollup_parser.add_argument(
+        "--batch-size", type=int, default=settings.ROLLUP_REBUILD_BATCH_SIZE
+    )
+    rollup_parser.set_defaults(handler=rebuild_rollups)
+
+    sales_parser = commands.add_parser(
+        "check-sales", help="compare sales counters with the transactions"
+    )
+    sales_parser.add_argument("--merchant-id", type=int, default=None)
+    sales_parser.set_defaults(handler=check_sales)
+
+    recompute_parser = commands.add_parser(
+        "recompute-sales",
+        help="set the sales counters from the transactions, e.g. after upgrading "
+        "a database with past sales (run with purchases stopped)",
+    )
+    recompute_parser.set_defaults(handler=recompute_sales)
+
+    return parser
+
+
+def main(argv: list[str] | None = None):
+    args = get_parser().parse_args(argv)
+    args.handler(args)
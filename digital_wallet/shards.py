@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import zlib
+
+from sqlalchemy import bindparam, insert, update
+from sqlmodel import select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import models
+from .models.db_models import DBWallet, DBWalletShard
+from .models.wallet import Wallet
+
+
+logger = logging.getLogger(__name__)
+
+settings = config.get_settings()
+
+
+def pick_shard(key: int) -> int:
+    """Sub-balance that credits keyed by ``key`` (the paying wallet) land on."""
+    return zlib.crc32(str(key).encode()) % settings.WALLET_SHARD_COUNT
+
+
+async def create_shards(session: AsyncSession, wallet_id: int):
+    """Make sure ``wallet_id`` has all of its sub-balance rows."""
+    result = await session.exec(
+        select(DBWalletShard.shard).where(DBWalletShard.wallet_id == wallet_id)
+    )
+    existing = set(result.all())
+    missing = [
+        dict(wallet_id=wallet_id, shard=shard, balance=0.0)
+        for shard in range(settings.WALLET_SHARD_COUNT)
+        if shard not in existing
+    ]
+    if missing:
+        await session.execute(insert(DBWalletShard), missing)
+
+
+async def credit_shard(
+    session: AsyncSession, wallet_id: int, amount: float, key: int
+) -> bool:
+    result = await session.execute(
+        update(DBWalletShard)
+        .where(
+            DBWalletShard.wallet_id == wallet_id,
+            DBWalletShard.shard == pick_shard(key),
+        )
+        .values(balance=DBWalletShard.balance + amount)
+        .returning(DBWalletShard.id)
+    )
+    return result.one_or_none() is not None
+
+
+async def fold_shards(session: AsyncSession, wallet_id: int) -> float:
+    """Move everything credited to the sub-balances of ``wallet_id`` into
+    ``DBWallet.balance`` inside the current transaction.
+
+    The wallet row is locked before its shards are read, the same order
+    purchases use, so two folds of one wallet run one after the other and
+    the second only sees what the first left behind. Each shard only gives
+    up the amount read here so credits that land in the meantime are kept
+    for the next fold.
+    """
+    # a write rather than SELECT ... FOR UPDATE so SQLite takes its write
+    # lock here as well
+    await session.execute(
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id)
+        .values(balance=DBWallet.balance)
+        .execution_options(synchronize_session=False)
+    )
+
+    result = await session.exec(
+        select(DBWalletShard.shard, DBWalletShard.balance)
+        .where(DBWalletShard.wallet_id == wallet_id, DBWalletShard.balance != 0)
+        .order_by(DBWalletShard.shard)
+    )
+    taken = result.all()
+    if not taken:
+        return 0
+
+    total = sum(balance for _, balance in taken)
+    await session.execute(
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id)
+        .values(balance=DBWallet.balance + total)
+        .execution_options(synchronize_session=False)
+    )
+
+    shards = DBWalletShard.__table__
+    await session.execute(
+        update(shards)
+        .where(
+            shards.c.wallet_id == bindparam("folded_wallet_id"),
+            shards.c.shard == bindparam("folded_shard"),
+        )
+        .values(balance=shards.c.balance - bindparam("taken")),
+        [
+            dict(folded_wallet_id=wallet_id, folded_shard=shard, taken=balance)
+            for shard, balance in taken
+        ],
+    )
+
+    return total
+
+
+async def fold_all_shards(session: AsyncSession) -> int:
+    """Fold every wallet with pending credits, committing one wallet at a time
+    so no lock is held longer than a single wallet needs; returns how many
+    wallets were folded."""
+    result = await session.exec(
+        select(DBWalletShard.wallet_id)
+        .where(DBWalletShard.balance != 0)
+        .group_by(DBWalletShard.wallet_id)
+        .order_by(DBWalletShard.wallet_id)
+    )
+    wallet_ids = result.all()
+
+    for wallet_id in wallet_ids:
+        await fold_shards(session, wallet_id)
+        await session.commit()
+
+    return len(wallet_ids)
+
+
+async def get_wallets(session: AsyncSession, db_wallets: list[DBWallet]) -> list:
+    """``db_wallets`` as API models, with unfolded credits added to the
+    balance of sharded wallets."""
+    sharded = [db_wallet.id for db_wallet in db_wallets if db_wallet.sharded]
+
+    pending = {}
+    if sharded:
+        result = await session.exec(
+            select(DBWalletShard.wallet_id, func.sum(DBWalletShard.balance))
+            .where(DBWalletShard.wallet_id.in_(sharded))
+            .group_by(DBWalletShard.wallet_id)
+        )
+        pending = dict(result.all())
+
+    wallets = []
+    for db_wallet in db_wallets:
+        wallet = Wallet.model_validate(db_wallet.model_dump())
+        if db_wallet.id in pending:
+            wallet.balance += pending[db_wallet.id]
+        wallets.append(wallet)
+
+    return wallets
+
+
+async def fold_sharded_wallets():
+    while True:
+        await asyncio.sleep(settings.WALLET_SHARD_FOLD_INTERVAL_SECONDS)
+        try:
+            async with models.session_factory() as session:
+                await fold_all_shards(session)
+        except Exception:
+            logger.exception("Could not fold wallet shards")
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import pathlib
+import tempfile
+import time
+import tracemalloc
+
+from httpx import ASGITransport, AsyncClient
+
+from digital_wallet import config, main, models
+
+
+# Onboarding a catalog through POST /items/{merchant_id}/bulk against one
+# POST /items/{merchant_id} per SKU, in-process on SQLite:
+#   python performance-tests/bench_bulk_import.py --items 50000 [--trace-memory]
+# Tracing memory slows the import down about twofold.
+SINGLE_POSTS = 200
+PASSWORD = "123456"
+
+
+async def setup(client: AsyncClient) -> tuple[dict, int]:
+    await client.post(
+        "/users/create",
+        params={"password": PASSWORD},
+        json={
+            "email": "importer@email.local",
+            "telephone": "0812345678",
+            "username": "importer",
+            "first_name": "Import",
+            "last_name": "User",
+        },
+    )
+    res = await client.post(
+        "/token", data={"username": "importer", "password": PASSWORD}
+    )
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+    res = await client.post("/merchants", json={}, headers=headers)
+    return headers, res.json()["id"]
+
+
+async def generate_csv(items: int, prefix: str):
+    yield b"sku,name,description,price,stock\n"
+    for start in range(0, items, 1_000):
+        yield "".join(
+            f"{prefix}-{i},Item {i},Synthetic item number {i},{i % 500 + 0.99},{i % 50}\n"
+            for i in range(start, min(start + 1_000, items))
+        ).encode()
+
+
+async def run(items: int, trace_memory: bool):
+    with tempfile.TemporaryDirectory() as directory:
+        settings = config.Settings(
+            SQLDB_URL=f"sqlite+aiosqlite:///{pathlib.Path(directory) / 'import.db'}",
+            SECRET_KEY="bench",
+        )
+        app = main.create_app(settings)
+        await models.recreate_table()
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            headers, merchant_id = await setup(client)
+
+            start = time.perf_counter()
+            for i in range(SINGLE_POSTS):
+                await client.post(
+                    f"/items/{merchant_id}",
+                    json={"name": f"Single {i}", "sku": f"single-{i}", "price": 1},
+                    headers=headers,
+                )
+            single = (time.perf_counter() - start) / SINGLE_POSTS
+            print(
+                f"single POSTs   {1 / single:10.0f} items/s"
+                f" ({single * items:.0f}s for {items} items)"
+            )
+
+            for label in ("bulk insert", "bulk update"):
+                if trace_memory:
+                    tracemalloc.start()
+                start = time.perf_counter()
+                res = await client.post(
+                    f"/items/{merchant_id}/bulk",
+                    content=generate_csv(items, "sku"),
+                    headers=dict(headers, **{"Content-Type": "text/csv"}),
+                )
+                elapsed = time.perf_counter() - start
+                assert res.json()["imported"] == items, res.text
+
+                line = f"{label:<14} {items / elapsed:10.0f} items/s ({elapsed:.1f}s"
+                if trace_memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    line += f", peak {peak / 2**20:.1f} MiB traced"
+                print(line + ")")
+
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50_000)
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.trace_memory))
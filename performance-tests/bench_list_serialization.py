@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from digital_wallet import config, main, models, responses
+
+
+# CPU time spent turning one 50-row GET /items page into response bytes,
+# through FastAPI's return-annotation path and through ModelResponse:
+#   python performance-tests/bench_list_serialization.py
+ROWS = 50
+REQUESTS = 2_000
+
+
+def get_page() -> dict:
+    db_items = [
+        models.DBItem(
+            id=i,
+            name=f"item {i}",
+            description="Item Description",
+            price=100 + i / 100,
+            stock=i,
+            tax=0.07,
+            user_id=1,
+            merchant_id=1,
+        )
+        for i in range(1, ROWS + 1)
+    ]
+    return dict(items=db_items, page=1, page_count=20, size_per_page=ROWS)
+
+
+async def render_with_annotation(field, page: dict) -> bytes:
+    # what FastAPI does with a returned model: dump, validate again, encode
+    content = await serialize_response(
+        field=field, response_content=models.ItemList.model_validate(page)
+    )
+    return JSONResponse(content).body
+
+
+def render_with_model_response(page: dict) -> bytes:
+    return responses.ModelResponse(models.ItemList, page).body
+
+
+def measure(name: str, render):
+    start = time.process_time()
+    for _ in range(REQUESTS):
+        render()
+    elapsed = time.process_time() - start
+    print(f"{name:<20} {elapsed / REQUESTS * 1e6:8.1f} us CPU per request")
+    return elapsed
+
+
+def run():
+    app = main.create_app(config.get_settings())
+    [route] = [
+        route
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        and route.path == "/items"
+        and "GET" in route.methods
+    ]
+    page = get_page()
+    loop = asyncio.new_event_loop()
+
+    assert json.loads(
+        loop.run_until_complete(render_with_annotation(route.response_field, page))
+    ) == json.loads(render_with_model_response(page))
+
+    before = measure(
+        "return annotation",
+        lambda: loop.run_until_complete(
+            render_with_annotation(route.response_field, page)
+        ),
+    )
+    after = measure("ModelResponse", lambda: render_with_model_response(page))
+    print(f"speedup {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    run()
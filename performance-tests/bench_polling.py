@@ -0,0 +1,88 @@
+import asyncio
+import pathlib
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+
+from digital_wallet import config, main, models
+
+
+# Clients polling unchanged resources, with and without If-None-Match.
+# Reports response bytes and server CPU per poll, in-process on SQLite:
+#   python performance-tests/bench_polling.py
+POLLS = 500
+ITEMS = 50
+PASSWORD = "123456"
+
+
+async def setup(client: AsyncClient) -> tuple[dict, list[str]]:
+    await client.post(
+        "/users/create",
+        params={"password": PASSWORD},
+        json={
+            "email": "poller@email.local",
+            "telephone": "0812345678",
+            "username": "poller",
+            "first_name": "Poll",
+            "last_name": "User",
+        },
+    )
+    res = await client.post("/token", data={"username": "poller", "password": PASSWORD})
+    user_id = res.json()["user_id"]
+    headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+    res = await client.post("/merchants", json={}, headers=headers)
+    for i in range(ITEMS):
+        await client.post(
+            f"/items/{res.json()['id']}", json={"name": f"item {i}"}, headers=headers
+        )
+
+    res = await client.post(
+        "/wallets", json={"describe": "polled", "balance": 100}, headers=headers
+    )
+    urls = ["/items", f"/wallets/{res.json()['id']}", f"/transactions/user/{user_id}"]
+    return headers, urls
+
+
+async def poll(client: AsyncClient, headers: dict, url: str, conditional: bool):
+    etag = None
+    size = 0
+    start = time.process_time()
+    for _ in range(POLLS):
+        request_headers = dict(headers)
+        if conditional and etag is not None:
+            request_headers["If-None-Match"] = etag
+        res = await client.get(url, headers=request_headers)
+        etag = res.headers.get("etag")
+        size += len(res.content)
+    elapsed = time.process_time() - start
+
+    mode = "If-None-Match" if conditional else "plain"
+    print(
+        f"{url:<28} {mode:<14} {size / POLLS:8.0f} bytes"
+        f" {elapsed / POLLS * 1e6:8.0f} us CPU per poll"
+    )
+
+
+async def run():
+    with tempfile.TemporaryDirectory() as directory:
+        settings = config.Settings(
+            SQLDB_URL=f"sqlite+aiosqlite:///{pathlib.Path(directory) / 'poll.db'}",
+            SECRET_KEY="bench",
+        )
+        app = main.create_app(settings)
+        await models.recreate_table()
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            headers, urls = await setup(client)
+            for url in urls:
+                for conditional in (False, True):
+                    await poll(client, headers, url, conditional)
+
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
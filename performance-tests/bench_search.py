@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import pathlib
+import random
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert, or_
+from sqlmodel import select
+
+from digital_wallet import config, main, models
+
+
+# GET /items/search on a synthetic catalog against the LIKE scan clients
+# would otherwise need, in-process on SQLite:
+#   python performance-tests/bench_search.py --items 1000000
+CHUNK = 50_000
+REQUESTS = 50
+# zero-padded so, like real words, few terms share a long prefix
+ADJECTIVES = [f"adj{i:03d}" for i in range(300)]
+NOUNS = [f"noun{i:04d}" for i in range(2_000)]
+QUERIES = ["noun0017", "adj003 noun0001", "adj299 noun1999", "noun001", "adj02"]
+
+
+async def fill(items: int, seed: int):
+    rng = random.Random(seed)
+    async with models.engine.begin() as conn:
+        for offset in range(0, items, CHUNK):
+            await conn.execute(
+                insert(models.DBItem),
+                [
+                    dict(
+                        name=f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}",
+                        description=" ".join(rng.choices(NOUNS, k=8)),
+                        price=round(rng.uniform(1, 500), 2),
+                        stock=100,
+                        merchant_id=rng.randint(1, 1_000),
+                    )
+                    for _ in range(min(CHUNK, items - offset))
+                ],
+            )
+
+
+async def measure_search(client: AsyncClient, q: str) -> float:
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        response = await client.get("/items/search", params={"q": q, "limit": 50})
+        assert response.status_code == 200, response.text
+    return (time.perf_counter() - start) / REQUESTS
+
+
+async def measure_like(q: str) -> float:
+    # what a client filtering by name/description would make the server do
+    conditions = [
+        or_(models.DBItem.name.contains(term), models.DBItem.description.contains(term))
+        for term in q.split()
+    ]
+    runs = 5
+    start = time.perf_counter()
+    async with models.session_factory() as session:
+        for _ in range(runs):
+            result = await session.exec(
+                select(models.DBItem).where(*conditions).limit(50)
+            )
+            result.all()
+    return (time.perf_counter() - start) / runs
+
+
+async def run(items: int, seed: int):
+    with tempfile.TemporaryDirectory() as directory:
+        settings = config.Settings(
+            SQLDB_URL=f"sqlite+aiosqlite:///{pathlib.Path(directory) / 'search.db'}",
+            SECRET_KEY="bench",
+        )
+        app = main.create_app(settings)
+        await models.recreate_table()
+
+        start = time.perf_counter()
+        await fill(items, seed)
+        print(f"{items} items indexed in {time.perf_counter() - start:.1f}s")
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'query':<18} {'search':>10} {'LIKE scan':>12}")
+            for q in QUERIES:
+                searched = await measure_search(client, q)
+                scanned = await measure_like(q)
+                print(f"{q:<18} {searched * 1e3:7.2f} ms {scanned * 1e3:9.2f} ms")
+
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.seed))
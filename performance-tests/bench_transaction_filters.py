@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import datetime
+import pathlib
+import random
+import tempfile
+import time
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert, text
+
+from digital_wallet import config, main, models
+
+
+# Filtered transaction history on a synthetic table, with and without the
+# (user_id, merchant_id|item_id, transaction_date, id) indexes, on SQLite:
+#   python performance-tests/bench_transaction_filters.py --rows 5000000
+USERS = 1_000
+MERCHANTS = 200
+ITEMS = 5_000
+CHUNK = 50_000
+REQUESTS = 200
+PASSWORD = "123456"
+FILTER_INDEXES = [
+    "ix_transactions_user_id_merchant_id_transaction_date",
+    "ix_transactions_user_id_item_id_transaction_date",
+]
+
+
+async def fill(rows: int, user_id: int, seed: int):
+    # one heavy user holds a tenth of the table, the rest is spread out
+    rng = random.Random(seed)
+    start = datetime.datetime(2020, 1, 1)
+    async with models.engine.begin() as conn:
+        for offset in range(0, rows, CHUNK):
+            await conn.execute(
+                insert(models.DBTransaction),
+                [
+                    dict(
+                        user_id=(
+                            user_id if rng.random() < 0.1 else rng.randint(2, USERS)
+                        ),
+                        merchant_id=rng.randint(1, MERCHANTS),
+                        item_id=rng.randint(1, ITEMS),
+                        total_price=round(rng.uniform(1, 500), 2),
+                        quantity=1,
+                        transaction_date=start
+                        + datetime.timedelta(seconds=rng.randint(0, 3 * 365 * 86400)),
+                    )
+                    for _ in range(min(CHUNK, rows - offset))
+                ],
+            )
+        await conn.execute(text("ANALYZE"))
+
+
+async def measure(client: AsyncClient, headers: dict, url: str, params: dict) -> float:
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        response = await client.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+    return (time.perf_counter() - start) / REQUESTS
+
+
+async def run(rows: int, seed: int):
+    with tempfile.TemporaryDirectory() as directory:
+        settings = config.Settings(
+            SQLDB_URL=f"sqlite+aiosqlite:///{pathlib.Path(directory) / 'filters.db'}",
+            SECRET_KEY="bench",
+        )
+        app = main.create_app(settings)
+        await models.recreate_table()
+
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post(
+                "/users/create",
+                params={"password": PASSWORD},
+                json={
+                    "email": "history@email.local",
+                    "telephone": "0812345678",
+                    "username": "history",
+                    "first_name": "History",
+                    "last_name": "User",
+                },
+            )
+            res = await client.post(
+                "/token", data={"username": "history", "password": PASSWORD}
+            )
+            user_id = res.json()["user_id"]
+            headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+            start = time.perf_counter()
+            await fill(rows, user_id, seed)
+            print(f"{rows} rows inserted in {time.perf_counter() - start:.1f}s")
+
+            url = f"/transactions/user/{user_id}"
+            cases = {
+                "recent page": {},
+                "one month": {"from": "2021-06-01", "to": "2021-07-01"},
+                "merchant": {"merchant_id": 7},
+                "item": {"item_id": 42},
+                "merchant + range": {
+                    "merchant_id": 7,
+                    "from": "2021-01-01",
+                    "to": "2022-01-01",
+                },
+                "min_total": {"min_total": 490},
+            }
+            timings = {}
+            for name, params in cases.items():
+                params = dict(params, include_total="false")
+                timings[name] = await measure(client, headers, url, params)
+
+            async with models.engine.begin() as conn:
+                for index in FILTER_INDEXES:
+                    await conn.execute(text(f"DROP INDEX {index}"))
+
+            print(f"{'filter':<18} {'indexed':>12} {'user index only':>16}")
+            for name, params in cases.items():
+                params = dict(params, include_total="false")
+                fallback = await measure(client, headers, url, params)
+                print(
+                    f"{name:<18} {timings[name] * 1e3:9.2f} ms {fallback * 1e3:13.2f} ms"
+                )
+
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.seed))
@@ -0,0 +1,83 @@
+import argparse
+import json
+import sys
+
+
+# Compares two --summary-file outputs of test_journeys.py route by route and
+# exits non-zero when the second run regressed. Runs are only comparable
+# with the same users, spawn rate, duration and dataset:
+#   python performance-tests/compare_summaries.py before.json after.json --tolerance 0.1
+LATENCIES = ("p50", "p95", "p99")
+
+
+def get_regressions(
+    before: dict, after: dict, tolerance: float, min_ms: float, min_requests: int
+) -> list[str]:
+    regressions = []
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        # too few samples for the upper percentiles to mean anything
+        if min(old["requests"], new["requests"]) < min_requests:
+            continue
+        for key in LATENCIES:
+            if new[key] > max(old[key] * (1 + tolerance), old[key] + min_ms):
+                regressions.append(f"{name}: {key} {old[key]} -> {new[key]} ms")
+        if new["rps"] < old["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: rps {old['rps']} -> {new['rps']}")
+        old_rate = old["failures"] / max(old["requests"], 1)
+        new_rate = new["failures"] / max(new["requests"], 1)
+        if new_rate > old_rate + tolerance / 100:
+            regressions.append(f"{name}: failure rate {old_rate:.2%} -> {new_rate:.2%}")
+
+    return regressions
+
+
+def print_table(before: dict, after: dict):
+    print(f"{'route':<52} {'rps':>19} " + " ".join(f"{key:>17}" for key in LATENCIES))
+    for name in sorted(before.keys() | after.keys()):
+        old, new = before.get(name), after.get(name)
+        if old is None or new is None:
+            print(f"{name:<52} only in {'after' if old is None else 'before'}")
+            continue
+        columns = [f"{old['rps']:>8} -> {new['rps']:<8}"]
+        columns += [f"{old[key]:>7} -> {new[key]:<7}" for key in LATENCIES]
+        print(f"{name:<52} " + " ".join(columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="allowed relative change in latency and rps",
+    )
+    parser.add_argument(
+        "--min-ms",
+        type=float,
+        default=5,
+        help="latency changes smaller than this are noise",
+    )
+    parser.add_argument(
+        "--min-requests",
+        type=int,
+        default=100,
+        help="skip routes with fewer requests in either run",
+    )
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)["routes"]
+    with open(args.after) as file:
+        after = json.load(file)["routes"]
+
+    print_table(before, after)
+    regressions = get_regressions(
+        before, after, args.tolerance, args.min_ms, args.min_requests
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,50 @@
+from locust import HttpUser, task, between
+import uuid
+
+
+# Compare requests/s with 200 concurrent clients before and after a pool change:
+#   locust -f performance-tests/test_db_pool.py --headless -u 200 -r 50 -t 2m
+# GET /status/db-pool shows checked-out connections, overflow and wait time
+# to the users in ADMIN_USERNAMES.
+PASSWORD = "123456"
+
+
+class DatabaseUser(HttpUser):
+    wait_time = between(0.05, 0.2)
+    host = "http://localhost:8000"
+
+    def on_start(self):
+        username = f"pool-{uuid.uuid4().hex[:12]}"
+        self.client.post(
+            "/users/create",
+            params={"password": PASSWORD},
+            json={
+                "email": f"{username}@email.local",
+                "telephone": "0812345678",
+                "username": username,
+                "first_name": "Pool",
+                "last_name": "User",
+            },
+            name="/users/create",
+        )
+        res = self.client.post(
+            "/token", data={"username": username, "password": PASSWORD}, name="/token"
+        )
+        self.user_id = res.json()["user_id"]
+        self.headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+    @task(5)
+    def get_items(self):
+        self.client.get("/items", name="GET /items")
+
+    @task(3)
+    def get_merchants(self):
+        self.client.get("/merchants", name="GET /merchants")
+
+    @task(2)
+    def get_wallets(self):
+        self.client.get(
+            f"/wallets/user/{self.user_id}",
+            headers=self.headers,
+            name="GET /wallets/user/{user_id}",
+        )
@@ -0,0 +1,27 @@
+from locust import HttpUser, task, between
+
+from digital_wallet import pagination
+
+
+# Compare deep-page latency of the legacy offset mode against keyset cursors.
+# Needs a catalog of at least PAGE * SIZE_PER_PAGE items:
+#   locust -f performance-tests/test_deep_pagination.py --headless -u 20 -t 1m
+PAGE = 10_000
+SIZE_PER_PAGE = 50
+
+
+class DeepPagination(HttpUser):
+    wait_time = between(0.1, 0.3)
+    host = "http://localhost:8000"
+
+    @task
+    def offset_page(self):
+        self.client.get("/items", params={"page": PAGE}, name=f"GET /items?page={PAGE}")
+
+    @task
+    def cursor_page(self):
+        # items are ordered by id, so the row before page PAGE is the cursor
+        after = pagination.encode_cursor((PAGE - 1) * SIZE_PER_PAGE)
+        self.client.get(
+            "/items", params={"after": after}, name=f"GET /items?after=<page {PAGE}>"
+        )
@@ -0,0 +1,81 @@
+import os
+import uuid
+
+import requests
+
+from locust import HttpUser, task, constant, events
+
+
+# Every buyer pays into the same vendor wallet. Run once with a single-row
+# vendor wallet and once with a sharded one, on Postgres, and compare the
+# purchase requests/s:
+#   HOT_WALLET_SHARDED=0 locust -f performance-tests/test_hot_wallet.py --headless -u 200 -r 50 -t 1m
+#   HOT_WALLET_SHARDED=1 locust -f performance-tests/test_hot_wallet.py --headless -u 200 -r 50 -t 1m
+PASSWORD = "123456"
+SHARDED = os.environ.get("HOT_WALLET_SHARDED", "0") == "1"
+
+vendor = {}
+
+
+def register(client, prefix: str, base_url: str = "") -> dict:
+    username = f"{prefix}-{uuid.uuid4().hex[:12]}"
+    client.post(
+        f"{base_url}/users/create",
+        params={"password": PASSWORD},
+        json={
+            "email": f"{username}@email.local",
+            "telephone": "0812345678",
+            "username": username,
+            "first_name": "Hot",
+            "last_name": "Wallet",
+        },
+    )
+    res = client.post(
+        f"{base_url}/token", data={"username": username, "password": PASSWORD}
+    )
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+@events.test_start.add_listener
+def create_vendor(environment, **kwargs):
+    base_url = environment.host or Buyer.host
+    client = requests.Session()
+
+    headers = register(client, "vendor", base_url)
+    merchant = client.post(f"{base_url}/merchants", json={}, headers=headers).json()
+    item = client.post(
+        f"{base_url}/items/{merchant['id']}",
+        json={"name": "promotion item", "price": 1, "stock": 100_000_000},
+        headers=headers,
+    ).json()
+    wallet = client.post(
+        f"{base_url}/wallets",
+        json={"describe": "vendor", "sharded": SHARDED},
+        headers=headers,
+    ).json()
+
+    vendor.update(item_id=item["id"], wallet_id=wallet["id"])
+
+
+class Buyer(HttpUser):
+    wait_time = constant(0)
+    host = "http://localhost:8000"
+
+    def on_start(self):
+        self.headers = register(self.client, "buyer")
+        res = self.client.post(
+            "/wallets",
+            json={"describe": "buyer", "balance": 1_000_000},
+            headers=self.headers,
+            name="/wallets",
+        )
+        self.wallet_id = res.json()["id"]
+
+    @task
+    def purchase(self):
+        self.client.post(
+            f"/transactions/{self.wallet_id}/{vendor['wallet_id']}/{vendor['item_id']}",
+            json={"total_price": 0},
+            headers=self.headers,
+            name="POST /transactions (hot vendor wallet)",
+        )
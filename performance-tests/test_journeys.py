@@ -0,0 +1,291 @@
+import json
+import os
+import random
+import time
+import uuid
+
+import requests
+
+from locust import HttpUser, task, between, events
+from locust.runners import MasterRunner, WorkerRunner
+
+
+# Weighted user journeys over the real hot paths: browsing the catalog page by
+# page, merchant pages, purchases (a share of them all on one hot item) and
+# transaction history, plus registrations and logins. Shoppers log in once and
+# reuse their token, logging in again only on a 401.
+#
+# Point it at a server, ideally loaded by scripts/generate-dataset.py, whose
+# users are then reused instead of registered (JOURNEY_USERS=<--users>):
+#   JOURNEY_USERS=100000 locust -f performance-tests/test_journeys.py \
+#       --headless -u 200 -r 20 -t 5m --summary-file after.json
+#   python performance-tests/compare_summaries.py before.json after.json
+PASSWORD = "123456"
+DATASET_USERS = int(os.environ.get("JOURNEY_USERS", "0"))
+PAGE_SIZE = 20
+MAX_PAGES = 3
+CATALOG_ITEMS = 200
+WALLET_BALANCE = 100_000_000
+
+vendor = {}
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    parser.add_argument(
+        "--summary-file",
+        default="",
+        help="write RPS and p50/p95/p99 per route as JSON when the run ends",
+    )
+
+
+def user_payload(username: str) -> dict:
+    return {
+        "email": f"{username}@email.local",
+        "telephone": "0812345678",
+        "username": username,
+        "first_name": "Journey",
+        "last_name": "User",
+    }
+
+
+def login(client, username: str, base_url: str = "", **kwargs):
+    res = client.post(
+        f"{base_url}/token",
+        data={"username": username, "password": PASSWORD},
+        **kwargs,
+    )
+    data = res.json()
+    return data["user_id"], {"Authorization": f"Bearer {data['access_token']}"}
+
+
+def receive_vendor(environment, msg, **kwargs):
+    vendor.update(msg.data)
+
+
+@events.init.add_listener
+def register_vendor_message(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        environment.runner.register_message("vendor", receive_vendor)
+
+
+@events.test_start.add_listener
+def create_vendor(environment, **kwargs):
+    # in a distributed run the master sends the vendor to the workers, where
+    # the users run; it does so before its spawn messages, so every worker
+    # has it before its first user starts
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    # one vendor owns the hot item and takes every payment; a catalog is
+    # added only when the database has too few items to page through
+    base_url = environment.host or Shopper.host
+    client = requests.Session()
+    username = f"vendor-{uuid.uuid4().hex[:12]}"
+    client.post(
+        f"{base_url}/users/create",
+        params={"password": PASSWORD},
+        json=user_payload(username),
+    )
+    _, headers = login(client, username, base_url)
+
+    merchant = client.post(f"{base_url}/merchants", json={}, headers=headers).json()
+    item = client.post(
+        f"{base_url}/items/{merchant['id']}",
+        json={"name": "hot item", "price": 1, "stock": 1_000_000_000},
+        headers=headers,
+    ).json()
+    wallet = client.post(
+        f"{base_url}/wallets", json={"describe": "vendor"}, headers=headers
+    ).json()
+
+    listed = client.get(
+        f"{base_url}/items", params={"limit": PAGE_SIZE * MAX_PAGES}
+    ).json()
+    for i in range(CATALOG_ITEMS - len(listed["items"])):
+        client.post(
+            f"{base_url}/items/{merchant['id']}",
+            json={"name": f"catalog item {i}", "price": 1, "stock": 1_000_000_000},
+            headers=headers,
+        )
+
+    vendor.update(item_id=item["id"], wallet_id=wallet["id"])
+    if isinstance(environment.runner, MasterRunner):
+        environment.runner.send_message("vendor", vendor)
+
+
+@events.quitting.add_listener
+def write_summary(environment, **kwargs):
+    path = environment.parsed_options and environment.parsed_options.summary_file
+    if not path or isinstance(environment.runner, WorkerRunner):
+        return
+
+    total = environment.stats.total
+    routes = {}
+    for entry in [*environment.stats.entries.values(), total]:
+        key = "Aggregated" if entry is total else f"{entry.method} {entry.name}"
+        routes[key] = dict(
+            requests=entry.num_requests,
+            failures=entry.num_failures,
+            rps=round(entry.total_rps, 2),
+            p50=entry.get_response_time_percentile(0.5),
+            p95=entry.get_response_time_percentile(0.95),
+            p99=entry.get_response_time_percentile(0.99),
+        )
+
+    summary = dict(
+        host=environment.host,
+        users=environment.runner.target_user_count if environment.runner else None,
+        seconds=round(
+            (total.last_request_timestamp or total.start_time) - total.start_time, 1
+        ),
+        finished=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        routes=dict(sorted(routes.items())),
+    )
+    with open(path, "w") as file:
+        json.dump(summary, file, indent=2)
+
+
+class Shopper(HttpUser):
+    wait_time = between(0.5, 2)
+    host = "http://localhost:8000"
+    weight = 10
+
+    def on_start(self):
+        if DATASET_USERS:
+            self.username = f"user{random.randint(1, DATASET_USERS)}"
+        else:
+            self.username = f"shopper-{uuid.uuid4().hex[:12]}"
+            self.client.post(
+                "/users/create",
+                params={"password": PASSWORD},
+                json=user_payload(self.username),
+                name="/users/create",
+            )
+        self.login()
+
+        res = self.client.post(
+            "/wallets",
+            json={"describe": "shopper", "balance": WALLET_BALANCE},
+            headers=self.headers,
+            name="/wallets",
+        )
+        self.wallet_id = res.json()["id"]
+        self.seen_items = []
+
+    def login(self):
+        self.user_id, self.headers = login(self.client, self.username, name="/token")
+
+    def request(self, method: str, url: str, name: str, ok=(), **kwargs):
+        # tokens are reused until the server rejects one
+        expired = False
+        with self.client.request(
+            method, url, name=name, headers=self.headers, catch_response=True, **kwargs
+        ) as res:
+            if res.status_code == 401:
+                expired = True
+                res.success()
+            elif res.status_code in ok:
+                res.success()
+
+        if expired:
+            self.login()
+            return self.request(method, url, name, ok, **kwargs)
+        return res
+
+    @task(2)
+    def relogin(self):
+        self.login()
+
+    @task(10)
+    def browse_items(self):
+        params = {"limit": PAGE_SIZE, "include_total": "false"}
+        for page in range(random.randint(1, MAX_PAGES)):
+            res = self.client.get(
+                "/items",
+                params=params,
+                name="/items" if page == 0 else "/items?after",
+            )
+            if not res.ok:
+                break
+            data = res.json()
+            self.seen_items = data["items"] or self.seen_items
+            if not data["next_cursor"]:
+                break
+            params["after"] = data["next_cursor"]
+
+    @task(6)
+    def view_item(self):
+        if self.seen_items:
+            item = random.choice(self.seen_items)
+            self.client.get(f"/items/{item['id']}", name="/items/{id}")
+
+    @task(4)
+    def view_merchant(self):
+        if not self.seen_items:
+            return
+        merchant_id = random.choice(self.seen_items)["merchant_id"]
+        self.client.get(f"/merchants/{merchant_id}", name="/merchants/{id}")
+        self.client.get(
+            f"/merchants/{merchant_id}/items",
+            params={"limit": PAGE_SIZE, "include_total": "false"},
+            name="/merchants/{id}/items",
+        )
+
+    @task(3)
+    def purchase(self):
+        if self.seen_items:
+            self.buy(
+                random.choice(self.seen_items)["id"],
+                "/transactions/{buyer}/{vendor}/{item}",
+            )
+
+    @task(3)
+    def purchase_hot_item(self):
+        self.buy(vendor["item_id"], "/transactions/{buyer}/{vendor}/{item} (hot item)")
+
+    def buy(self, item_id: int, name: str):
+        # a sold-out catalog item is not a server failure
+        self.request(
+            "POST",
+            f"/transactions/{self.wallet_id}/{vendor['wallet_id']}/{item_id}",
+            name,
+            ok=(400,),
+            json={"total_price": 0},
+        )
+
+    @task(5)
+    def transaction_history(self):
+        params = {"limit": PAGE_SIZE, "include_total": "false"}
+        for page in range(random.randint(1, 2)):
+            res = self.request(
+                "GET",
+                f"/transactions/user/{self.user_id}",
+                (
+                    "/transactions/user/{id}"
+                    if page == 0
+                    else "/transactions/user/{id}?after"
+                ),
+                params=params,
+            )
+            cursor = res.ok and res.json()["next_cursor"]
+            if not cursor:
+                break
+            params["after"] = cursor
+
+
+class Registrant(HttpUser):
+    wait_time = between(1, 5)
+    host = "http://localhost:8000"
+    weight = 1
+
+    @task
+    def register(self):
+        username = f"new-{uuid.uuid4().hex[:12]}"
+        self.client.post(
+            "/users/create",
+            params={"password": PASSWORD},
+            json=user_payload(username),
+            name="/users/create",
+        )
+        login(self.client, username, name="/token (new user)")
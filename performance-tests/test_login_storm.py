@@ -0,0 +1,46 @@
+from locust import HttpUser, task, between, constant
+import uuid
+
+
+# Run headless and compare the "GET /items" p99 with and without LoginStorm:
+#   locust -f performance-tests/test_login_storm.py --headless -u 200 -r 50 -t 1m
+PASSWORD = "123456"
+
+
+class LoginStorm(HttpUser):
+    wait_time = constant(0)
+    host = "http://localhost:8000"
+    weight = 1
+
+    def on_start(self):
+        self.username = f"storm-{uuid.uuid4().hex[:12]}"
+        self.client.post(
+            "/users/create",
+            params={"password": PASSWORD},
+            json={
+                "email": f"{self.username}@email.local",
+                "telephone": "0812345678",
+                "username": self.username,
+                "first_name": "Storm",
+                "last_name": "User",
+            },
+            name="/users/create",
+        )
+
+    @task
+    def login(self):
+        self.client.post(
+            "/token",
+            data={"username": self.username, "password": PASSWORD},
+            name="/token",
+        )
+
+
+class ItemsReader(HttpUser):
+    wait_time = between(0.1, 0.5)
+    host = "http://localhost:8000"
+    weight = 3
+
+    @task
+    def get_items(self):
+        self.client.get("/items", name="GET /items")
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import random
+import time
+
+from sqlalchemy import insert, text, update
+from sqlmodel import select, func
+
+from digital_wallet import config, ledger, models, rollups, sales, security
+
+# Fills a freshly recreated database with a synthetic, skewed dataset for
+# scale and performance testing. DROPS EVERY TABLE FIRST.
+#   python scripts/generate-dataset.py --users 1000000 --items 1000000 \
+#       --transactions 5000000 --seed 1
+#
+# - item popularity is Zipfian: a few items take most of the purchases;
+# - merchants own a Zipfian share of the items, so a few merchants are hot;
+# - every user has a wallet, merchant owners a second one taking the sales;
+# - transactions are spread over --days in id order, each with its ledger
+#   entries; wallets get an opening deposit that covers their purchases;
+# - sales counters and spending rollups are recomputed at the end.
+#
+# Every user's password is "123456" (hashed once). The same seed and sizes
+# give the same rows, whatever the chunk size or database, bar the password
+# hash's salt.
+PASSWORD = "123456"
+START = datetime.datetime(2024, 1, 1)
+
+
+def get_cum_weights(count: int, skew: float) -> list[float]:
+    return list(itertools.accumulate(1 / rank**skew for rank in range(1, count + 1)))
+
+
+class Generator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.hashed_password = security.get_password_hash(PASSWORD)
+
+    def stream(self, name: str) -> random.Random:
+        # one generator per attribute, so chunking never changes the draws
+        return random.Random(f"{self.args.seed}:{name}")
+
+    async def insert_rows(self, model, rows):
+        count = 0
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, self.args.chunk)):
+            async with models.session_factory() as session:
+                await session.execute(insert(model), chunk)
+                await session.commit()
+            count += len(chunk)
+        return count
+
+    def users(self):
+        rng = self.stream("users")
+        for user_id in range(1, self.args.users + 1):
+            yield dict(
+                id=user_id,
+                username=f"user{user_id}",
+                email=f"user{user_id}@example.local",
+                telephone=f"08{rng.randrange(10**8):08d}",
+                first_name=f"First{user_id}",
+                last_name=f"Last{user_id}",
+                disabled=False,
+                hashed_password=self.hashed_password,
+                register_date=START - datetime.timedelta(days=rng.randrange(365)),
+                updated_date=START,
+            )
+
+    def merchants(self):
+        # merchant n belongs to user n
+        for merchant_id in range(1, self.args.merchants + 1):
+            yield dict(
+                id=merchant_id,
+                user_id=merchant_id,
+                first_name=f"First{merchant_id}",
+                last_name=f"Last{merchant_id}",
+                email=f"user{merchant_id}@example.local",
+                description=f"Shop {merchant_id}",
+            )
+
+    def wallets(self):
+        # wallet n is user n's own; the merchants' sales wallets follow
+        for user_id in range(1, self.args.users + 1):
+            yield dict(id=user_id, user_id=user_id, describe="main", balance=0.0)
+        for merchant_id in range(1, self.args.merchants + 1):
+            yield dict(
+                id=self.args.users + merchant_id,
+                user_id=merchant_id,
+                describe="sales",
+                balance=0.0,
+            )
+
+    def plan_items(self):
+        """Merchant and price of every item, kept for the transactions."""
+        rng = self.stream("items")
+        owners = self.stream("item-merchants").choices(
+            range(1, self.args.merchants + 1),
+            cum_weights=get_cum_weights(self.args.merchants, self.args.merchant_skew),
+            k=self.args.items,
+        )
+        self.item_merchants = [0] + owners
+        self.item_prices = [0.0] + [
+            round(rng.lognormvariate(3, 1), 2) + 0.01 for _ in range(self.args.items)
+        ]
+
+    def items(self):
+        rng = self.stream("item-stock")
+        for item_id in range(1, self.args.items + 1):
+            merchant_id = self.item_merchants[item_id]
+            yield dict(
+                id=item_id,
+                name=f"Item {item_id}",
+                description=f"Synthetic item {item_id} from shop {merchant_id}",
+                price=self.item_prices[item_id],
+                stock=rng.randrange(10_000, 100_000),
+                tax=0.07,
+                sku=f"SKU-{item_id}",
+                merchant_id=merchant_id,
+                user_id=merchant_id,
+            )
+
+    def transactions(self, spent: list[float]):
+        args = self.args
+        popularity = list(range(1, args.items + 1))
+        self.stream("popularity").shuffle(popularity)
+        cum_weights = get_cum_weights(args.items, args.item_skew)
+        item_rng = self.stream("purchased-items")
+        buyer_rng = self.stream("buyers")
+        quantity_rng = self.stream("quantities")
+        span = datetime.timedelta(days=args.days) / max(args.transactions, 1)
+
+        for transaction_id in range(1, args.transactions + 1):
+            item_id = item_rng.choices(popularity, cum_weights=cum_weights)[0]
+            user_id = buyer_rng.randrange(1, args.users + 1)
+            merchant_id = self.item_merchants[item_id]
+            quantity = quantity_rng.choice((1, 1, 1, 2, 3))
+            total_price = self.item_prices[item_id] * quantity
+            spent[user_id] += total_price
+            yield dict(
+                id=transaction_id,
+                total_price=total_price,
+                quantity=quantity,
+                item_name=f"Item {item_id}",
+                item_id=item_id,
+                merchant_first_name=f"First{merchant_id}",
+                merchant_last_name=f"Last{merchant_id}",
+                merchant_id=merchant_id,
+                rollup_merchant_id=merchant_id,
+                user_first_name=f"First{user_id}",
+                user_last_name=f"Last{user_id}",
+                user_id=user_id,
+                wallet_id=user_id,
+                transaction_date=START + span * transaction_id,
+            )
+
+    def purchase_entries(self, transactions):
+        for row in transactions:
+            for entry in ledger.make_purchase_entries(
+                row["wallet_id"],
+                self.args.users + row["merchant_id"],
+                row["total_price"],
+                row["id"],
+            ):
+                entry["created_date"] = row["transaction_date"]
+                yield entry
+
+    def deposits(self, spent: list[float]):
+        rng = self.stream("deposits")
+        for user_id in range(1, self.args.users + 1):
+            amount = round(spent[user_id] + rng.uniform(0, 1_000), 2)
+            entry = ledger.make_entry(user_id, amount, "deposit")
+            entry["created_date"] = START
+            yield entry
+
+    async def run(self):
+        async def step(name: str, coroutine):
+            start = time.perf_counter()
+            count = await coroutine
+            elapsed = time.perf_counter() - start
+            print(f"{name:<20} {count or 0:>10} rows {elapsed:8.1f}s", flush=True)
+
+        await step("tables", models.recreate_table())
+        await step("users", self.insert_rows(models.DBUser, self.users()))
+        await step("merchants", self.insert_rows(models.DBMerchant, self.merchants()))
+        await step("wallets", self.insert_rows(models.DBWallet, self.wallets()))
+        self.plan_items()
+        await step("items", self.insert_rows(models.DBItem, self.items()))
+
+        spent = [0.0] * (self.args.users + 1)
+        await step("transactions", self.insert_transactions(spent))
+        await step(
+            "deposits", self.insert_rows(models.DBLedgerEntry, self.deposits(spent))
+        )
+        await step("balances", self.update_balances())
+        await step("sales counters", self.recompute_sales())
+        await step("spending rollups", rollups.rebuild())
+        await step("sequences", self.reset_sequences())
+
+    async def insert_transactions(self, spent: list[float]):
+        # transactions and their ledger entries go in together, chunk by chunk
+        count = 0
+        rows = self.transactions(spent)
+        while chunk := list(itertools.islice(rows, self.args.chunk)):
+            async with models.session_factory() as session:
+                await session.execute(insert(models.DBTransaction), chunk)
+                await ledger.record_entries(session, list(self.purchase_entries(chunk)))
+                await session.commit()
+            count += len(chunk)
+        return count
+
+    async def update_balances(self):
+        entries = (
+            select(func.coalesce(func.sum(models.DBLedgerEntry.amount), 0))
+            .where(models.DBLedgerEntry.wallet_id == models.DBWallet.id)
+            .scalar_subquery()
+        )
+        async with models.session_factory() as session:
+            await session.execute(
+                update(models.DBWallet)
+                .values(balance=entries / float(ledger.MINOR_UNITS))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def recompute_sales(self):
+        async with models.session_factory() as session:
+            await sales.recompute_sales(session)
+            await session.commit()
+
+    async def reset_sequences(self):
+        # ids were given explicitly, so Postgres' sequences never moved
+        async with models.engine.begin() as conn:
+            if conn.dialect.name != "postgresql":
+                return
+            for table in ("users", "merchants", "wallets", "items", "transactions"):
+                await conn.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"coalesce(max(id), 0) + 1, false) FROM {table}"
+                    )
+                )
+
+
+async def main(args: argparse.Namespace):
+    models.init_db(config.get_settings())
+    try:
+        await Generator(args).run()
+    finally:
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--merchants", type=int, default=1_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--item-skew", type=float, default=1.1)
+    parser.add_argument("--merchant-skew", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk", type=int, default=10_000)
+    args = parser.parse_args()
+    if args.merchants > args.users:
+        parser.error("every merchant needs an owner: --merchants <= --users")
+
+    asyncio.run(main(args))
@@ -0,0 +1,18 @@
+import asyncio
+from digital_wallet import config, ledger, models
+
+
+async def backfill() -> int:
+    async with models.session_factory() as session:
+        return await ledger.backfill_openings(session)
+
+
+# Adds missing tables, columns and indexes to a live database; unlike
+# initial-db.py it never drops anything, so it is safe to run on every deploy.
+# Wallets that predate the ledger then get their opening entries.
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    for step in asyncio.run(models.migrate_table()):
+        print(step)
+    print(f"{asyncio.run(backfill())} opening ledger entries written")
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import pathlib
+
+from digital_wallet import config, models, provisioning
+
+# Creates users from a CSV or NDJSON export of a partner system, one row per
+# user with the CreateUser fields and a plain-text "password":
+#   python scripts/provision-users.py users.csv
+READ_SIZE = 64 * 1024
+
+
+async def read_file(path: pathlib.Path):
+    with path.open("rb") as file:
+        while chunk := file.read(READ_SIZE):
+            yield chunk
+
+
+async def run(path: pathlib.Path, format: str) -> dict:
+    executor, workers = provisioning.make_executor()
+    try:
+        async with models.session_factory() as session:
+            return await provisioning.provision_users(
+                session, read_file(path), format, executor, workers
+            )
+    finally:
+        executor.shutdown()
+        await models.close_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=pathlib.Path)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default=None)
+    args = parser.parse_args()
+    format = args.format or ("csv" if args.path.suffix == ".csv" else "ndjson")
+
+    settings = config.get_settings()
+    models.init_db(settings)
+    result = asyncio.run(run(args.path, format))
+
+    for error in result["errors"]:
+        print(f"line {error['line']}: {'; '.join(error['errors'])}")
+    print(
+        f"created {result['created']} users, {result['error_count']} rejected,"
+        f" in {result['seconds']:.1f}s ({result['users_per_second']:.0f} users/s)"
+    )
@@ -1 +1 @@
-poetry run locust -f performance-tests/test_index.py
\ No newline at end of file
+poetry run locust -f performance-tests/test_journeys.py --headless -u 100 -r 10 -t 5m --summary-file locust-summary.json
\ No newline at end of file
@@ -19,6 +19,8 @@ from httpx import AsyncClient, ASGITransport
 
 
 from typing import Any, Dict, Optional
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
 from pydantic_settings import SettingsConfigDict
 
 from digital_wallet import models, config, main, security
@@ -31,6 +33,27 @@ import pathlib
 import datetime
 
 
+@event.listens_for(Session, "do_orm_execute")
+def fail_on_lazy_load(orm_execute_state):
+    # a lazy load inside a router is a hidden query per row, or a
+    # MissingGreenlet error outside run_sync; load relationships eagerly
+    if not orm_execute_state.is_select:
+        return
+
+    state = orm_execute_state.lazy_loaded_from
+    if state is not None:
+        raise AssertionError(f"lazy relationship load on {state.class_.__name__}")
+
+
+@event.listens_for(Engine, "connect")
+def enforce_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys unless asked; Postgres always enforces them
+    if "sqlite" in type(dbapi_connection).__module__:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
 SettingsTesting = config.Settings
 SettingsTesting.model_config = SettingsConfigDict(
     env_file=".testing.env", validate_assignment=True, extra="allow"
@@ -0,0 +1,168 @@
+import time
+
+from httpx import AsyncClient
+from digital_wallet import cache, catalog, models, security
+import pytest
+
+
+class RedisStandIn:
+    """The subset of the redis.asyncio client that RedisBackend uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            return None
+        return value
+
+    async def set(self, key, value, px=None):
+        expires_at = time.monotonic() + px / 1000 if px is not None else None
+        self.data[key] = (value, expires_at)
+
+
+def test_lru_cache_counters():
+    lru = cache.LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.set("c", 3)
+
+    assert lru.get("a") is None
+    assert lru.get("c") == 3
+    assert (lru.hits, lru.misses, lru.evictions) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_item_reads_are_cached_until_changed(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post(
+        f"/items/{merchant_user1.id}",
+        json={"name": "cached item", "price": 5, "stock": 3},
+        headers=headers,
+    )
+    item_id = response.json()["id"]
+    response = await client.post(
+        "/wallets", json={"describe": "cache buyer", "balance": 100}, headers=headers
+    )
+    wallet_id = response.json()["id"]
+
+    await client.get(f"/items/{item_id}")
+    await client.get(f"/merchants/{merchant_user1.id}/items")
+    with models.count_queries() as statements:
+        response = await client.get(f"/items/{item_id}")
+        await client.get(f"/merchants/{merchant_user1.id}/items")
+    assert response.json()["stock"] == 3
+    assert statements == []
+
+    await client.post(
+        f"/transactions/{wallet_id}/{wallet_id}/{item_id}",
+        json={"total_price": 0},
+        headers=headers,
+    )
+    response = await client.get(f"/items/{item_id}")
+    assert response.json()["stock"] == 2
+    response = await client.get(
+        f"/merchants/{merchant_user1.id}/items", params={"include_total": False}
+    )
+    assert response.json()["items"]
+
+    response = await client.put(
+        f"/items/{item_id}",
+        json={"name": "renamed item", "price": 5, "stock": 2},
+        headers=headers,
+    )
+    response = await client.get(f"/items/{item_id}")
+    assert response.json()["name"] == "renamed item"
+
+    await client.delete(f"/items/{item_id}", headers=headers)
+    response = await client.get(f"/items/{item_id}")
+    assert response.status_code == 404
+
+    response = await client.get("/status/cache", headers=headers)
+    assert response.status_code == 403
+    monkeypatch.setattr(security.settings, "ADMIN_USERNAMES", [user1.username])
+    response = await client.get("/status/cache", headers=headers)
+    assert response.json()["backend"] == "memory"
+    assert response.json()["hits"] >= 2
+
+
+@pytest.mark.asyncio
+async def test_merchant_reads_with_redis_backend(
+    client: AsyncClient,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    redis = RedisStandIn()
+    monkeypatch.setattr(
+        catalog,
+        "catalog_cache",
+        cache.ReadThroughCache(cache.RedisBackend(redis), ttl=60),
+    )
+
+    await client.get(f"/merchants/{merchant_user1.id}")
+    response = await client.get(f"/merchants/{merchant_user1.id}")
+    assert catalog.catalog_cache.stats() == dict(hits=1, misses=1, backend="redis")
+    assert all(key.startswith("digital_wallet:merchant:") for key in redis.data)
+
+    description = response.json()["description"]
+    await client.put(
+        f"/merchants/{merchant_user1.id}",
+        json={"description": "cached merchant"},
+        headers=headers,
+    )
+    response = await client.get(f"/merchants/{merchant_user1.id}")
+    assert response.json()["description"] == "cached merchant"
+
+    await client.put(
+        f"/merchants/{merchant_user1.id}",
+        json={"description": description},
+        headers=headers,
+    )
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(
+    client: AsyncClient,
+    item_user1: models.DBItem,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    response = await client.get("/items")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("public, max-age=")
+
+    response = await client.get("/items", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = await client.post(
+        "/wallets", json={"describe": "polled", "balance": 1}, headers=headers
+    )
+    wallet_id = response.json()["id"]
+    response = await client.get(f"/wallets/{wallet_id}", headers=headers)
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    await client.put(
+        f"/wallets/{wallet_id}",
+        json={"describe": "polled", "balance": 2},
+        headers=headers,
+    )
+    response = await client.get(
+        f"/wallets/{wallet_id}", headers=headers | {"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["balance"] == 2
+    assert response.headers["etag"] != etag
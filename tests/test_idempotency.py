@@ -0,0 +1,136 @@
+import datetime
+
+from httpx import AsyncClient
+from digital_wallet import models, idempotency
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_create_wallet_idempotency_key(
+    client: AsyncClient, session: models.AsyncSession, token_user1: models.Token
+):
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "create-wallet-1",
+    }
+    payload = {"describe": "idempotent wallet"}
+
+    first = await client.post("/wallets", json=payload, headers=headers)
+    second = await client.post("/wallets", json=payload, headers=headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+    result = await session.exec(
+        models.select(models.DBWallet).where(
+            models.DBWallet.describe == payload["describe"]
+        )
+    )
+    assert len(result.all()) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_reused_for_different_request(
+    client: AsyncClient, token_user1: models.Token
+):
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "create-wallet-2",
+    }
+
+    response = await client.post("/wallets", json={"describe": "a"}, headers=headers)
+    assert response.status_code == 200
+
+    response = await client.post("/wallets", json={"describe": "b"}, headers=headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_idempotency_key(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    buyer_wallet = models.DBWallet(user_id=user1.id, balance=1000)
+    vendor_wallet = models.DBWallet(user_id=user1.id, balance=0)
+    item = models.DBItem(
+        name="idempotent item", merchant_id=merchant_user1.id, price=100, stock=10
+    )
+    session.add_all([buyer_wallet, vendor_wallet, item])
+    await session.commit()
+
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "purchase-1",
+    }
+    url = f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}"
+
+    first = await client.post(url, json={"total_price": 0}, headers=headers)
+    second = await client.post(url, json={"total_price": 0}, headers=headers)
+
+    assert first.status_code == 200
+    assert second.json() == first.json()
+
+    await session.refresh(buyer_wallet)
+    await session.refresh(item)
+    assert buyer_wallet.balance == 900
+    assert item.stock == 9
+
+
+@pytest.mark.asyncio
+async def test_purge_expired_keys(session: models.AsyncSession, user1: models.DBUser):
+    expired_date = datetime.datetime.now() - idempotency.get_retention()
+    session.add_all(
+        [
+            models.DBIdempotencyKey(
+                user_id=user1.id,
+                key=f"expired-{i}",
+                fingerprint="",
+                response_body="{}",
+                created_date=expired_date - datetime.timedelta(minutes=1),
+            )
+            for i in range(3)
+        ]
+    )
+    await session.commit()
+
+    assert await idempotency.purge_expired_keys(session) == 3
+
+
+@pytest.mark.asyncio
+async def test_reuse_expired_idempotency_key(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    token_user1: models.Token,
+):
+    # expired, but not swept yet
+    session.add(
+        models.DBIdempotencyKey(
+            user_id=user1.id,
+            key="expired-wallet",
+            fingerprint="",
+            response_body="{}",
+            created_date=datetime.datetime.now()
+            - idempotency.get_retention()
+            - datetime.timedelta(minutes=1),
+        )
+    )
+    await session.commit()
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Idempotency-Key": "expired-wallet",
+    }
+    payload = {"describe": "after expiry"}
+
+    first = await client.post("/wallets", json=payload, headers=headers)
+    second = await client.post("/wallets", json=payload, headers=headers)
+
+    assert first.status_code == 200
+    assert first.json()["describe"] == payload["describe"]
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
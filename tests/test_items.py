@@ -1,5 +1,7 @@
+from fastapi import HTTPException
 from httpx import AsyncClient
-from digital_wallet import models
+from sqlalchemy import Float, literal_column
+from digital_wallet import bulk, models, pagination
 import pytest
 
 
@@ -85,4 +87,192 @@ async def test_list_items(client: AsyncClient, item_user1: models.DBItem):
             break
 
     assert check_item["id"] == item_user1.id
-    assert check_item["name"] == item_user1.name
\ No newline at end of file
+    assert check_item["name"] == item_user1.name
+
+
+@pytest.mark.asyncio
+async def test_list_items_cursor(client: AsyncClient, item_user1: models.DBItem):
+    response = await client.get("/items", params={"limit": 1})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["page"] == 1
+    assert len(data["items"]) == 1
+
+    item_ids = [data["items"][0]["id"]]
+    while data["next_cursor"]:
+        response = await client.get(
+            "/items", params={"after": data["next_cursor"], "limit": 1}
+        )
+        data = response.json()
+
+        assert response.status_code == 200
+        assert data["page"] is None
+        item_ids.extend(item["id"] for item in data["items"])
+
+    assert item_ids == sorted(item_ids)
+    assert len(item_ids) == len(set(item_ids))
+    assert item_user1.id in item_ids
+
+
+@pytest.mark.asyncio
+async def test_list_items_invalid_cursor(client: AsyncClient):
+    response = await client.get("/items", params={"after": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+    for value in ([1], {"id": 1}, None, "abc", 1.5, True):
+        cursor = pagination.encode_cursor(value)
+        response = await client.get("/items", params={"after": cursor})
+        assert response.status_code == 400
+
+    # a date and an id, or a finite rank and an id
+    date = models.DBTransaction.transaction_date
+    rank = literal_column("rank", Float)
+    for columns, values in [
+        ((date, models.DBTransaction.id), (1, 1)),
+        ((rank, models.DBItem.id), (float("nan"), 1)),
+    ]:
+        with pytest.raises(HTTPException):
+            pagination.decode_cursor(pagination.encode_cursor(*values), columns)
+
+
+@pytest.mark.asyncio
+async def test_search_items(
+    client: AsyncClient, merchant_user1: models.DBMerchant, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    ids = {}
+    for name, description in [
+        ("Zephyr kettle", "Stainless zephyr kettle, zephyr series"),
+        ("Zephyr mug", "Ceramic"),
+        ("Zephyrine lamp", None),
+        ("Plain kettle", "Nothing special"),
+    ]:
+        response = await client.post(
+            f"/items/{merchant_user1.id}",
+            json={"name": name, "description": description},
+            headers=headers,
+        )
+        ids[name] = response.json()["id"]
+
+    async def search(q: str, **params) -> dict:
+        response = await client.get("/items/search", params=dict(params, q=q))
+        assert response.status_code == 200
+        return response.json()
+
+    # prefix matching, best match first
+    data = await search("zeph")
+    names = [item["name"] for item in data["items"]]
+    assert sorted(names) == ["Zephyr kettle", "Zephyr mug", "Zephyrine lamp"]
+    assert names[0] == "Zephyr kettle"
+
+    # every term has to match
+    data = await search("zephyr KETTLE")
+    assert [item["name"] for item in data["items"]] == ["Zephyr kettle"]
+
+    # pages follow the ranking without repeating a row
+    first = await search("zeph", limit=2)
+    second = await search("zeph", limit=2, after=first["next_cursor"])
+    assert [item["name"] for item in first["items"] + second["items"]] == names
+    assert second["next_cursor"] is None
+
+    # the index follows updates and deletes
+    await client.put(
+        f"/items/{ids['Zephyr mug']}",
+        json={"name": "Breeze mug", "merchant_id": merchant_user1.id},
+        headers=headers,
+    )
+    await client.delete(f"/items/{ids['Zephyrine lamp']}", headers=headers)
+    data = await search("zeph")
+    assert [item["name"] for item in data["items"]] == ["Zephyr kettle"]
+    data = await search("breeze")
+    assert [item["id"] for item in data["items"]] == [ids["Zephyr mug"]]
+
+    assert (await search('"*:-'))["items"] == []
+
+
+@pytest.mark.asyncio
+async def test_bulk_upsert_items(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    monkeypatch.setattr(bulk.settings, "BULK_IMPORT_CHUNK_SIZE", 2)
+    url = f"/items/{merchant_user1.id}/bulk"
+
+    async def send(body: bytes, size: int = 7):
+        # odd-sized chunks, so lines arrive split across them
+        for start in range(0, len(body), size):
+            yield body[start : start + size]
+
+    body = (
+        b"sku,name,price,stock,description\n"
+        b"BULK-1,Bulk one,10,5,\n"
+        b"BULK-2,Bulk two,not-a-price,5,\n"
+        b"BULK-3,,3,1,no name\r\n"
+        b'BULK-4,Bulk four,4,4,"quoted, with comma"\n'
+        b"BULK-5,Bulk five,5\n"
+    )
+    response = await client.post(
+        url, content=send(body), headers=dict(headers, **{"Content-Type": "text/csv"})
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["imported"] == 2
+    assert data["error_count"] == 3
+    assert [error["line"] for error in data["errors"]] == [3, 4, 6]
+    assert data["errors"][0]["errors"][0].startswith("price:")
+
+    # the same SKUs update in place, also when repeated within one upload
+    body = b"\n".join(
+        [
+            b'{"sku": "BULK-1", "name": "Bulk one", "price": 11, "stock": 6}',
+            b'{"sku": "BULK-4", "name": "Bulk four", "price": 40}',
+            b"not json",
+            b'{"sku": "BULK-4", "name": "Bulk four again", "price": 41}',
+            b'{"name": "No SKU", "price": 1}',
+        ]
+    )
+    response = await client.post(
+        url,
+        content=send(body),
+        headers=dict(headers, **{"Content-Type": "application/x-ndjson"}),
+    )
+    data = response.json()
+
+    assert data["imported"] == 4
+    assert [error["line"] for error in data["errors"]] == [3]
+
+    result = await session.exec(
+        models.select(models.DBItem)
+        .where(models.DBItem.merchant_id == merchant_user1.id)
+        .where(models.DBItem.sku.in_(["BULK-1", "BULK-4"]))
+        .order_by(models.DBItem.sku)
+    )
+    items = result.all()
+    for item in items:
+        await session.refresh(item)
+    assert [(item.name, item.price, item.description) for item in items] == [
+        ("Bulk one", 11, None),
+        ("Bulk four again", 41, None),
+    ]
+
+    response = await client.get(f"/items/{items[0].id}")
+    assert response.json()["price"] == 11
+
+    response = await client.post(
+        f"/items/{merchant_user1.id}",
+        json={"name": "Taken", "sku": "BULK-1"},
+        headers=headers,
+    )
+    assert response.status_code == 409
+
+    response = await client.post(
+        url, content=b"{}", headers=dict(headers, **{"Content-Type": "text/plain"})
+    )
+    assert response.status_code == 415
@@ -0,0 +1,202 @@
+import asyncio
+import datetime
+
+from httpx import AsyncClient
+from digital_wallet import models, ledger, shards
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_wallet_balance_from_ledger(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", 0)
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    response = await client.post(
+        "/wallets", json={"describe": "ledger buyer", "balance": 1000}, headers=headers
+    )
+    buyer_wallet_id = response.json()["id"]
+    response = await client.post(
+        "/wallets", json={"describe": "ledger vendor"}, headers=headers
+    )
+    vendor_wallet_id = response.json()["id"]
+
+    item = models.DBItem(
+        name="ledger item", merchant_id=merchant_user1.id, price=12.5, stock=10
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+
+    url = f"/transactions/{buyer_wallet_id}/{vendor_wallet_id}/{item.id}"
+    await client.post(url, json={"total_price": 0, "quantity": 2}, headers=headers)
+    assert await ledger.take_snapshots(session) >= 2
+    before_second_purchase = datetime.datetime.now()
+
+    await client.post(url, json={"total_price": 0}, headers=headers)
+
+    response = await client.get(f"/wallets/{buyer_wallet_id}/balance", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["balance"] == 962.5
+
+    response = await client.get(
+        f"/wallets/{buyer_wallet_id}/balance",
+        params={"at": before_second_purchase.isoformat()},
+        headers=headers,
+    )
+    assert response.json()["balance"] == 975
+
+    response = await client.get(f"/wallets/{vendor_wallet_id}/balance", headers=headers)
+    assert response.json()["balance"] == 37.5
+
+    db_wallet = await session.get(models.DBWallet, buyer_wallet_id)
+    await session.refresh(db_wallet)
+    assert db_wallet.balance == 962.5
+
+
+@pytest.mark.asyncio
+async def test_update_wallet_records_adjustment(
+    client: AsyncClient, session: models.AsyncSession, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+
+    response = await client.post(
+        "/wallets", json={"describe": "adjusted", "balance": 10}, headers=headers
+    )
+    wallet_id = response.json()["id"]
+
+    await client.put(
+        f"/wallets/{wallet_id}",
+        json={"describe": "adjusted", "balance": 25},
+        headers=headers,
+    )
+
+    assert await ledger.get_balance(session, wallet_id) == 25
+
+
+@pytest.mark.asyncio
+async def test_concurrent_snapshots_fold_entries_once(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", 0)
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    await ledger.take_snapshots(session)
+
+    wallet_ids = []
+    for balance in (10, 20, 30):
+        response = await client.post(
+            "/wallets",
+            json={"describe": "snapshotted", "balance": balance},
+            headers=headers,
+        )
+        wallet_ids.append(response.json()["id"])
+
+    # two workers waking up together
+    async def run() -> int:
+        async with models.session_factory() as worker_session:
+            return await ledger.take_snapshots(worker_session)
+
+    assert sorted(await asyncio.gather(run(), run())) == [0, 3]
+    assert await ledger.take_snapshots(session) == 0
+
+    for wallet_id, balance in zip(wallet_ids, (10, 20, 30)):
+        assert await ledger.get_balance(session, wallet_id) == balance
+
+
+@pytest.mark.asyncio
+async def test_delete_ledgered_transaction_and_wallet(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    monkeypatch.setattr(ledger.settings, "LEDGER_SNAPSHOT_LAG_SECONDS", 0)
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post(
+        "/wallets", json={"describe": "deleted buyer", "balance": 100}, headers=headers
+    )
+    buyer_wallet_id = response.json()["id"]
+    response = await client.post(
+        "/wallets", json={"describe": "kept vendor"}, headers=headers
+    )
+    vendor_wallet_id = response.json()["id"]
+    item = models.DBItem(name="ledgered item", merchant_id=merchant_user1.id, price=4)
+    session.add(item)
+    await session.commit()
+
+    response = await client.post(
+        f"/transactions/{buyer_wallet_id}/{vendor_wallet_id}/{item.id}",
+        json={"total_price": 0},
+        headers=headers,
+    )
+    transaction_id = response.json()["id"]
+    await ledger.take_snapshots(session)
+
+    # the entries stay, detached: deleting refunds nothing
+    response = await client.delete(f"/transactions/{transaction_id}", headers=headers)
+    assert response.status_code == 200
+    result = await session.exec(
+        models.select(models.DBLedgerEntry.transaction_id).where(
+            models.DBLedgerEntry.wallet_id == vendor_wallet_id
+        )
+    )
+    assert result.all() == [None]
+
+    # the deleted wallet's history is kept
+    response = await client.delete(f"/wallets/{buyer_wallet_id}", headers=headers)
+    assert response.status_code == 200
+    assert await ledger.get_balance(session, buyer_wallet_id) == 96
+    assert await ledger.get_balance(session, vendor_wallet_id) == 4
+
+
+@pytest.mark.asyncio
+async def test_backfill_openings(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    # wallets created before the ledger existed
+    wallets = [
+        models.DBWallet(
+            describe="old", user_id=user1.id, balance=balance, sharded=sharded
+        )
+        for balance, sharded in ((12.5, False), (0, False), (30, True))
+    ]
+    session.add_all(wallets)
+    await session.commit()
+    for wallet in wallets:
+        await session.refresh(wallet)
+    session.add(models.DBWalletShard(wallet_id=wallets[2].id, shard=0, balance=5))
+    await session.commit()
+
+    # one of them already had its balance changed after the upgrade
+    response = await client.put(
+        f"/wallets/{wallets[0].id}",
+        json={"describe": "old", "balance": 20},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    # other tests leave wallets without entries behind too
+    assert await ledger.backfill_openings(session) >= 2
+    assert await ledger.backfill_openings(session) == 0
+
+    for wallet, balance in zip(wallets, (20, 0, 35)):
+        assert await ledger.get_balance(session, wallet.id) == balance
+
+    # folding moves money between sub-balances, not in or out of the wallet
+    await shards.fold_shards(session, wallets[2].id)
+    await session.commit()
+    assert await ledger.backfill_openings(session) == 0
+    assert await ledger.get_balance(session, wallets[2].id) == 35
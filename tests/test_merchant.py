@@ -1,5 +1,5 @@
 from httpx import AsyncClient
-from digital_wallet import models
+from digital_wallet import models, sales
 import pytest
 
 
@@ -77,3 +77,193 @@ async def test_list_merchants(
 
     assert check_merchant["id"] == merchant_user1.id
     assert check_merchant["first_name"] == merchant_user1.first_name
+
+
+@pytest.mark.asyncio
+async def test_list_merchant_items_page_count(
+    client: AsyncClient, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={}, headers=headers)
+    merchant_id = response.json()["id"]
+
+    response = await client.get(f"/merchants/{merchant_id}/items")
+    assert response.status_code == 200
+    assert response.json()["page_count"] == 0
+
+    payload = {"name": "page count item", "price": 10, "stock": 1}
+    await client.post(f"/items/{merchant_id}", json=payload, headers=headers)
+
+    response = await client.get(f"/merchants/{merchant_id}/items")
+    assert response.json()["page_count"] == 1
+
+    response = await client.get(
+        f"/merchants/{merchant_id}/items", params={"include_total": False}
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["page_count"] is None
+    assert len(data["items"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_storefront(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+):
+    merchant = models.DBMerchant(user_id=user1.id, description="storefront")
+    session.add(merchant)
+    await session.commit()
+    await session.refresh(merchant)
+    session.add_all(
+        [
+            models.DBItem(name=f"shelf {i}", user_id=user1.id, merchant_id=merchant.id)
+            for i in range(3)
+        ]
+    )
+    await session.commit()
+
+    url = f"/merchants/{merchant.id}/storefront"
+    with models.count_queries() as statements:
+        response = await client.get(url, params={"limit": 2, "include_total": False})
+    data = response.json()
+
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert data["description"] == "storefront"
+    assert [item["name"] for item in data["items"]] == ["shelf 0", "shelf 1"]
+
+    response = await client.get(url, params={"limit": 2, "after": data["next_cursor"]})
+    data = response.json()
+    assert [item["name"] for item in data["items"]] == ["shelf 2"]
+    assert data["next_cursor"] is None
+    assert data["page_count"] == 2
+
+    response = await client.get(url, params={"page": 5})
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+    response = await client.get("/merchants/0/storefront")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_lazy_relationship_load_fails(
+    session: models.AsyncSession, merchant_user1: models.DBMerchant
+):
+    db_merchant = await session.get(models.DBMerchant, merchant_user1.id)
+    session.expire(db_merchant, ["items"])
+
+    with pytest.raises(AssertionError, match="lazy relationship load"):
+        await session.run_sync(lambda _: db_merchant.items)
+
+
+@pytest.mark.asyncio
+async def test_merchant_sales(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    merchant = models.DBMerchant(user_id=user1.id, description="sales")
+    buyer_wallet = models.DBWallet(describe="buyer", user_id=user1.id, balance=1000)
+    vendor_wallet = models.DBWallet(describe="vendor", user_id=user1.id, balance=0)
+    session.add_all([merchant, buyer_wallet, vendor_wallet])
+    await session.commit()
+    for row in (merchant, buyer_wallet, vendor_wallet):
+        await session.refresh(row)
+
+    items = [
+        models.DBItem(
+            name=f"seller {i}",
+            user_id=user1.id,
+            merchant_id=merchant.id,
+            price=10 * (i + 1),
+            stock=10,
+        )
+        for i in range(3)
+    ]
+    session.add_all(items)
+    await session.commit()
+    for item in items:
+        await session.refresh(item)
+
+    response = await client.post(
+        f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{items[0].id}",
+        json={"total_price": 0, "quantity": 3},
+        headers=headers,
+    )
+    deleted_id = response.json()["id"]
+    await client.post(
+        "/transactions/checkout",
+        json={
+            "buyer_wallet_id": buyer_wallet.id,
+            "lines": [
+                {"item_id": items[0].id, "vendor_wallet_id": vendor_wallet.id},
+                {
+                    "item_id": items[2].id,
+                    "vendor_wallet_id": vendor_wallet.id,
+                    "quantity": 2,
+                },
+            ],
+        },
+        headers=headers,
+    )
+    await client.post(
+        f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{items[0].id}",
+        json={"total_price": 0, "quantity": 2},
+        headers=headers,
+    )
+    await client.delete(f"/transactions/{deleted_id}", headers=headers)
+
+    response = await client.get(
+        f"/merchants/{merchant.id}/sales", params={"top": 2}, headers=headers
+    )
+    data = response.json()
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert data["units_sold"] == 5
+    assert data["revenue"] == 90
+    assert [
+        (row["id"], row["units_sold"], row["revenue"]) for row in data["top_items"]
+    ] == [
+        (items[0].id, 3, 30),
+        (items[2].id, 2, 60),
+    ]
+
+    assert await sales.check_sales(session, merchant.id) == []
+
+    # a drifted counter shows up against the recomputation
+    await session.refresh(items[1])
+    items[1].units_sold = 4
+    session.add(items[1])
+    await session.commit()
+    [problem] = await sales.check_sales(session, merchant.id)
+    assert problem.startswith(f"items {items[1].id}: counted 4 units")
+
+    await sales.recompute_sales(session)
+    await session.commit()
+    assert await sales.check_sales(session, merchant.id) == []
+
+    response = await client.get(f"/merchants/{merchant.id}/sales")
+    assert response.status_code == 401
+    response = await client.get("/merchants/0/sales", headers=headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_search_merchants(client: AsyncClient, token_user1: models.Token):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post(
+        "/merchants", json={"description": "Quokka coffee roasters"}, headers=headers
+    )
+    merchant_id = response.json()["id"]
+
+    response = await client.get("/merchants/search", params={"q": "coffee roast"})
+
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()["merchants"]] == [merchant_id]
@@ -0,0 +1,145 @@
+import datetime
+import json
+import re
+
+from httpx import AsyncClient
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from digital_wallet import models, pagination, responses, security
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_timed_queue_pool_stats(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=models.TimedQueuePool,
+        pool_size=2,
+        max_overflow=0,
+    )
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert engine.pool.checkedout() == 1
+
+        assert engine.pool.checkedout() == 0
+        assert engine.pool.wait_count == 1
+        assert engine.pool.wait_time >= 0
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_get_db_pool_status(
+    client: AsyncClient,
+    user1: models.DBUser,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/status/db-pool")
+    assert response.status_code == 401
+    response = await client.get("/status/db-pool", headers=headers)
+    assert response.status_code == 403
+
+    monkeypatch.setattr(security.settings, "ADMIN_USERNAMES", [user1.username])
+    response = await client.get("/status/db-pool", headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["pool"] == models.engine.pool.__class__.__name__
+
+
+@pytest.mark.asyncio
+async def test_migrate_adds_missing_columns_and_indexes(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'migrate.db'}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(models.SQLModel.metadata.create_all)
+            await conn.execute(text("DROP INDEX ix_users_username"))
+            await conn.execute(text("ALTER TABLE wallets DROP COLUMN sharded"))
+            await conn.execute(text("DROP TABLE wallet_shards"))
+            await conn.execute(text("DROP TRIGGER items_search_update"))
+            await conn.execute(
+                text("INSERT INTO wallets (balance, merchant_id) VALUES (10, 0)")
+            )
+
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            applied = await conn.run_sync(models.migration.upgrade_schema)
+            assert applied == [
+                "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+                "ALTER TABLE wallets ADD COLUMN sharded BOOLEAN NOT NULL DEFAULT 0",
+                "CREATE TABLE wallet_shards",
+                models.search.get_sqlite_ddl("items", True)[3][1][0],
+            ]
+            assert await conn.run_sync(models.migration.upgrade_schema) == []
+
+            result = await conn.execute(text("SELECT balance, sharded FROM wallets"))
+            assert result.all() == [(10, 0)]
+
+        # on a live Postgres database the search indexes are built concurrently
+        for _, steps in models.search.get_postgresql_ddl("items", True)[1:]:
+            assert all("CONCURRENTLY" in step for step in steps)
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_router_queries_use_indexes(
+    client: AsyncClient,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    item_user1: models.DBItem,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    cursor = pagination.encode_cursor(0)
+    transaction_cursor = pagination.encode_cursor(datetime.datetime.now(), 0)
+
+    queries = []
+
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT"):
+            queries.append((statement, parameters))
+
+    event.listen(models.engine.sync_engine, "before_cursor_execute", record_query)
+    try:
+        await client.post(
+            "/token", data={"username": user1.username, "password": "123456"}
+        )
+        for url in [
+            f"/items?after={cursor}&include_total=false",
+            f"/items/{item_user1.id}",
+            f"/merchants?after={cursor}&include_total=false",
+            f"/merchants/{merchant_user1.id}",
+            f"/merchants/{merchant_user1.id}/items",
+            f"/merchants/{merchant_user1.id}/sales",
+            f"/wallets/user/{user1.id}",
+            f"/transactions/user/{user1.id}",
+            f"/transactions/user/{user1.id}?after={transaction_cursor}",
+        ]:
+            response = await client.get(url, headers=headers)
+            assert response.status_code == 200, url
+    finally:
+        event.remove(models.engine.sync_engine, "before_cursor_execute", record_query)
+
+    assert queries
+    async with models.engine.connect() as conn:
+        for statement, parameters in queries:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            for row in result.all():
+                # "SCAN <table>" without an index is a full table scan
+                assert not re.fullmatch(r"SCAN \w+", row.detail), statement
+                assert "USE TEMP B-TREE" not in row.detail, statement
+
+
+def test_model_response_uses_declared_fields(user1: models.DBUser):
+    response = responses.ModelResponse(models.User, user1)
+
+    data = json.loads(response.body)
+    assert response.media_type == "application/json"
+    assert data["username"] == user1.username
+    assert "hashed_password" not in data
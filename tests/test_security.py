@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+from fastapi import HTTPException
+from httpx import AsyncClient
+from digital_wallet import models, provisioning, security
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_password_hash_async():
+    hashed_password = await security.get_password_hash_async("123456")
+
+    assert await security.verify_password_async("123456", hashed_password)
+    assert not await security.verify_password_async("654321", hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_password_hash_does_not_block_event_loop():
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.001)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    await asyncio.gather(
+        *[security.get_password_hash_async("123456") for _ in range(4)]
+    )
+    task.cancel()
+
+    assert ticks > 10
+
+
+@pytest.mark.asyncio
+async def test_password_queue_full(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(security, "password_jobs", 10_000)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await security.get_password_hash_async("123456")
+
+    assert exc_info.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_login(client: AsyncClient, user1: models.DBUser):
+    payload = {"username": user1.username, "password": "123456"}
+    response = await client.post("/token", data=payload)
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["access_token"]
+    assert data["user_id"] == str(user1.id)
+
+
+@pytest.mark.asyncio
+async def test_authenticated_get_skips_user_queries(
+    client: AsyncClient, user1: models.DBUser, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    security.invalidate_user(user1.id)
+
+    with models.count_queries() as cold_queries:
+        response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+
+    with models.count_queries() as warm_queries:
+        response = await client.get("/users/me", headers=headers)
+    assert response.status_code == 200
+
+    assert any("FROM users" in statement for statement in cold_queries)
+    assert len(warm_queries) == len(cold_queries) - 1
+    assert not any("FROM users" in statement for statement in warm_queries)
+
+
+@pytest.mark.asyncio
+async def test_update_user_invalidates_cached_user(
+    client: AsyncClient, user1: models.DBUser, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    await client.get("/users/me", headers=headers)
+
+    payload = {
+        "email": user1.email,
+        "telephone": user1.telephone,
+        "username": user1.username,
+        "first_name": "Changed",
+        "last_name": user1.last_name,
+    }
+    response = await client.put(
+        f"/users/{user1.id}/update", json=payload, headers=headers
+    )
+    assert response.status_code == 200
+
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.json()["first_name"] == "Changed"
+
+
+@pytest.mark.asyncio
+async def test_provision_users(
+    client: AsyncClient,
+    user1: models.DBUser,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {
+        "Authorization": f"{token_user1.token_type} {token_user1.access_token}",
+        "Content-Type": "application/x-ndjson",
+    }
+    body = "\n".join(
+        json.dumps(
+            dict(
+                username=username,
+                email=f"{username}@partner.local",
+                telephone="0812345678",
+                first_name="Partner",
+                last_name="User",
+                password=f"{username}-password",
+            )
+        )
+        for username in ["provisioned1", user1.username, "provisioned2"]
+    )
+
+    response = await client.post("/admin/users/bulk", content=body, headers=headers)
+    assert response.status_code == 403
+
+    monkeypatch.setattr(security.settings, "ADMIN_USERNAMES", [user1.username])
+    monkeypatch.setattr(provisioning.settings, "PROVISION_CHUNK_SIZE", 2)
+    response = await client.post("/admin/users/bulk", content=body, headers=headers)
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["created"] == 2
+    assert data["errors"] == [{"line": 2, "errors": ["username: already exists"]}]
+    assert data["users_per_second"] > 0
+
+    # every upload shares the app's pool
+    executor = provisioning.provision_executor
+    assert executor is not None
+    response = await client.post("/admin/users/bulk", content=body, headers=headers)
+    assert response.json()["created"] == 0
+    assert provisioning.provision_executor is executor
+    provisioning.shutdown_provision_executor()
+
+    response = await client.post(
+        "/token",
+        data={"username": "provisioned2", "password": "provisioned2-password"},
+    )
+    assert response.status_code == 200
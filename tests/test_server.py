@@ -0,0 +1,63 @@
+import json
+import os
+import subprocess
+import sys
+
+from digital_wallet import server
+import pytest
+
+
+# generous enough for a cold CI runner, tight enough to catch a heavy import
+IMPORT_BUDGET_SECONDS = 3.0
+CREATE_APP_BUDGET_SECONDS = 1.0
+
+STARTUP_SCRIPT = """
+import json, sys, time
+
+start = time.perf_counter()
+from digital_wallet import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+
+print(json.dumps(dict(
+    import_time=imported - start,
+    create_app_time=created - imported,
+    gevent="gevent" in sys.modules,
+)))
+"""
+
+
+def test_startup_time_budget():
+    # a fresh interpreter, so nothing is already imported by the test run
+    result = subprocess.run(
+        [sys.executable, "-c", STARTUP_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=os.environ | {"PYTHONPATH": os.getcwd()},
+    )
+    timings = json.loads(result.stdout)
+
+    assert not timings["gevent"]
+    assert timings["import_time"] < IMPORT_BUDGET_SECONDS
+    assert timings["create_app_time"] < CREATE_APP_BUDGET_SECONDS
+
+
+def test_serve_starts_workers(monkeypatch: pytest.MonkeyPatch):
+    calls = []
+    monkeypatch.setattr(
+        server.uvicorn, "run", lambda *args, **kwargs: calls.append((args, kwargs))
+    )
+    monkeypatch.setattr(server.os, "cpu_count", lambda: 6)
+
+    server.main(["serve", "--port", "9000"])
+    server.main(["serve", "--workers", "2", "--graceful-timeout", "5"])
+
+    [(args, kwargs), (_, explicit)] = calls
+    assert args == (server.APP,)
+    assert kwargs["factory"] is True
+    assert kwargs["port"] == 9000
+    assert kwargs["workers"] == 6
+    assert explicit["workers"] == 2
+    assert explicit["timeout_graceful_shutdown"] == 5
@@ -0,0 +1,654 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+import tracemalloc
+
+from httpx import AsyncClient
+from sqlalchemy import event, func, insert
+
+from digital_wallet import export, models, rollups, shards
+import pytest
+
+
+async def create_purchase_setup(
+    session: models.AsyncSession,
+    user: models.DBUser,
+    merchant: models.DBMerchant,
+    balance: float,
+    stock: int,
+    price: float = 100,
+) -> tuple[models.DBWallet, models.DBWallet, models.DBItem]:
+    buyer_wallet = models.DBWallet(describe="buyer", user_id=user.id, balance=balance)
+    vendor_wallet = models.DBWallet(describe="vendor", user_id=user.id, balance=0)
+    item = models.DBItem(
+        name="purchase item",
+        user_id=user.id,
+        merchant_id=merchant.id,
+        price=price,
+        stock=stock,
+    )
+
+    session.add_all([buyer_wallet, vendor_wallet, item])
+    await session.commit()
+    for row in (buyer_wallet, vendor_wallet, item):
+        await session.refresh(row)
+
+    return buyer_wallet, vendor_wallet, item
+
+
+@pytest.mark.asyncio
+async def test_create_transaction(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1000, stock=10
+    )
+
+    response = await client.post(
+        f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}",
+        json={"total_price": 0, "quantity": 2},
+        headers=headers,
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["total_price"] == 200
+    assert data["quantity"] == 2
+    assert data["item_id"] == item.id
+    assert data["user_id"] == user1.id
+
+    for row in (buyer_wallet, vendor_wallet, item):
+        await session.refresh(row)
+
+    assert buyer_wallet.balance == 800
+    assert vendor_wallet.balance == 200
+    assert item.stock == 8
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_insufficient_balance(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=50, stock=10
+    )
+
+    response = await client.post(
+        f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}",
+        json={"total_price": 0},
+        headers=headers,
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient balance"
+
+    await session.refresh(item)
+    assert item.stock == 10
+
+
+@pytest.mark.asyncio
+async def test_concurrent_purchases_do_not_oversell(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    stock = 100
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1_000_000, stock=stock, price=10
+    )
+    url = f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}"
+
+    responses = await asyncio.gather(
+        *[
+            client.post(url, json={"total_price": 0}, headers=headers)
+            for _ in range(1000)
+        ]
+    )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(200) == stock
+    assert status_codes.count(400) == 1000 - stock
+
+    for row in (buyer_wallet, vendor_wallet, item):
+        await session.refresh(row)
+
+    assert item.stock == 0
+    assert buyer_wallet.balance == 1_000_000 - stock * 10
+    assert vendor_wallet.balance == stock * 10
+
+
+@pytest.mark.asyncio
+async def test_checkout(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1000, stock=10
+    )
+    _, other_vendor_wallet, other_item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=0, stock=5, price=50
+    )
+    payload = {
+        "buyer_wallet_id": buyer_wallet.id,
+        "lines": [
+            {"item_id": item.id, "vendor_wallet_id": vendor_wallet.id, "quantity": 2},
+            {"item_id": other_item.id, "vendor_wallet_id": other_vendor_wallet.id},
+            {"item_id": item.id, "vendor_wallet_id": vendor_wallet.id, "quantity": 1},
+        ],
+    }
+
+    with models.count_queries() as statements:
+        response = await client.post(
+            "/transactions/checkout", json=payload, headers=headers
+        )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["total_price"] == 350
+    assert [t["item_id"] for t in data["transactions"]] == [
+        item.id,
+        other_item.id,
+        item.id,
+    ]
+    # constant per cart: stock, wallets, rows, ledger, rollups and sales counters
+    assert len(statements) < 14
+
+    for row in (buyer_wallet, vendor_wallet, other_vendor_wallet, item, other_item):
+        await session.refresh(row)
+
+    assert buyer_wallet.balance == 650
+    assert vendor_wallet.balance == 300
+    assert other_vendor_wallet.balance == 50
+    assert item.stock == 7
+    assert other_item.stock == 4
+
+
+@pytest.mark.asyncio
+async def test_checkout_insufficient_stock_rolls_back(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1000, stock=10
+    )
+    _, _, other_item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=0, stock=1
+    )
+    payload = {
+        "buyer_wallet_id": buyer_wallet.id,
+        "lines": [
+            {"item_id": item.id, "vendor_wallet_id": vendor_wallet.id},
+            {
+                "item_id": other_item.id,
+                "vendor_wallet_id": vendor_wallet.id,
+                "quantity": 2,
+            },
+        ],
+    }
+
+    response = await client.post(
+        "/transactions/checkout", json=payload, headers=headers
+    )
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Insufficient stock"
+
+    for row in (buyer_wallet, item, other_item):
+        await session.refresh(row)
+
+    assert buyer_wallet.balance == 1000
+    assert item.stock == 10
+    assert other_item.stock == 1
+
+
+@pytest.mark.asyncio
+async def test_purchase_credits_sharded_vendor_wallet(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    _, _, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=0, stock=100, price=10
+    )
+    response = await client.post(
+        "/wallets", json={"describe": "hot vendor", "sharded": True}, headers=headers
+    )
+    vendor_wallet_id = response.json()["id"]
+
+    buyer_wallet_ids = []
+    for _ in range(4):
+        response = await client.post(
+            "/wallets", json={"describe": "buyer", "balance": 100}, headers=headers
+        )
+        buyer_wallet_ids.append(response.json()["id"])
+
+    responses = await asyncio.gather(
+        *[
+            client.post(
+                f"/transactions/{buyer_wallet_id}/{vendor_wallet_id}/{item.id}",
+                json={"total_price": 0},
+                headers=headers,
+            )
+            for buyer_wallet_id in buyer_wallet_ids
+            for _ in range(5)
+        ]
+    )
+    assert [response.status_code for response in responses] == [200] * 20
+
+    vendor_wallet = await session.get(models.DBWallet, vendor_wallet_id)
+    await session.refresh(vendor_wallet)
+    assert vendor_wallet.balance == 0
+
+    response = await client.get(f"/wallets/{vendor_wallet_id}", headers=headers)
+    assert response.json()["balance"] == 200
+
+    # the vendor can spend credits that have not been folded yet
+    response = await client.post(
+        f"/transactions/{vendor_wallet_id}/{buyer_wallet_ids[0]}/{item.id}",
+        json={"total_price": 0, "quantity": 15},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    await session.refresh(vendor_wallet)
+    assert vendor_wallet.balance == 50
+
+    response = await client.post(
+        f"/transactions/{buyer_wallet_ids[1]}/{vendor_wallet_id}/{item.id}",
+        json={"total_price": 0},
+        headers=headers,
+    )
+    assert await shards.fold_all_shards(session) == 1
+
+    await session.refresh(vendor_wallet)
+    assert vendor_wallet.balance == 60
+    response = await client.get(f"/wallets/{vendor_wallet_id}", headers=headers)
+    assert response.json()["balance"] == 60
+
+    # an update that leaves sharded out keeps the wallet sharded
+    response = await client.put(
+        f"/wallets/{vendor_wallet_id}",
+        json={"describe": "renamed vendor", "balance": 60},
+        headers=headers,
+    )
+    assert response.json()["sharded"] is True
+    await client.post(
+        f"/transactions/{buyer_wallet_ids[2]}/{vendor_wallet_id}/{item.id}",
+        json={"total_price": 0},
+        headers=headers,
+    )
+    await session.refresh(vendor_wallet)
+    assert vendor_wallet.balance == 60
+    response = await client.get(f"/wallets/{vendor_wallet_id}", headers=headers)
+    assert response.json()["balance"] == 70
+
+
+@pytest.mark.asyncio
+async def test_concurrent_folds_credit_once(
+    client: AsyncClient, session: models.AsyncSession, token_user1: models.Token
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post(
+        "/wallets", json={"describe": "folded vendor", "sharded": True}, headers=headers
+    )
+    wallet_id = response.json()["id"]
+    for payer_wallet_id in range(1, 9):
+        assert await shards.credit_shard(session, wallet_id, 10, payer_wallet_id)
+    await session.commit()
+
+    # the background loop and a purchase folding the same wallet together
+    async def fold() -> float:
+        async with models.session_factory() as worker_session:
+            total = await shards.fold_shards(worker_session, wallet_id)
+            await worker_session.commit()
+            return total
+
+    assert sorted(await asyncio.gather(fold(), fold())) == [0, 80]
+
+    wallet = await session.get(models.DBWallet, wallet_id)
+    await session.refresh(wallet)
+    assert wallet.balance == 80
+    result = await session.exec(
+        models.select(models.DBWalletShard.balance).where(
+            models.DBWalletShard.wallet_id == wallet_id
+        )
+    )
+    assert set(result.all()) == {0}
+
+
+@pytest.mark.asyncio
+async def test_export_transactions(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1000, stock=10
+    )
+    for _ in range(2):
+        await client.post(
+            f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}",
+            json={"total_price": 0},
+            headers=headers,
+        )
+    result = await session.exec(
+        models.select(models.DBTransaction.id).where(
+            models.DBTransaction.user_id == user1.id
+        )
+    )
+    transaction_ids = sorted(result.all())
+
+    url = f"/transactions/user/{user1.id}/export"
+    response = await client.get(url, headers=headers)
+    rows = [json.loads(line) for line in response.text.splitlines()]
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert sorted(row["id"] for row in rows) == transaction_ids
+    assert "transaction_date" in rows[0]
+
+    response = await client.get(url, params={"format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert sorted(int(row["id"]) for row in rows) == transaction_ids
+
+    response = await client.get(
+        f"/transactions/user/{user1.id + 1}/export", headers=headers
+    )
+    assert response.status_code == 403
+
+
+async def measure_export_peak(user_id: int) -> int:
+    tracemalloc.start()
+    try:
+        async for _ in export.stream_transactions(user_id, "ndjson", batch_size=200):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.asyncio
+async def test_export_memory_stays_flat(
+    client: AsyncClient, session: models.AsyncSession
+):
+    user = models.DBUser(
+        username="exporter",
+        hashed_password="-",
+        email="exporter@test.com",
+        telephone="0812345678",
+        first_name="Export",
+        last_name="User",
+    )
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+
+    async def add_rows(count: int):
+        now = datetime.datetime.now()
+        for _ in range(0, count, 1_000):
+            await session.execute(
+                insert(models.DBTransaction),
+                [
+                    dict(user_id=user.id, total_price=1.5, transaction_date=now)
+                    for _ in range(1_000)
+                ],
+            )
+        await session.commit()
+
+    await add_rows(2_000)
+    small = await measure_export_peak(user.id)
+    await add_rows(18_000)
+    large = await measure_export_peak(user.id)
+
+    # ten times the rows, about the same high-water mark
+    assert large < small * 1.5
+
+
+@pytest.mark.asyncio
+async def test_filter_transactions(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    item_user1: models.DBItem,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    start = datetime.datetime(2001, 1, 1)
+    await session.execute(
+        insert(models.DBTransaction),
+        [
+            dict(
+                user_id=user1.id,
+                merchant_id=merchant_user1.id if day % 2 else None,
+                item_id=item_user1.id if day % 3 == 0 else None,
+                total_price=day * 10,
+                transaction_date=start + datetime.timedelta(days=day),
+            )
+            for day in range(10)
+        ],
+    )
+    await session.commit()
+
+    async def get_days(**params) -> list[int]:
+        params = {"from": "2001-01-01", "to": "2001-01-11", **params}
+        response = await client.get(
+            f"/transactions/user/{user1.id}", params=params, headers=headers
+        )
+        assert response.status_code == 200
+        return [row["total_price"] // 10 for row in response.json()["transactions"]]
+
+    assert await get_days() == list(range(9, -1, -1))
+    assert await get_days(to="2001-01-04") == [2, 1, 0]
+    assert await get_days(**{"from": "2001-01-08"}) == [9, 8, 7]
+    assert await get_days(merchant_id=merchant_user1.id) == [9, 7, 5, 3, 1]
+    assert await get_days(item_id=item_user1.id) == [9, 6, 3, 0]
+    assert await get_days(min_total=75, merchant_id=merchant_user1.id) == [9]
+
+    data = (
+        await client.get(
+            f"/transactions/user/{user1.id}",
+            params={"from": "2001-01-01", "to": "2001-01-11", "limit": 4},
+            headers=headers,
+        )
+    ).json()
+    assert data["page_count"] == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "filters, index",
+    [
+        ("", "ix_transactions_user_id_transaction_date"),
+        ("&from=2001-01-01&to=2002-01-01", "ix_transactions_user_id_transaction_date"),
+        ("&min_total=10", "ix_transactions_user_id_transaction_date"),
+        ("&merchant_id=1", "ix_transactions_user_id_merchant_id_transaction_date"),
+        (
+            "&item_id=1&from=2001-01-01",
+            "ix_transactions_user_id_item_id_transaction_date",
+        ),
+    ],
+)
+async def test_filter_transactions_query_plan(
+    client: AsyncClient,
+    user1: models.DBUser,
+    token_user1: models.Token,
+    filters: str,
+    index: str,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    queries = []
+
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        if "FROM transactions" in statement:
+            queries.append((statement, parameters))
+
+    event.listen(models.engine.sync_engine, "before_cursor_execute", record_query)
+    try:
+        response = await client.get(
+            f"/transactions/user/{user1.id}?include_total=false{filters}",
+            headers=headers,
+        )
+    finally:
+        event.remove(models.engine.sync_engine, "before_cursor_execute", record_query)
+    assert response.status_code == 200
+
+    [(statement, parameters)] = queries
+    async with models.engine.connect() as conn:
+        result = await conn.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        plan = [row.detail for row in result.all()]
+
+    # the index answers both the filter and the order: no sort step
+    assert any(f"USING INDEX {index}" in detail for detail in plan), plan
+    assert not any("TEMP B-TREE" in detail for detail in plan), plan
+
+
+@pytest.mark.asyncio
+async def test_spending_rollups(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    merchant_user1: models.DBMerchant,
+    token_user1: models.Token,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant_user1, balance=1000, stock=10, price=25
+    )
+    today = datetime.date.today()
+    params = {"from": today.isoformat(), "merchant_id": merchant_user1.id}
+
+    async def get_spending(granularity: str) -> list[dict]:
+        response = await client.get(
+            "/users/me/spending",
+            params=dict(params, granularity=granularity),
+            headers=headers,
+        )
+        assert response.status_code == 200
+        return response.json()["buckets"]
+
+    before = await get_spending("day")
+    spent = before[0]["total_price"] if before else 0
+    count = before[0]["count"] if before else 0
+
+    transaction_ids = []
+    for quantity in (1, 2, 3):
+        response = await client.post(
+            f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}",
+            json={"total_price": 0, "quantity": quantity},
+            headers=headers,
+        )
+        transaction_ids.append(response.json()["id"])
+    await client.delete(f"/transactions/{transaction_ids[1]}", headers=headers)
+
+    [bucket] = await get_spending("day")
+    assert bucket["period"] == today.isoformat()
+    assert bucket["merchant_id"] == merchant_user1.id
+    assert bucket["count"] == count + 2
+    assert bucket["total_price"] == spent + 100
+
+    [month] = await get_spending("month")
+    assert month["period"] == today.replace(day=1).isoformat()
+    assert month["count"] == bucket["count"]
+
+    # a rebuild from the raw transactions lands on the same totals
+    await rollups.rebuild(batch_size=500)
+    assert await get_spending("day") == [bucket]
+
+    # one range per user with batch_size=1; readers keep the complete old
+    # totals while a range is being rebuilt
+    totals = await rollups.get_spending(session, user1.id, "day")
+    add_spending = rollups.add_spending
+    seen = []
+
+    async def add_and_read(rebuild_session, transactions):
+        await add_spending(rebuild_session, transactions)
+        async with models.session_factory() as reader:
+            seen.append(await rollups.get_spending(reader, user1.id, "day"))
+
+    monkeypatch.setattr(rollups, "add_spending", add_and_read)
+    result = await session.exec(
+        models.select(func.count(func.distinct(models.DBTransaction.user_id)))
+    )
+    users = result.one()
+    await rollups.rebuild(batch_size=1)
+    # plus the open-ended range after the last user
+    assert len(seen) == users + 1
+    assert all(buckets == totals for buckets in seen)
+
+
+@pytest.mark.asyncio
+async def test_spending_rollups_outlive_merchant(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    user1: models.DBUser,
+    token_user1: models.Token,
+):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.post("/merchants", json={}, headers=headers)
+    merchant_id = response.json()["id"]
+    merchant = await session.get(models.DBMerchant, merchant_id)
+    buyer_wallet, vendor_wallet, item = await create_purchase_setup(
+        session, user1, merchant, balance=100, stock=10, price=5
+    )
+
+    transaction_ids = []
+    for _ in range(3):
+        response = await client.post(
+            f"/transactions/{buyer_wallet.id}/{vendor_wallet.id}/{item.id}",
+            json={"total_price": 0},
+            headers=headers,
+        )
+        transaction_ids.append(response.json()["id"])
+
+    # the transactions lose their merchant_id, the rollups keep their bucket
+    response = await client.delete(f"/merchants/{merchant_id}", headers=headers)
+    assert response.status_code == 200
+    await client.delete(f"/transactions/{transaction_ids[0]}", headers=headers)
+
+    async def get_bucket() -> tuple:
+        [bucket] = await rollups.get_spending(
+            session, user1.id, "day", merchant_id=merchant_id
+        )
+        return bucket["count"], bucket["total_price"]
+
+    assert await get_bucket() == (2, 10)
+    await rollups.rebuild()
+    assert await get_bucket() == (2, 10)